@@ -1,18 +1,52 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
-import sys
 import json
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, make_response, session
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect
 from forms import *
 from flask_migrate import Migrate
-from datetime import date
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import date, timedelta
+from assets import Assets
+from images import Images
+from compression import Compress
+from profiler import Profiler
+from metrics import Metrics
+from streaming import stream_template
+from normalize import name_key, address_key, search_term, like_pattern
+from changes import ChangeFeed
+from matchmaking import Matchmaker
+from jobs import JobQueue
+from widgets import HomeWidgets
+from partitions import Partitions
+from database import Database, StringList
+from backfill import Backfills
+from ical import Calendars
+from sse import LiveUpdates, requested_topics
+from logs import configure_logging
+from ratelimit import Limiter
+from cache import EntityCache, SearchCache
+from tickets import NOT_FOUND, NOT_ON_SALE, STARTED, reserve, unavailable
+from recurrence import (
+    cancel_series,
+    conflicts,
+    expand,
+    insert_series,
+    new_series_id,
+    update_series,
+)
+from viewmodels import (
+    ArtistProfile,
+    ArtistShow,
+    FeedShow,
+    Listing,
+    ShowSummary,
+    VenueProfile,
+    VenueShow,
+)
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -21,11 +55,18 @@ from datetime import date
 app = Flask(__name__)
 app.config.from_object("config")
 csrf = CSRFProtect(app)
+configure_logging(app)
+limiter = Limiter(app)
+assets = Assets(app)
+images = Images(app)
+Compress(app)
+Profiler(app)
+metrics = Metrics(app)
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
-db = SQLAlchemy(app)
+db = Database(app)
 migrate = Migrate(app, db)
 
 class Venue(db.Model):
@@ -42,7 +83,24 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(StringList)
+    # Default ticket inventory of shows at this venue.
+    capacity = db.Column(db.Integer)
+    # Normalized copies of name/address used for duplicate detection.
+    name_key = db.Column(db.String(120))
+    address_key = db.Column(db.String(120))
+    # Bumped by every ORM UPDATE, which also checks it is unchanged.
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    created_at = db.Column(
+        db.DateTime(), nullable=False, default=datetime.now, server_default=db.func.now()
+    )
+
+    __table_args__ = (
+        db.Index("ix_Venue_name_key_address_key", "name_key", "address_key"),
+        db.Index("ix_Venue_phone", "phone"),
+        db.Index("ix_Venue_created_at", "created_at"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Artist(db.Model):
@@ -58,21 +116,143 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(StringList)
+    name_key = db.Column(db.String(120))
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    created_at = db.Column(
+        db.DateTime(), nullable=False, default=datetime.now, server_default=db.func.now()
+    )
+
+    __table_args__ = (
+        db.Index("ix_Artist_name_key_city_state", "name_key", "city", "state"),
+        db.Index("ix_Artist_phone", "phone"),
+        db.Index("ix_Artist_created_at", "created_at"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Show(db.Model):
     __tablename__ = "Show"
 
+    # On Postgres the table is partitioned by month of start_time (see
+    # partitions.py), which makes the table's primary key (id, start_time).
+    # Ids still come from a single sequence, so the ORM keys on id alone.
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
-    start_time = db.Column(db.DateTime())
+    start_time = db.Column(db.DateTime(), nullable=False)
+    # NULL when tickets aren't sold through Fyyur. tickets_remaining is only
+    # changed by tickets.reserve(), never read-modify-written.
+    tickets_total = db.Column(db.Integer)
+    tickets_remaining = db.Column(db.Integer)
+    # Shared by the shows of a recurring series (see recurrence.py).
+    series_id = db.Column(db.String(32), index=True)
     venue = db.relationship("Venue", backref=db.backref("shows", cascade="all, delete"))
     artist = db.relationship(
         "Artist", backref=db.backref("shows", cascade="all, delete")
     )
 
+    __table_args__ = (
+        db.Index("ix_Show_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_Show_artist_id_start_time", "artist_id", "start_time"),
+        db.CheckConstraint(
+            "tickets_remaining >= 0", name="ck_Show_tickets_remaining"
+        ),
+    )
+
+
+class ShowArchive(db.Model):
+    """Past shows moved out of Show by `flask partitions archive`."""
+
+    __tablename__ = "Show_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    venue_id = db.Column(
+        db.Integer, db.ForeignKey("Venue.id", ondelete="CASCADE"), nullable=False
+    )
+    artist_id = db.Column(
+        db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), nullable=False
+    )
+    start_time = db.Column(db.DateTime(), nullable=False)
+    tickets_total = db.Column(db.Integer)
+    tickets_remaining = db.Column(db.Integer)
+    series_id = db.Column(db.String(32))
+
+    __table_args__ = (
+        db.Index("ix_Show_archive_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_Show_archive_artist_id_start_time", "artist_id", "start_time"),
+    )
+
+
+class Job(db.Model):
+    __tablename__ = "Job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime(), nullable=False)
+    locked_at = db.Column(db.DateTime())
+    locked_by = db.Column(db.String(120))
+    finished_at = db.Column(db.DateTime())
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (db.Index("ix_Job_status_run_at", "status", "run_at"),)
+
+
+class Booking(db.Model):
+    __tablename__ = "Booking"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: on Postgres, Show's key is (id, start_time) and its
+    # rows move between partitions and the archive.
+    show_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    created_at = db.Column(db.DateTime(), nullable=False, default=datetime.now)
+
+
+class Backfill(db.Model):
+    # Data backfills scheduled by migrations, see backfill.py.
+    __tablename__ = "Backfill"
+
+    name = db.Column(db.String(120), primary_key=True)
+    table_name = db.Column(db.String(120), nullable=False)
+    key_column = db.Column(db.String(120), nullable=False, default="id")
+    set_sql = db.Column(db.Text, nullable=False)
+    where_sql = db.Column(db.Text)
+    last_key = db.Column(db.BigInteger)
+    rows_done = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    created_at = db.Column(db.DateTime(), nullable=False)
+    updated_at = db.Column(db.DateTime(), nullable=False)
+    finished_at = db.Column(db.DateTime())
+
+
+changes = ChangeFeed(db)
+entities = EntityCache(app, db, changes)
+searches = SearchCache(app, changes)
+matchmaker = Matchmaker(db, Venue, Artist, Show)
+matchmaker.init_app(app, changes)
+widgets = HomeWidgets(db, Venue, Artist, Show)
+widgets.init_app(app, changes)
+calendars = Calendars(app)
+live = LiveUpdates(app, changes)
+jobs = JobQueue(app, db, Job)
+Partitions(app, db)
+Backfills(app, db)
+metrics.track_caches(
+    lambda: [
+        ("entities", entities.cache),
+        ("ical_feeds", calendars.feeds),
+        ("ical_events", calendars.events),
+    ]
+    + [(f"search_{table.lower()}", cache) for table, cache in searches.caches.items()]
+)
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -80,114 +260,154 @@ class Show(db.Model):
 
 @app.route("/")
 def index():
-    return render_template("pages/home.html")
+    return render_template(
+        "pages/home.html",
+        recent_venues=widgets.recently_listed("Venue"),
+        recent_artists=widgets.recently_listed("Artist"),
+        trending_venues=widgets.trending_venues(),
+    )
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 
+def listing_query(model, show_fk):
+    """Query for (id, name, number of upcoming shows) of venues or artists."""
+    upcoming = db.and_(show_fk == model.id, Show.start_time > datetime.now())
+    return (
+        model.query.outerjoin(Show, upcoming)
+        .with_entities(model.id, model.name, db.func.count(Show.id))
+        .group_by(model.id, model.name)
+    )
+
+
 @app.route("/venues")
 def venues():
     form = SearchForm()
 
     venues = (
-        Venue.query.with_entities(Venue.id, Venue.name, Venue.state, Venue.city)
+        listing_query(Venue, Show.venue_id)
+        .add_columns(Venue.state, Venue.city)
+        .group_by(Venue.state, Venue.city)
         .order_by(Venue.city, Venue.state)
-        .all()
     )
 
-    data = []
-    previous_location = None
-    i = -1
-
-    for venue in venues:
-        current_location = f"{venue.city}, {venue.state}"
-
-        if previous_location != current_location:
-            # Designing "container" object for the grouping of venues by location
-            data.append({"city": venue.city, "state": venue.state, "venues": []})
-
-            i += 1
-            previous_location = current_location
-
-        # Adding venue to "grouped-by-location" object container
-        data[i]["venues"].append(
-            {
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": Show.query.filter(
-                    db.and_(Show.venue_id == venue.id, Show.start_time > datetime.now())
-                ).count(),
-            }
-        )
+    def areas():
+        # Venues grouped by location, as the page streams.
+        area = location = None
+        for venue in venues:
+            if location != (venue.city, venue.state):
+                if area is not None:
+                    yield area
+                location = (venue.city, venue.state)
+                area = {"city": venue.city, "state": venue.state, "venues": []}
+            area["venues"].append(Listing._make(venue[:3]))
+        if area is not None:
+            yield area
 
-    return render_template("pages/venues.html", areas=data, form=form)
+    # A generator, so the query runs after the page's <head> has been sent.
+    return stream_template("pages/venues.html", areas=areas(), form=form)
 
 
-@app.route("/venues/search", methods=["POST"])
-def search_venues():
-    form = SearchForm()
-    search_term = request.form.get("search_term")
+def search_page(model, show_fk, template):
+    """Name search of venues or artists at a cacheable GET URL.
 
-    venues = (
-        Venue.query.with_entities(Venue.id, Venue.name)
-        .filter(Venue.name.ilike(f"%{search_term}%"))
-        .all()
+    The term is normalized and a non-canonical URL redirects to the canonical
+    one; POSTs from old forms are redirected to it as well.
+    """
+    if request.method == "POST":
+        term = search_term(request.form.get("search_term"))
+        return redirect(url_for(request.endpoint, search_term=term), 303)
+
+    raw = request.args.get("search_term", "")
+    term = search_term(raw)
+    if raw != term:
+        return redirect(url_for(request.endpoint, search_term=term), 301)
+
+    results = searches.get_or_load(
+        model,
+        term,
+        lambda: tuple(
+            Listing._make(row)
+            for row in listing_query(model, show_fk).filter(
+                model.name.ilike(like_pattern(term), escape="\\")
+            )
+        ),
     )
 
-    data = {
-        "count": len(venues),
-        "data": [
-            {
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": Show.query.filter(
-                    db.and_(Show.venue_id == venue.id, Show.start_time > datetime.now())
-                ).count(),
-            }
-            for venue in venues
-        ],
-    }
+    response = make_response(
+        render_template(
+            template,
+            results={"count": len(results), "data": results},
+            search_term=term,
+            form=SearchForm(),
+        )
+    )
+    # Pages that consumed flashed messages are per-user.
+    if not session.modified:
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config["SEARCH_MAX_AGE"]
+    return response
 
-    return render_template(
-        "pages/search_venues.html",
-        results=data,
-        search_term=request.form.get("search_term", ""),
-        form=form,
+
+@app.route("/venues/search", methods=["GET", "POST"])
+@csrf.exempt
+@limiter.limit("30/minute")
+@limiter.shed()
+def search_venues():
+    return search_page(Venue, Show.venue_id, "pages/search_venues.html")
+
+
+def profile_queries(key, id, other, now):
+    """Queries for the past and upcoming shows of one venue or artist.
+
+    Upcoming shows only touch the current and future Show partitions; past
+    shows also include archived ones.
+    """
+    other_key = "artist_id" if key == "venue_id" else "venue_id"
+
+    def query(model):
+        return (
+            model.query.join(other, other.id == getattr(model, other_key))
+            .with_entities(
+                getattr(model, other_key), other.name, other.image_link, model.start_time
+            )
+            .filter(getattr(model, key) == id)
+        )
+
+    past = (
+        query(Show)
+        .filter(Show.start_time <= now)
+        .union_all(query(ShowArchive))
+        .order_by(Show.start_time)
     )
+    upcoming = query(Show).filter(Show.start_time > now).order_by(Show.start_time)
+    return past, upcoming
+
+
+def profile_shows(key, id, other):
+    """Past and upcoming shows of one venue (key="venue_id") or artist.
+
+    Rows are (other's id, name, image link, start time), oldest first.
+    """
+    past, upcoming = profile_queries(key, id, other, datetime.now())
+    return past.all(), upcoming.all()
 
 
 @app.route("/venues/<int:venue_id>")
 def show_venue(venue_id):
     form = SearchForm()
 
-    venue = Venue.query.get(venue_id)
-
-    if venue:
-        past_shows = []
-        upcoming_shows = []
-
-        for show in venue.shows:
-            artist = {
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": show.start_time,
-            }
-
-            if show.start_time < datetime.now():
-                past_shows.append(artist)
-            else:
-                upcoming_shows.append(artist)
+    values = entities.values(Venue, venue_id)
 
-        data = {
-            **venue.__dict__,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
+    if values:
+        past, upcoming = profile_shows("venue_id", venue_id, Artist)
+        data = VenueProfile.build(
+            values,
+            tuple(map(ArtistShow._make, past)),
+            tuple(map(ArtistShow._make, upcoming)),
+        )
 
         return render_template("pages/show_venue.html", venue=data, form=form)
 
@@ -198,6 +418,44 @@ def show_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
+def find_duplicate_venue(form, exclude_id=None):
+    """Return (id, name) of a listed venue that looks like the submitted one."""
+    query = Venue.query.with_entities(Venue.id, Venue.name).filter(
+        db.or_(
+            db.and_(
+                Venue.name_key == name_key(form.name.data),
+                Venue.address_key == address_key(form.address.data),
+            ),
+            Venue.phone == form.phone.data,
+        )
+    )
+
+    if exclude_id is not None:
+        query = query.filter(Venue.id != exclude_id)
+
+    return query.first()
+
+
+def venue_values(form):
+    """Column values for a Venue from a validated VenueForm."""
+    return {
+        "name": form.name.data,
+        "name_key": name_key(form.name.data),
+        "city": form.city.data,
+        "state": form.state.data,
+        "address": form.address.data,
+        "address_key": address_key(form.address.data),
+        "phone": form.phone.data,
+        "image_link": form.image_link.data,
+        "facebook_link": form.facebook_link.data,
+        "website": form.website.data,
+        "seeking_talent": form.seeking_talent.data,
+        "seeking_description": form.seeking_description.data,
+        "genres": form.genres.data,
+        "capacity": form.capacity.data,
+    }
+
+
 @app.route("/venues/create", methods=["GET"])
 def create_venue_form():
     form = VenueForm()
@@ -205,24 +463,21 @@ def create_venue_form():
 
 
 @app.route("/venues/create", methods=["POST"])
+@limiter.limit("10/minute")
+@limiter.shed()
 def create_venue_submission():
     form = VenueForm()
 
     if form.validate():
-        try:
-            venue = Venue(
-                name=request.form.get("name"),
-                city=request.form.get("city"),
-                state=request.form.get("state"),
-                address=request.form.get("address"),
-                phone=request.form.get("phone"),
-                image_link=request.form.get("image_link"),
-                facebook_link=request.form.get("facebook_link"),
-                website=request.form.get("website"),
-                seeking_talent=True if request.form.get("seeking_talent") else False,
-                seeking_description=request.form.get("seeking_description"),
-                genres=request.form.getlist("genres"),
+        duplicate = find_duplicate_venue(form)
+
+        if duplicate and not request.form.get("allow_duplicate"):
+            return render_template(
+                "forms/new_venue.html", form=form, duplicate=duplicate
             )
+
+        try:
+            venue = Venue(**venue_values(form))
             db.session.add(venue)
             db.session.commit()
 
@@ -230,7 +485,7 @@ def create_venue_submission():
             flash(f"Venue {venue_name} was successfully listed!")
         except:
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception("Could not create venue")
 
             venue_name = request.form.get("name")
             flash(f"An error occurred. Venue {venue_name} could not be listed.")
@@ -242,17 +497,34 @@ def create_venue_submission():
     return render_template("forms/new_venue.html", form=form)
 
 
+@jobs.task()
+def delete_venue_job(venue_id):
+    venue = Venue.query.get(venue_id)
+
+    if venue:
+        db.session.delete(venue)
+        db.session.commit()
+
+
 @app.route("/venues/<venue_id>", methods=["DELETE"])
 def delete_venue(venue_id):
+    # Deleting cascades to every show of the venue, so it runs in the worker.
+    venue = Venue.query.with_entities(Venue.id, Venue.name).filter(
+        Venue.id == venue_id
+    ).one_or_none()
+
+    if venue is None:
+        flash("An error occurred. Venue could not be found.")
+        return redirect(url_for("index"))
+
     try:
-        venue = db.session.query(Venue).filter(Venue.id == venue_id).first()
-        db.session.delete(venue)
+        jobs.enqueue("delete_venue_job", {"venue_id": venue.id})
         db.session.commit()
 
-        flash(f"Venue {venue.name} was successfully deleted.")
+        flash(f"Venue {venue.name} is scheduled for deletion.")
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception("Could not schedule deletion of venue %s", venue.id)
         flash(f"An error occurred. Venue {venue.name} could not be deleted.")
     finally:
         db.session.close()
@@ -260,206 +532,242 @@ def delete_venue(venue_id):
     return redirect(url_for("index"))
 
 
+@app.route("/venues/<int:venue_id>/recommendations")
+def venue_recommendations(venue_id):
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    artists = matchmaker.artists_for_venue(venue_id, limit)
+
+    if artists is None:
+        return jsonify({"error": "Venue not found"}), 404
+
+    return jsonify({"venue_id": venue_id, "artists": artists})
+
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route("/artists")
 def artists():
     form = SearchForm()
-    data = Artist.query.with_entities(Artist.id, Artist.name).all()
+    # A query, so it runs after the page's <head> has been sent.
+    artists = Artist.query.with_entities(Artist.id, Artist.name)
 
-    return render_template("pages/artists.html", artists=data, form=form)
+    return stream_template("pages/artists.html", artists=artists, form=form)
 
 
-@app.route("/artists/search", methods=["POST"])
+@app.route("/artists/search", methods=["GET", "POST"])
+@csrf.exempt
+@limiter.limit("30/minute")
+@limiter.shed()
 def search_artists():
-    form = SearchForm()
-    search_term = request.form.get("search_term")
-
-    artists = (
-        Artist.query.with_entities(Artist.id, Artist.name)
-        .filter(Artist.name.ilike(f"%{search_term}%"))
-        .all()
-    )
-
-    data = {
-        "count": len(artists),
-        "data": [
-            {
-                "id": artist.id,
-                "name": artist.name,
-                "num_upcoming_shows": Show.query.filter(
-                    db.and_(
-                        Show.artist_id == artist.id, Show.start_time > datetime.now()
-                    )
-                ).count(),
-            }
-            for artist in artists
-        ],
-    }
-
-    return render_template(
-        "pages/search_artists.html",
-        results=data,
-        search_term=request.form.get("search_term", ""),
-        form=form,
-    )
+    return search_page(Artist, Show.artist_id, "pages/search_artists.html")
 
 
 @app.route("/artists/<int:artist_id>")
 def show_artist(artist_id):
     form = SearchForm()
 
-    artist = Artist.query.get(artist_id)
-
-    if artist:
-        past_shows = []
-        upcoming_shows = []
-
-        for show in artist.shows:
-            venue = {
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "venue_image_link": show.venue.image_link,
-                "start_time": show.start_time,
-            }
-
-            if show.start_time < datetime.now():
-                past_shows.append(venue)
-            else:
-                upcoming_shows.append(venue)
+    values = entities.values(Artist, artist_id)
 
-        data = {
-            **artist.__dict__,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
+    if values:
+        past, upcoming = profile_shows("artist_id", artist_id, Venue)
+        data = ArtistProfile.build(
+            values,
+            tuple(map(VenueShow._make, past)),
+            tuple(map(VenueShow._make, upcoming)),
+        )
 
         return render_template("pages/show_artist.html", artist=data, form=form)
 
     return render_template("errors/404.html", form=form)
 
 
+@app.route("/artists/<int:artist_id>/recommendations")
+def artist_recommendations(artist_id):
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    venues = matchmaker.venues_for_artist(artist_id, limit)
+
+    if venues is None:
+        return jsonify({"error": "Artist not found"}), 404
+
+    return jsonify({"artist_id": artist_id, "venues": venues})
+
+
 #  Update
 #  ----------------------------------------------------------------
+
+
+def apply_changes(obj, values):
+    """Set the attributes of `obj` that differ from `values`.
+
+    Returns the names of the changed attributes; the ORM only writes those
+    columns (and the version) on flush. Empty strings and None are treated
+    as the same value.
+    """
+    changed = [
+        key
+        for key, value in values.items()
+        if (getattr(obj, key) or None) != (value or None)
+    ]
+    for key in changed:
+        setattr(obj, key, values[key])
+    return changed
+
+
+def edit_conflict(template, form, name, row):
+    """Re-render an edit form whose row was saved by someone else meanwhile."""
+    form.version.data = row.version
+    flash(
+        "This listing was changed while you were editing it. Check the "
+        "current listing and submit again to overwrite it."
+    )
+    return render_template(template, form=form, **{name: row}), 409
+
+
 @app.route("/artists/<int:artist_id>/edit", methods=["GET"])
+@db.primary
 def edit_artist(artist_id):
-    form = ArtistForm()
-    artist = (
-        Artist.query.with_entities(Artist.name, Artist.id)
-        .filter(Artist.id == artist_id)
-        .one_or_none()
-    )
+    artist = entities.get(Artist, artist_id)
 
     if artist:
+        form = ArtistForm(obj=artist)
         return render_template("forms/edit_artist.html", form=form, artist=artist)
 
-    return render_template("errors/404.html", form=form)
+    return render_template("errors/404.html", form=ArtistForm())
 
 
 @app.route("/artists/<int:artist_id>/edit", methods=["POST"])
 def edit_artist_submission(artist_id):
     form = ArtistForm()
+    artist = Artist.query.get(artist_id)
+
+    if artist is None:
+        return render_template("errors/404.html", form=form), 404
+
+    valid = form.validate()
+    duplicate = find_duplicate_artist(form, exclude_id=artist_id) if valid else None
+
+    if valid and (not duplicate or request.form.get("allow_duplicate")):
+        if form.version.data != str(artist.version):
+            return edit_conflict("forms/edit_artist.html", form, "artist", artist)
+
+        if not apply_changes(artist, artist_values(form)):
+            flash("No changes to save.")
+            return redirect(url_for("show_artist", artist_id=artist_id))
 
-    if form.validate():
         try:
-            db.session.query(Artist).filter(Artist.id == artist_id).update(
-                {
-                    "name": request.form.get("name"),
-                    "city": request.form.get("city"),
-                    "state": request.form.get("state"),
-                    "phone": request.form.get("phone"),
-                    "image_link": request.form.get("image_link"),
-                    "facebook_link": request.form.get("facebook_link"),
-                    "website": request.form.get("website"),
-                    "seeking_venue": True
-                    if request.form.get("seeking_venue")
-                    else False,
-                    "seeking_description": request.form.get("seeking_description"),
-                    "genres": request.form.getlist("genres"),
-                }
-            )
             db.session.commit()
             flash(f"Artist was successfully edited!")
+        except StaleDataError:
+            # Saved by another request between our SELECT and UPDATE.
+            db.session.rollback()
+            return edit_conflict("forms/edit_artist.html", form, "artist", artist)
         except:
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception("Could not edit artist %s", artist_id)
             flash(f"An error occurred. Artist could not be edited.")
         finally:
             db.session.close()
 
         return redirect(url_for("show_artist", artist_id=artist_id))
 
-    artist = (
-        Artist.query.with_entities(Artist.name, Artist.id)
-        .filter(Artist.id == artist_id)
-        .one_or_none()
+    return render_template(
+        "forms/edit_artist.html", form=form, artist=artist, duplicate=duplicate
     )
 
-    return render_template("forms/edit_artist.html", form=form, artist=artist)
-
 
 @app.route("/venues/<int:venue_id>/edit", methods=["GET"])
+@db.primary
 def edit_venue(venue_id):
-    form = VenueForm()
-    venue = (
-        Venue.query.with_entities(Venue.name, Venue.id)
-        .filter(Venue.id == venue_id)
-        .one_or_none()
-    )
+    venue = entities.get(Venue, venue_id)
 
     if venue:
+        form = VenueForm(obj=venue)
         return render_template("forms/edit_venue.html", form=form, venue=venue)
 
-    return render_template("errors/404.html", form=form)
+    return render_template("errors/404.html", form=VenueForm())
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["POST"])
 def edit_venue_submission(venue_id):
     form = VenueForm()
+    venue = Venue.query.get(venue_id)
+
+    if venue is None:
+        return render_template("errors/404.html", form=form), 404
+
+    valid = form.validate()
+    duplicate = find_duplicate_venue(form, exclude_id=venue_id) if valid else None
+
+    if valid and (not duplicate or request.form.get("allow_duplicate")):
+        # The form carries the version it was rendered from; an older one
+        # means someone else saved in between and we would undo their edit.
+        if form.version.data != str(venue.version):
+            return edit_conflict("forms/edit_venue.html", form, "venue", venue)
+
+        if not apply_changes(venue, venue_values(form)):
+            flash("No changes to save.")
+            return redirect(url_for("show_venue", venue_id=venue_id))
 
-    if form.validate():
         try:
-            db.session.query(Venue).filter(Venue.id == venue_id).update(
-                {
-                    "name": request.form.get("name"),
-                    "city": request.form.get("city"),
-                    "state": request.form.get("state"),
-                    "address": request.form.get("address"),
-                    "phone": request.form.get("phone"),
-                    "image_link": request.form.get("image_link"),
-                    "facebook_link": request.form.get("facebook_link"),
-                    "website": request.form.get("website"),
-                    "seeking_talent": request.form.get("seeking_talent", False),
-                    "seeking_description": request.form.get("seeking_description"),
-                    "genres": request.form.getlist("genres"),
-                }
-            )
             db.session.commit()
             flash(f"Venue was successfully edited!")
+        except StaleDataError:
+            db.session.rollback()
+            return edit_conflict("forms/edit_venue.html", form, "venue", venue)
         except:
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception("Could not edit venue %s", venue_id)
             flash(f"An error occurred. Venue could not be edited.")
         finally:
             db.session.close()
 
         return redirect(url_for("show_venue", venue_id=venue_id))
 
-    venue = (
-        Venue.query.with_entities(Venue.name, Venue.id)
-        .filter(Venue.id == venue_id)
-        .one_or_none()
+    return render_template(
+        "forms/edit_venue.html", form=form, venue=venue, duplicate=duplicate
     )
 
-    return render_template("forms/edit_venue.html", form=form, venue=venue)
-
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
+def find_duplicate_artist(form, exclude_id=None):
+    """Return (id, name) of a listed artist that looks like the submitted one."""
+    query = Artist.query.with_entities(Artist.id, Artist.name).filter(
+        db.or_(
+            db.and_(
+                Artist.name_key == name_key(form.name.data),
+                Artist.city == form.city.data,
+                Artist.state == form.state.data,
+            ),
+            Artist.phone == form.phone.data,
+        )
+    )
+
+    if exclude_id is not None:
+        query = query.filter(Artist.id != exclude_id)
+
+    return query.first()
+
+
+def artist_values(form):
+    """Column values for an Artist from a validated ArtistForm."""
+    return {
+        "name": form.name.data,
+        "name_key": name_key(form.name.data),
+        "city": form.city.data,
+        "state": form.state.data,
+        "phone": form.phone.data,
+        "image_link": form.image_link.data,
+        "facebook_link": form.facebook_link.data,
+        "website": form.website.data,
+        "seeking_venue": form.seeking_venue.data,
+        "seeking_description": form.seeking_description.data,
+        "genres": form.genres.data,
+    }
+
+
 @app.route("/artists/create", methods=["GET"])
 def create_artist_form():
     form = ArtistForm()
@@ -467,24 +775,22 @@ def create_artist_form():
 
 
 @app.route("/artists/create", methods=["POST"])
+@limiter.limit("10/minute")
+@limiter.shed()
 def create_artist_submission():
     form = ArtistForm()
 
     if form.validate():
-        try:
-            artist = Artist(
-                name=request.form.get("name"),
-                city=request.form.get("city"),
-                state=request.form.get("state"),
-                phone=request.form.get("phone"),
-                image_link=request.form.get("image_link"),
-                facebook_link=request.form.get("facebook_link"),
-                website=request.form.get("website"),
-                seeking_venue=True if request.form.get("seeking_venue") else False,
-                seeking_description=request.form.get("seeking_description"),
-                genres=request.form.getlist("genres "),
+        duplicate = find_duplicate_artist(form)
+
+        if duplicate and not request.form.get("allow_duplicate"):
+            return render_template(
+                "forms/new_artist.html", form=form, duplicate=duplicate
             )
 
+        try:
+            artist = Artist(**artist_values(form))
+
             db.session.add(artist)
             db.session.commit()
 
@@ -492,7 +798,7 @@ def create_artist_submission():
             flash(f"Artist {artist_name} was successfully listed!")
         except:
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception("Could not create artist")
 
             artist_name = request.form.get("name")
             flash(f"An error occurred. Artist {artist_name} could not be listed.")
@@ -510,22 +816,29 @@ def create_artist_submission():
 
 @app.route("/shows")
 def shows():
-    data = []
-    shows = Show.query.order_by(Show.start_time).all()
-
-    for show in shows:
-        data.append(
-            {
-                "venue_id": show.venue.id,
-                "venue_name": show.venue.name,
-                "artist_id": show.artist.id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": show.start_time,
-            }
+    shows = (
+        Show.query.join(Venue)
+        .join(Artist)
+        .with_entities(
+            Show.venue_id,
+            Venue.name,
+            Show.artist_id,
+            Artist.name,
+            Artist.image_link,
+            Show.start_time,
+            Show.id,
+            Show.tickets_remaining,
+            Show.series_id,
         )
+        .order_by(Show.start_time)
+    )
 
-    return render_template("pages/shows.html", shows=data)
+    # A generator, so rows are turned into view models as the page streams.
+    return stream_template(
+        "pages/shows.html",
+        shows=map(ShowSummary._make, shows),
+        now=datetime.now(),
+    )
 
 
 @app.route("/shows/create")
@@ -535,22 +848,84 @@ def create_shows():
 
 
 @app.route("/shows/create", methods=["POST"])
+@limiter.limit("10/minute")
+@limiter.shed()
 def create_show_submission():
     form = ShowForm()
 
     if form.validate():
-        try:
-            show = Show(
-                venue_id=request.form.get("venue_id"),
-                artist_id=request.form.get("artist_id"),
-                start_time=request.form.get("start_time"),
+        venue_id = form.venue_id.data
+        artist_id = form.artist_id.data
+        tickets = form.tickets.data
+        if tickets is None:
+            tickets = (entities.values(Venue, venue_id) or {}).get("capacity")
+
+        times = [form.start_time.data]
+        if form.repeat.data:
+            try:
+                times = expand(
+                    form.start_time.data,
+                    form.repeat.data,
+                    interval=form.interval.data or 1,
+                    count=form.count.data,
+                    until=form.until.data,
+                    exclude=parse_dates(form.exclude.data),
+                    limit=app.config["SHOW_SERIES_MAX_SHOWS"],
+                )
+            except ValueError as e:
+                form.repeat.errors.append(str(e))
+                return render_template("forms/new_show.html", form=form)
+
+        # Every occurrence is checked with one query, before anything is written.
+        clashing = conflicts(
+            db.session,
+            Show.__table__,
+            venue_id,
+            artist_id,
+            times,
+            timedelta(minutes=app.config["SHOW_CONFLICT_MINUTES"]),
+        )
+        if clashing and not request.form.get("allow_conflicts"):
+            db.session.rollback()
+            return render_template(
+                "forms/new_show.html", form=form, conflicts=clashing
             )
-            db.session.add(show)
+
+        try:
+            if form.repeat.data:
+                values = {
+                    "venue_id": venue_id,
+                    "artist_id": artist_id,
+                    "tickets_total": tickets,
+                    "tickets_remaining": tickets,
+                    "series_id": new_series_id(),
+                }
+                ids = insert_series(db.session, Show.__table__, values, times)
+                for start_time, show_id in ids.items():
+                    changes.record(
+                        db.session,
+                        "Show",
+                        show_id,
+                        "insert",
+                        dict(values, id=show_id, start_time=start_time),
+                    )
+            else:
+                show = Show(
+                    venue_id=venue_id,
+                    artist_id=artist_id,
+                    start_time=form.start_time.data,
+                    tickets_total=tickets,
+                    tickets_remaining=tickets,
+                )
+                db.session.add(show)
             db.session.commit()
-            flash(f"Show was successfully listed!")
+            if len(times) > 1:
+                flash(f"{len(times)} shows were successfully listed!")
+            else:
+                flash(f"Show was successfully listed!")
         except:
             db.session.rollback()
-            print(sys.exc_info())
+            app.logger.exception("Could not create show")
             flash("An error occurred. Show could not be listed.")
         finally:
             db.session.close()
@@ -560,6 +935,317 @@ def create_show_submission():
     return render_template("forms/new_show.html", form=form)
 
 
+def upcoming_series(series_id):
+    """Count, dates, venue and artist of a series' upcoming shows, or None."""
+    summary = (
+        Show.query.filter(Show.series_id == series_id, Show.start_time > datetime.now())
+        .with_entities(
+            db.func.count(Show.id).label("count"),
+            db.func.min(Show.start_time).label("first"),
+            db.func.max(Show.start_time).label("last"),
+            db.func.min(Show.venue_id).label("venue_id"),
+            db.func.min(Show.artist_id).label("artist_id"),
+        )
+        .one()
+    )
+    return summary if summary.count else None
+
+
+@app.route("/shows/series/<series_id>/edit")
+@db.primary
+def edit_series(series_id):
+    series = upcoming_series(series_id)
+    if series is None:
+        abort(404)
+
+    form = SeriesForm()
+    return render_template(
+        "forms/edit_series.html", form=form, series=series, series_id=series_id
+    )
+
+
+@app.route("/shows/series/<series_id>/edit", methods=["POST"])
+@limiter.limit("10/minute")
+def edit_series_submission(series_id):
+    series = upcoming_series(series_id)
+    if series is None:
+        abort(404)
+
+    form = SeriesForm()
+    if form.validate():
+        artist_id, tickets = form.artist_id.data, form.tickets.data
+        if artist_id is not None and entities.values(Artist, artist_id) is None:
+            form.artist_id.errors.append("There is no artist with this ID.")
+        elif artist_id is None and tickets is None:
+            flash("Nothing to change.")
+            return redirect(url_for("edit_series", series_id=series_id), 303)
+        else:
+            now = datetime.now()
+            if artist_id is not None and not request.form.get("allow_conflicts"):
+                # The new artist must be free for every upcoming show, as
+                # when the series was listed.
+                times = [
+                    start_time
+                    for start_time, in Show.query.filter(
+                        Show.series_id == series_id, Show.start_time > now
+                    ).with_entities(Show.start_time)
+                ]
+                clashing = conflicts(
+                    db.session,
+                    Show.__table__,
+                    None,
+                    artist_id,
+                    times,
+                    timedelta(minutes=app.config["SHOW_CONFLICT_MINUTES"]),
+                    series_id=series_id,
+                )
+                if clashing:
+                    db.session.rollback()
+                    return render_template(
+                        "forms/edit_series.html",
+                        form=form,
+                        series=series,
+                        series_id=series_id,
+                        conflicts=clashing,
+                    )
+
+            try:
+                # One UPDATE for all of the series' upcoming shows.
+                rows, previous = update_series(
+                    db.session,
+                    Show.__table__,
+                    series_id,
+                    now,
+                    artist_id=artist_id,
+                    tickets=tickets,
+                )
+                for row in rows:
+                    changes.record(
+                        db.session,
+                        "Show",
+                        row.id,
+                        "update",
+                        dict(row),
+                        previous.get(row.id),
+                    )
+                db.session.commit()
+
+                plural = "s" if len(rows) != 1 else ""
+                flash(f"{len(rows)} upcoming show{plural} updated.")
+                skipped = series.count - len(rows)
+                if skipped and tickets is not None:
+                    flash(
+                        f"{skipped} show{'s' if skipped > 1 else ''} already sold "
+                        f"more than {tickets} tickets and kept their count."
+                    )
+            except:
+                db.session.rollback()
+                app.logger.exception("Could not update series %s", series_id)
+                flash("An error occurred. The series could not be updated.")
+            finally:
+                db.session.close()
+
+            return redirect(url_for("shows"), 303)
+
+    return render_template(
+        "forms/edit_series.html", form=form, series=series, series_id=series_id
+    )
+
+
+@app.route("/shows/series/<series_id>/cancel", methods=["POST"])
+@limiter.limit("10/minute")
+def cancel_series_submission(series_id):
+    if upcoming_series(series_id) is None:
+        abort(404)
+
+    try:
+        # One DELETE; shows with bookings are kept for their ticket holders.
+        deleted, kept = cancel_series(
+            db.session, Show.__table__, Booking.__table__, series_id, datetime.now()
+        )
+        for row in deleted:
+            changes.record(db.session, "Show", row.id, "delete", dict(row))
+        db.session.commit()
+
+        plural = "s" if len(deleted) != 1 else ""
+        flash(f"{len(deleted)} upcoming show{plural} cancelled.")
+        if kept:
+            flash(f"{kept} show{'s' if kept > 1 else ''} with bookings kept.")
+    except:
+        db.session.rollback()
+        app.logger.exception("Could not cancel series %s", series_id)
+        flash("An error occurred. The series could not be cancelled.")
+    finally:
+        db.session.close()
+
+    return redirect(url_for("shows"), 303)
+
+
+def booking_response(status, message, **data):
+    """JSON for API clients; a flash message and the shows page for forms."""
+    if request.is_json:
+        return jsonify(message=message, **data), status
+    flash(message)
+    return redirect(url_for("shows"), 303)
+
+
+@app.route("/shows/<int:show_id>/bookings", methods=["POST"])
+@limiter.limit("10/minute")
+@limiter.shed()
+def book_show(show_id):
+    form = BookingForm()
+    if not form.validate():
+        return booking_response(400, "Please check your booking.", errors=form.errors)
+
+    quantity = form.quantity.data
+    # The booking links carry the show's start time, which lets Postgres
+    # look in one partition only.
+    start = request.args.get("start", type=datetime.fromisoformat)
+    now = datetime.now()
+    remaining = reserve(db.session, Show.__table__, show_id, quantity, now, start)
+    if remaining is None:
+        reason, remaining = unavailable(
+            db.session, Show.__table__, show_id, now, start
+        )
+        db.session.rollback()
+        if reason == NOT_FOUND:
+            abort(404)
+        if reason == STARTED:
+            message = "This show has already started."
+        elif reason == NOT_ON_SALE:
+            message = "Tickets for this show are not sold here."
+        elif remaining:
+            message = "Not enough tickets left."
+        else:
+            message = "This show is sold out."
+        return booking_response(
+            409, message, error=reason, tickets_remaining=remaining
+        )
+
+    booking = Booking(
+        show_id=show_id, quantity=quantity, name=form.name.data, email=form.email.data
+    )
+    db.session.add(booking)
+    db.session.commit()
+
+    return booking_response(
+        201,
+        f"Booked {quantity} ticket{'s' if quantity > 1 else ''}!",
+        booking_id=booking.id,
+        quantity=quantity,
+        tickets_remaining=remaining,
+    )
+
+
+#  Calendar feeds
+#  ----------------------------------------------------------------
+
+
+def calendar_feed(key, name, *criteria):
+    """iCalendar response for the upcoming shows matching `criteria`."""
+    upcoming = (
+        Show.query.join(Venue)
+        .join(Artist)
+        .filter(Show.start_time > datetime.now(), *criteria)
+    )
+    # In whole days and seconds of the day, so the weighted sums below stay
+    # well within 64 bits.
+    epoch = db.cast(db.extract("epoch", Show.start_time), db.BigInteger)
+    version = upcoming.with_entities(
+        db.func.count(Show.id),
+        db.func.max(Show.id),
+        db.func.min(Show.start_time),
+        db.func.max(Show.start_time),
+        db.func.sum(Venue.version),
+        db.func.sum(Artist.version),
+        # Weighted by show, so moving a show to another venue, artist or time
+        # (or swapping those of two shows) changes the sums.
+        db.func.sum(Show.id * Show.venue_id),
+        db.func.sum(Show.id * Show.artist_id),
+        db.func.sum(Show.id * (epoch / 86400)),
+        db.func.sum(Show.id * (epoch % 86400)),
+    ).one()
+
+    def shows():
+        rows = upcoming.with_entities(
+            Show.id,
+            Show.start_time,
+            Venue.id,
+            Venue.name,
+            Venue.address,
+            Venue.city,
+            Venue.state,
+            Venue.version,
+            Artist.id,
+            Artist.name,
+            Artist.version,
+        ).order_by(Show.start_time)
+        return map(FeedShow._make, rows)
+
+    return calendars.feed(key, name, tuple(version), shows)
+
+
+@app.route("/venues/<int:venue_id>/shows.ics")
+def venue_calendar(venue_id):
+    venue = entities.values(Venue, venue_id)
+    if venue is None:
+        abort(404)
+
+    return calendar_feed(
+        ("venue", venue_id), f"{venue['name']} shows", Show.venue_id == venue_id
+    )
+
+
+@app.route("/artists/<int:artist_id>/shows.ics")
+def artist_calendar(artist_id):
+    artist = entities.values(Artist, artist_id)
+    if artist is None:
+        abort(404)
+
+    return calendar_feed(
+        ("artist", artist_id), f"{artist['name']} shows", Show.artist_id == artist_id
+    )
+
+
+@app.route("/shows/<state>/<city>.ics")
+def city_calendar(state, city):
+    return calendar_feed(
+        ("city", state.upper(), city.lower()),
+        f"Shows in {city}, {state.upper()}",
+        Venue.state == state.upper(),
+        db.func.lower(Venue.city) == city.lower(),
+    )
+
+
+
+#  Live updates
+#  ----------------------------------------------------------------
+
+
+@app.route("/events/shows")
+def show_events():
+    """Server-Sent Events for committed show, venue and artist changes.
+
+    `?venue=<id>` and `?artist=<id>` (repeatable) narrow the stream to those
+    pages; without them it carries every change.
+    """
+    return live.stream(requested_topics())
+
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    status = jobs.status(job_id)
+
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(status)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
@@ -576,6 +1262,11 @@ def add_header(r):
     Add headers to both force latest IE rendering engine or Chrome Frame,
     and also to cache the rendered page for 10 minutes.
     """
+    # Responses that set their own caching policy (e.g. fingerprinted bundles)
+    # keep it.
+    if "Cache-Control" in r.headers and request.endpoint != "static":
+        return r
+
     r.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     r.headers["Pragma"] = "no-cache"
     r.headers["Expires"] = "0"
@@ -583,16 +1274,6 @@ def add_header(r):
     return r
 
 
-if not app.debug:
-    file_handler = FileHandler("error.log")
-    file_handler.setFormatter(
-        Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info("errors")
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
@@ -0,0 +1,227 @@
+# ----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask assets build` concatenates and minifies the stylesheets and scripts
+# used by layouts/main.html into fingerprinted bundles under static/dist/,
+# next to precompressed .gz and .br siblings. The `asset` route then picks
+# the best encoding the client accepts and serves it as an immutable file.
+# ----------------------------------------------------------------------------#
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory, url_for, abort
+from flask.cli import AppGroup, with_appcontext
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+BUNDLES = {
+    "main.css": [
+        "css/bootstrap.min.css",
+        "css/layout.main.css",
+        "css/main.css",
+        "css/main.responsive.css",
+        "css/main.quickfix.css",
+    ],
+    # Loaded synchronously in <head>.
+    "head.js": ["js/libs/modernizr-2.8.2.min.js", "js/libs/moment.min.js"],
+    # Deferred, after jQuery.
+    "app.js": [
+        "js/libs/bootstrap-3.1.1.min.js",
+        "js/plugins.js",
+        "js/script.js",
+    ],
+}
+
+# Bundles announced with `Link: rel=preload` on every HTML response.
+PRELOAD = {"main.css": "style", "head.js": "script"}
+
+# Bundles are written one level below static/ so relative url(../fonts/...)
+# references in the stylesheets keep resolving.
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_css_comments = re.compile(r"/\*.*?\*/", re.S)
+_css_whitespace = re.compile(r"\s+")
+_css_punctuation = re.compile(r"\s*([{};:,>])\s*")
+
+
+def minify_css(source):
+    source = _css_comments.sub("", source)
+    source = _css_whitespace.sub(" ", source)
+    source = _css_punctuation.sub(r"\1", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_js(source):
+    # Deliberately conservative: only drop indentation, blank lines and
+    # whole-line comments, which is safe without a real JS parser.
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def _read_bundle(static_folder, name, sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+            content = f.read()
+
+        if ".min." not in source:
+            content = minify_css(content) if name.endswith(".css") else minify_js(content)
+        parts.append(content)
+
+    # Guard against a script that doesn't end with a semicolon.
+    separator = "\n" if name.endswith(".css") else ";\n"
+    return separator.join(parts).encode("utf-8")
+
+
+def build(static_folder, bundles=BUNDLES):
+    """Write every bundle and its compressed siblings, return the manifest."""
+    out_dir = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = {}
+    for name, sources in bundles.items():
+        content = _read_bundle(static_folder, name, sources)
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        filename = f"{stem}.{digest}{ext}"
+
+        path = os.path.join(out_dir, filename)
+        with open(path, "wb") as f:
+            f.write(content)
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(content, quality=11))
+
+        manifest[name] = filename
+
+    # Drop bundles left behind by previous builds.
+    current = set(manifest.values())
+    for filename in os.listdir(out_dir):
+        if filename == MANIFEST:
+            continue
+        base = filename
+        for _, suffix in ENCODINGS:
+            if base.endswith(suffix):
+                base = base[: -len(suffix)]
+        if base not in current:
+            os.remove(os.path.join(out_dir, filename))
+
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def accepted_encodings(header):
+    """Return the content codings the client accepts with a non-zero q."""
+    accepted = set()
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.manifest = load_manifest(app.static_folder)
+        app.extensions["assets"] = self
+
+        app.add_url_rule("/assets/<path:filename>", "asset", self.serve)
+        app.context_processor(lambda: {"asset_url": self.url})
+        app.after_request(self.add_preload_headers)
+
+        cli = AppGroup("assets", help="Build static asset bundles.")
+
+        @cli.command("build")
+        @with_appcontext
+        def build_command():
+            self.manifest = build(current_app.static_folder)
+            for name, filename in sorted(self.manifest.items()):
+                click.echo(f"{name} -> {DIST_DIR}/{filename}")
+
+        app.cli.add_command(cli)
+
+    def url(self, name):
+        """URL of a built bundle, or None so templates fall back to sources."""
+        filename = self.manifest.get(name)
+        if filename is None:
+            return None
+        return url_for("asset", filename=filename)
+
+    def serve(self, filename):
+        if filename not in self.manifest.values():
+            abort(404)
+
+        directory = os.path.join(current_app.static_folder, DIST_DIR)
+        mimetype = mimetypes.guess_type(filename)[0]
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+
+        response = None
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.exists(
+                os.path.join(directory, filename + suffix)
+            ):
+                response = send_from_directory(
+                    directory, filename + suffix, mimetype=mimetype
+                )
+                response.headers["Content-Encoding"] = coding
+                break
+
+        if response is None:
+            response = send_from_directory(directory, filename, mimetype=mimetype)
+
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+    def add_preload_headers(self, response):
+        if response.mimetype != "text/html" or not self.manifest:
+            return response
+
+        links = [
+            f"<{self.url(name)}>; rel=preload; as={kind}"
+            for name, kind in PRELOAD.items()
+            if name in self.manifest
+        ]
+        if links:
+            response.headers.add("Link", ", ".join(links))
+        return response
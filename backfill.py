@@ -0,0 +1,270 @@
+# ----------------------------------------------------------------------------#
+# Online data backfills.
+#
+# A migration that needs to rewrite existing rows schedules a backfill instead
+# of running one big UPDATE inside its DDL transaction:
+#
+#     from backfill import schedule
+#     schedule(op, "venue_name_key", "Venue", set="name_key = lower(name)",
+#              where="name_key IS NULL")
+#
+# The backfill is a row in the "Backfill" table. After the migration commits,
+# migrations/env.py runs it in keyset-ordered batches (WHERE id > last ORDER
+# BY id LIMIT n), each in its own short transaction that also checkpoints the
+# last id done, with a pause between batches. An interrupted run resumes from
+# its checkpoint with `flask backfill run`. Offline (--sql) migrations insert
+# the row and print a reminder to run it.
+# ----------------------------------------------------------------------------#
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import BigInteger, DateTime, String, Text, column, func, table, text
+from sqlalchemy.exc import OperationalError
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+
+# Typed, so offline migrations can render the values as literals.
+backfills = table(
+    "Backfill",
+    column("name", String),
+    column("table_name", String),
+    column("key_column", String),
+    column("set_sql", Text),
+    column("where_sql", Text),
+    column("last_key", BigInteger),
+    column("rows_done", BigInteger),
+    column("status", String),
+    column("created_at", DateTime),
+    column("updated_at", DateTime),
+    column("finished_at", DateTime),
+)
+
+# Names scheduled by the migrations of the current `flask db` run.
+scheduled = []
+
+
+def schedule(op, name, table_name, set, where=None, key="id"):
+    """Schedule a backfill from a migration's upgrade().
+
+    `set` is the SET clause and `where` an optional condition selecting rows
+    that still need it; `key` must be an indexed integer column.
+    """
+    op.execute(
+        backfills.insert().values(
+            name=name,
+            table_name=table_name,
+            key_column=key,
+            set_sql=set,
+            where_sql=where,
+            rows_done=0,
+            status=PENDING,
+            created_at=func.now(),
+            updated_at=func.now(),
+        )
+    )
+    scheduled.append(name)
+
+
+def unschedule(op, name):
+    """Forget a backfill, from the downgrade() of the migration that made it."""
+    op.execute(backfills.delete().where(backfills.c.name == name))
+
+
+def load(conn, names=None):
+    """Backfill rows, oldest first; all of them, or those in `names`."""
+    query = backfills.select().order_by(backfills.c.created_at, backfills.c.name)
+    if names:
+        query = query.where(backfills.c.name.in_(names))
+    return conn.execute(query).fetchall()
+
+
+def run_batch(conn, spec, last_key, batch_size, dry_run=False, lock_timeout=None):
+    """Process the next batch after `last_key`.
+
+    Returns (new last key, rows updated), or (None, 0) once no rows are left.
+    In a dry run nothing is written and the rows are only counted.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    name, key = quote(spec.table_name), quote(spec.key_column)
+    where = f" AND ({spec.where_sql})" if spec.where_sql else ""
+    after = "" if last_key is None else f" AND {key} > :last_key"
+
+    with conn.begin():
+        if lock_timeout and conn.dialect.name == "postgresql":
+            # Give way to requests instead of queueing behind their locks.
+            conn.execute(text(f"SET LOCAL lock_timeout = '{int(lock_timeout)}ms'"))
+
+        keys = [
+            row[0]
+            for row in conn.execute(
+                text(
+                    f"SELECT {key} FROM {name} WHERE 1 = 1{after}{where} "
+                    f"ORDER BY {key} LIMIT :limit"
+                ),
+                last_key=last_key,
+                limit=batch_size,
+            )
+        ]
+        if not keys:
+            return None, 0
+        if dry_run:
+            return keys[-1], len(keys)
+
+        updated = conn.execute(
+            text(
+                f"UPDATE {name} SET {spec.set_sql} "
+                f"WHERE {key} >= :first AND {key} <= :last{where}"
+            ),
+            first=keys[0],
+            last=keys[-1],
+        ).rowcount
+        conn.execute(
+            backfills.update()
+            .where(backfills.c.name == spec.name)
+            .values(
+                last_key=keys[-1],
+                rows_done=backfills.c.rows_done + updated,
+                status=RUNNING,
+                updated_at=datetime.utcnow(),
+            )
+        )
+    return keys[-1], updated
+
+
+def run(
+    conn,
+    spec,
+    batch_size=1000,
+    pause=0.1,
+    dry_run=False,
+    lock_timeout=2000,
+    retries=5,
+    echo=None,
+):
+    """Run one backfill to completion from its checkpoint.
+
+    Returns the number of rows updated (or, in a dry run, that would be).
+    """
+    last_key = spec.last_key
+    total = 0
+    failures = 0
+
+    while True:
+        try:
+            last_key, count = run_batch(
+                conn, spec, last_key, batch_size, dry_run, lock_timeout
+            )
+        except OperationalError:
+            # Most likely a lock timeout; the batch was rolled back.
+            failures += 1
+            if failures > retries:
+                raise
+            time.sleep(pause * 2 ** failures)
+            continue
+
+        failures = 0
+        if last_key is None:
+            break
+        total += count
+        if echo:
+            echo(f"{spec.name}: {total} rows, up to {spec.key_column} {last_key}")
+        time.sleep(pause)
+
+    if not dry_run:
+        with conn.begin():
+            conn.execute(
+                backfills.update()
+                .where(backfills.c.name == spec.name)
+                .values(
+                    status=DONE,
+                    updated_at=datetime.utcnow(),
+                    finished_at=datetime.utcnow(),
+                )
+            )
+    return total
+
+
+def run_pending(conn, names=None, echo=None, **options):
+    """Run every backfill that isn't done, or only those in `names`."""
+    for spec in load(conn, names):
+        if spec.status != DONE:
+            run(conn, spec, echo=echo, **options)
+
+
+class Backfills(object):
+    def __init__(self, app=None, db=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault("BACKFILL_ON_MIGRATE", True)
+        app.config.setdefault("BACKFILL_BATCH_SIZE", 1000)
+        app.config.setdefault("BACKFILL_PAUSE", 0.1)
+        app.config.setdefault("BACKFILL_LOCK_TIMEOUT", 2000)
+        self.app = app
+        self.db = db
+        app.extensions["backfill"] = self
+
+        group = AppGroup("backfill", help="Run data backfills scheduled by migrations.")
+
+        @group.command("list")
+        def list_command():
+            """Show backfills and their progress."""
+            with self.db.engine.connect() as conn:
+                for spec in load(conn):
+                    click.echo(
+                        f"{spec.name}\t{spec.status}\t{spec.table_name}\t"
+                        f"{spec.rows_done} rows\tlast {spec.key_column} "
+                        f"{spec.last_key if spec.last_key is not None else '-'}"
+                    )
+
+        @group.command("run")
+        @click.argument("names", nargs=-1)
+        @click.option("--batch-size", type=int, help="Rows per transaction.")
+        @click.option("--pause", type=float, help="Seconds between batches.")
+        @click.option("--dry-run", is_flag=True, help="Count rows, write nothing.")
+        def run_command(names, batch_size, pause, dry_run):
+            """Run pending backfills, resuming from their checkpoints."""
+            with self.db.engine.connect() as conn:
+                run_pending(
+                    conn,
+                    names,
+                    echo=click.echo,
+                    dry_run=dry_run,
+                    **self.options(batch_size=batch_size, pause=pause),
+                )
+
+        @group.command("reset")
+        @click.argument("name")
+        def reset_command(name):
+            """Start a backfill over from the first row."""
+            with self.db.engine.begin() as conn:
+                conn.execute(
+                    backfills.update()
+                    .where(backfills.c.name == name)
+                    .values(
+                        last_key=None,
+                        rows_done=0,
+                        status=PENDING,
+                        updated_at=datetime.utcnow(),
+                        finished_at=None,
+                    )
+                )
+
+        app.cli.add_command(group)
+
+    def options(self, **overrides):
+        """Batch options from the config, with any non-None overrides."""
+        config = self.app.config
+        options = {
+            "batch_size": config["BACKFILL_BATCH_SIZE"],
+            "pause": config["BACKFILL_PAUSE"],
+            "lock_timeout": config["BACKFILL_LOCK_TIMEOUT"],
+        }
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return options
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------#
+# Background rebuilds of in-memory indexes.
+#
+# Indexes kept current from the ChangeFeed (widgets.py, matchmaking.py) are
+# still rebuilt from the database now and then, to pick up writes made by
+# other worker processes and changes they can't apply incrementally. A
+# Rebuilder runs those rebuilds on a daemon thread of each process: once at
+# startup (gunicorn starts it in post_worker_init, otherwise the first read
+# does), then every `interval` seconds or when asked to. Requests only ever
+# wait for the first build.
+# ----------------------------------------------------------------------------#
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def start_all(app):
+    """Start the rebuild threads of every index of `app`."""
+    for rebuilder in app.extensions.get("rebuilders", ()):
+        rebuilder.start()
+
+
+class Rebuilder(object):
+    def __init__(self, app, build, interval, name):
+        """Call `build()` in an app context of `app` every `interval` seconds."""
+        self.app = app
+        self.build = build
+        self.interval = interval
+        self.name = name
+        self.ready = threading.Event()
+        self.failed = False
+
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+        app.extensions.setdefault("rebuilders", []).append(self)
+
+    def start(self):
+        # Again in a forked child: threads don't survive fork.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            thread.start()
+
+    def request(self):
+        """Rebuild as soon as possible, without waiting for it."""
+        self._wake.set()
+
+    def wait(self, timeout=10):
+        """Whether the index has been built, waiting for the first build.
+
+        Returns False straight away if the last attempt failed.
+        """
+        if self.ready.is_set():
+            return True
+        self.start()
+        if self.failed:
+            return False
+        return self.ready.wait(timeout)
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.build()
+                self.failed = False
+                self.ready.set()
+                delay = self.interval
+            except Exception:
+                self.failed = True
+                logger.exception("Rebuilding %s failed; retrying", self.name)
+                delay = min(delay, 10)
+            self._wake.wait(delay)
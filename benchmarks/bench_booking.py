@@ -0,0 +1,127 @@
+"""Throughput and correctness of booking one show from many threads at once.
+
+    python benchmarks/bench_booking.py --threads 32 --tickets 5000
+
+Creates a show with `--tickets` tickets, then has `--threads` clients POST
+bookings of `--quantity` tickets each to /shows/<id>/bookings until it sells
+out. Reports bookings per second and checks that no ticket was oversold: the
+booked tickets must add up to exactly what left the inventory, and the
+inventory must end at zero. The show, its bookings and the scratch venue and
+artist are deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Artist, Booking, Show, Venue, app, db  # noqa: E402
+
+
+def seed(tickets, start_time):
+    venue = Venue(name="Bench Hall", city="Bench", state="NY", capacity=tickets)
+    artist = Artist(name="Bench Band", city="Bench", state="NY")
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    show = Show(
+        venue_id=venue.id,
+        artist_id=artist.id,
+        start_time=start_time,
+        tickets_total=tickets,
+        tickets_remaining=tickets,
+    )
+    db.session.add(show)
+    db.session.commit()
+    return venue.id, artist.id, show.id
+
+
+def cleanup(venue_id, artist_id, show_id):
+    Booking.query.filter(Booking.show_id == show_id).delete()
+    Show.query.filter(Show.id == show_id).delete()
+    Venue.query.filter(Venue.id == venue_id).delete()
+    Artist.query.filter(Artist.id == artist_id).delete()
+    db.session.commit()
+
+
+def client(url, quantity, results, latencies):
+    http = app.test_client()
+    booking = {"quantity": quantity, "name": "Bench", "email": "bench@example.com"}
+    while True:
+        start = time.perf_counter()
+        response = http.post(url, json=booking)
+        latencies.append(time.perf_counter() - start)
+        results[response.status_code] += 1
+        if response.status_code != 201:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["RATELIMIT_ENABLED"] = False
+    app.config["LOADSHED_ENABLED"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": args.threads}
+
+    with app.app_context():
+        start_time = datetime.now() + timedelta(days=30)
+        venue_id, artist_id, show_id = seed(args.tickets, start_time)
+    # With the start time, as the shows page links it.
+    url = f"/shows/{show_id}/bookings?start={start_time.isoformat()}"
+
+    results, latencies = Counter(), []
+    threads = [
+        threading.Thread(
+            target=client, args=(url, args.quantity, results, latencies)
+        )
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        try:
+            remaining = (
+                db.session.query(Show.tickets_remaining)
+                .filter(Show.id == show_id)
+                .scalar()
+            )
+            booked, bookings = db.session.query(
+                db.func.coalesce(db.func.sum(Booking.quantity), 0),
+                db.func.count(Booking.id),
+            ).filter(Booking.show_id == show_id).one()
+        finally:
+            cleanup(venue_id, artist_id, show_id)
+
+    latencies.sort()
+    print(f"threads              {args.threads}")
+    print(f"bookings             {bookings} ({results[201]} accepted)")
+    rejected = sum(results.values()) - results[201]
+    print(f"rejected             {rejected} {dict(results)}")
+    print(f"elapsed              {elapsed:.2f} s")
+    print(f"throughput           {bookings / elapsed:.0f} bookings/s")
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"latency p50 / p99    {p50:.1f} / {p99:.1f} ms")
+
+    ok = booked + remaining == args.tickets and remaining < args.quantity
+    print(f"tickets booked       {booked}, remaining {remaining}")
+    print(f"consistent           {'yes' if ok else 'NO'}")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
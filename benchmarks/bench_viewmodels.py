@@ -0,0 +1,152 @@
+"""Memory and time to build listing pages: ORM objects + dicts vs view models.
+
+    python benchmarks/bench_viewmodels.py --rows 20000
+
+Seeds `--rows` shows for one venue inside a transaction that is rolled back
+at the end, so it is safe to run against a development database. Reports the
+wall time, peak traced memory and memory still held by the result of
+building the /shows listing and a venue profile both ways.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Artist, Show, Venue, app, db  # noqa: E402
+from viewmodels import ArtistShow, ShowSummary, VenueProfile, split_shows  # noqa: E402
+
+
+def shows_dicts():
+    return [
+        {
+            "venue_id": show.venue.id,
+            "venue_name": show.venue.name,
+            "artist_id": show.artist.id,
+            "artist_name": show.artist.name,
+            "artist_image_link": show.artist.image_link,
+            "start_time": show.start_time,
+            "id": show.id,
+            "tickets_remaining": show.tickets_remaining,
+        }
+        for show in Show.query.order_by(Show.start_time).all()
+    ]
+
+
+def shows_view_models():
+    query = (
+        Show.query.join(Venue)
+        .join(Artist)
+        .with_entities(
+            Show.venue_id,
+            Venue.name,
+            Show.artist_id,
+            Artist.name,
+            Artist.image_link,
+            Show.start_time,
+            Show.id,
+            Show.tickets_remaining,
+            Show.series_id,
+        )
+        .order_by(Show.start_time)
+    )
+    return list(map(ShowSummary._make, query))
+
+
+def profile_dicts(venue_id):
+    venue = Venue.query.get(venue_id)
+    past, upcoming = [], []
+    for show in venue.shows:
+        artist = {
+            "artist_id": show.artist_id,
+            "artist_name": show.artist.name,
+            "artist_image_link": show.artist.image_link,
+            "start_time": show.start_time,
+        }
+        (past if show.start_time < datetime.now() else upcoming).append(artist)
+    return {
+        **venue.__dict__,
+        "past_shows": past,
+        "upcoming_shows": upcoming,
+        "past_shows_count": len(past),
+        "upcoming_shows_count": len(upcoming),
+    }
+
+
+def profile_view_model(venue_id):
+    columns = [getattr(Venue, field) for field in VenueProfile._fields[:-2]]
+    values = Venue.query.with_entities(*columns).filter(Venue.id == venue_id).one()
+    shows = (
+        Show.query.join(Artist)
+        .with_entities(Show.artist_id, Artist.name, Artist.image_link, Show.start_time)
+        .filter(Show.venue_id == venue_id)
+        .order_by(Show.start_time)
+    )
+    return VenueProfile.build(
+        values._asdict(), *split_shows(map(ArtistShow._make, shows))
+    )
+
+
+def measure(fn, *args):
+    # Start every run with an empty identity map, like a fresh request.
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak, held
+
+
+def seed(rows):
+    venue = Venue.query.order_by(Venue.id).first()
+    artist_ids = [id for id, in Artist.query.with_entities(Artist.id)]
+    now = datetime.now()
+    db.session.execute(
+        Show.__table__.insert(),
+        [
+            {
+                "venue_id": venue.id,
+                "artist_id": artist_ids[i % len(artist_ids)],
+                "start_time": now + timedelta(hours=i - rows // 2),
+            }
+            for i in range(rows)
+        ],
+    )
+    return venue.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            venue_id = seed(args.rows)
+            print(f"{'case':<28}{'time ms':>10}{'peak KiB':>12}{'held KiB':>12}")
+            for name, fn, fn_args in (
+                ("shows: ORM + dicts", shows_dicts, ()),
+                ("shows: view models", shows_view_models, ()),
+                ("profile: ORM + __dict__", profile_dicts, (venue_id,)),
+                ("profile: view model", profile_view_model, (venue_id,)),
+            ):
+                elapsed, peak, held = min(
+                    measure(fn, *fn_args) for _ in range(args.repeat)
+                )
+                print(
+                    f"{name:<28}{elapsed * 1000:>10.1f}"
+                    f"{peak / 1024:>12.0f}{held / 1024:>12.0f}"
+                )
+        finally:
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# ----------------------------------------------------------------------------#
+# In-process caches.
+#
+# TTLCache is a thread-safe LRU with a time-to-live and a cap on both entry
+# count and (approximate) memory. EntityCache uses it as a second-level cache
+# for rows looked up by primary key: it stores plain column values keyed by
+# (table, id) and rebuilds a clean, session-attached instance on each hit.
+# Entries are dropped as soon as a commit touches their row (via the
+# ChangeFeed); the TTL bounds how stale writes made by other processes can be.
+# SearchCache keeps search results the same way, per table and search term.
+# ----------------------------------------------------------------------------#
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+_MISSING = object()
+
+
+def sizeof(value):
+    """Rough deep size in bytes of plain data (dicts, lists, strings...)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item) for item in value)
+    return size
+
+
+class TTLCache(object):
+    def __init__(self, ttl=60, max_entries=10000, max_bytes=16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        # key -> (expires, size, value), least recently used first.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; see get_or_load().
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None, size=None):
+        size = sizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._set(key, value, expires, size)
+
+    def _set(self, key, value, expires, size):
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (expires, size, value)
+        self.size += size
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` on a miss.
+
+        The loaded value is only stored if nothing was invalidated while it
+        was loading; otherwise it might predate a write that just committed.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        generation = self._generation
+        value = loader()
+        size = sizeof(value)
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            if generation == self._generation and size <= self.max_bytes:
+                self._set(key, value, expires, size)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class EntityCache(object):
+    """Second-level cache for `Model.query.get(id)`."""
+
+    def __init__(self, app=None, db=None, changes=None):
+        self.db = db
+        self.cache = TTLCache()
+        if app is not None:
+            self.init_app(app, db, changes)
+
+    def init_app(self, app, db, changes):
+        app.config.setdefault("ENTITY_CACHE_ENABLED", True)
+        app.config.setdefault("ENTITY_CACHE_TTL", 60)
+        app.config.setdefault("ENTITY_CACHE_MAX_ENTRIES", 10000)
+        app.config.setdefault("ENTITY_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+
+        self.db = db
+        self.enabled = app.config["ENTITY_CACHE_ENABLED"]
+        self.cache = TTLCache(
+            app.config["ENTITY_CACHE_TTL"],
+            app.config["ENTITY_CACHE_MAX_ENTRIES"],
+            app.config["ENTITY_CACHE_MAX_BYTES"],
+        )
+        changes.on_commit(self._on_commit)
+
+    def _load(self, model, id):
+        mapper = inspect(model)
+        columns = [getattr(model, attr.key) for attr in mapper.column_attrs]
+        row = (
+            self.db.session.query(*columns)
+            .filter(mapper.primary_key[0] == id)
+            .first()
+        )
+        return None if row is None else row._asdict()
+
+    def values(self, model, id):
+        """Column values of the row with primary key `id`, or None.
+
+        The returned dict is shared with the cache; don't modify it.
+        """
+        if not self.enabled:
+            return self._load(model, id)
+        return self.cache.get_or_load(
+            (model.__table__.name, id), lambda: self._load(model, id)
+        )
+
+    def get(self, model, id):
+        """Return the instance with primary key `id`, or None.
+
+        Hits are merged into the current session without a query, so
+        relationships still lazy-load and the instance can be modified as
+        usual (the version column catches edits based on a stale entry).
+        """
+        if not self.enabled:
+            return model.query.get(id)
+
+        values = self.values(model, id)
+        if values is None:
+            return None
+
+        # Copy mutable values (genres) so the instance can't alter the cache.
+        obj = model(
+            **{
+                key: list(value) if isinstance(value, list) else value
+                for key, value in values.items()
+            }
+        )
+        make_transient_to_detached(obj)
+        return self.db.session.merge(obj, load=False)
+
+    def _on_commit(self, changes):
+        for change in changes:
+            self.cache.delete((change.model, change.id))
+
+
+class SearchCache(object):
+    """Name-search results, keyed by table and normalized search term.
+
+    A table's results are dropped when a commit writes to it; show writes
+    drop everything, since results carry upcoming-show counts.
+    """
+
+    def __init__(self, app=None, changes=None):
+        self.caches = {}
+        if app is not None:
+            self.init_app(app, changes)
+
+    def init_app(self, app, changes):
+        app.config.setdefault("SEARCH_CACHE_ENABLED", True)
+        app.config.setdefault("SEARCH_CACHE_TTL", 60)
+        app.config.setdefault("SEARCH_CACHE_MAX_ENTRIES", 1000)
+        app.config.setdefault("SEARCH_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+        app.config.setdefault("SEARCH_MAX_AGE", 60)
+
+        self.config = app.config
+        self.enabled = app.config["SEARCH_CACHE_ENABLED"]
+        changes.on_commit(self._on_commit)
+
+    def _cache(self, table):
+        cache = self.caches.get(table)
+        if cache is None:
+            cache = self.caches.setdefault(
+                table,
+                TTLCache(
+                    self.config["SEARCH_CACHE_TTL"],
+                    self.config["SEARCH_CACHE_MAX_ENTRIES"],
+                    self.config["SEARCH_CACHE_MAX_BYTES"],
+                ),
+            )
+        return cache
+
+    def get_or_load(self, model, term, load):
+        """Cached `load()` for searching `model` for `term`."""
+        if not self.enabled:
+            return load()
+        return self._cache(model.__table__.name).get_or_load(term, load)
+
+    def _on_commit(self, changes):
+        tables = {change.model for change in changes}
+        for table, cache in self.caches.items():
+            if table in tables or "Show" in tables:
+                cache.clear()
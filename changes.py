@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------#
+# Commit-time change notifications.
+#
+# Caches and in-memory indexes need to know which rows a transaction touched,
+# but only once it has actually committed. ChangeFeed collects the inserted,
+# updated and deleted rows of every flush and hands them to the registered
+# listeners after commit; a rollback discards them.
+# ----------------------------------------------------------------------------#
+import logging
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+
+# `model` is the table name, `values` the row's column values at flush time.
+# For updates, `previous` holds the old values of the changed columns, or is
+# None if they aren't known.
+Change = namedtuple(
+    "Change", ["model", "id", "op", "values", "previous"], defaults=[None]
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed(object):
+    def __init__(self, db=None):
+        self.listeners = []
+        if db is not None:
+            self.init_db(db)
+
+    def init_db(self, db):
+        event.listen(db.session, "after_flush", self._after_flush)
+        event.listen(db.session, "after_commit", self._after_commit)
+        event.listen(db.session, "after_rollback", self._after_rollback)
+
+    def on_commit(self, fn):
+        """Register `fn(changes)` to run after each commit that changed rows."""
+        self.listeners.append(fn)
+        return fn
+
+    def record(self, session, model, id, op="update", values=None, previous=None):
+        """Record a change the unit of work can't see (bulk UPDATE/INSERT)."""
+        pending = session.info.setdefault("changes", [])
+        pending.append(Change(model, id, op, values or {}, previous))
+
+    def _after_flush(self, session, flush_context):
+        for op, objects in (
+            ("insert", session.new),
+            ("update", session.dirty),
+            ("delete", session.deleted),
+        ):
+            for obj in objects:
+                if op == "update" and not session.is_modified(obj):
+                    continue
+
+                state = inspect(obj)
+                values = {
+                    attr.key: state.dict.get(attr.key)
+                    for attr in state.mapper.column_attrs
+                }
+                previous = None
+                if op == "update":
+                    previous = self._previous(state)
+                self.record(
+                    session,
+                    state.mapper.local_table.name,
+                    state.identity[0] if state.identity else values.get("id"),
+                    op,
+                    values,
+                    previous,
+                )
+
+    @staticmethod
+    def _previous(state):
+        """Old values of an updated object's changed columns, if all known."""
+        previous = {}
+        for attr in state.mapper.column_attrs:
+            # Attribute history still holds the pre-flush values here.
+            history = state.attrs[attr.key].history
+            if not history.added:
+                continue
+            if not history.deleted:
+                # Set without loading the old value first.
+                return None
+            previous[attr.key] = history.deleted[0]
+        return previous
+
+    def _after_commit(self, session):
+        changes = session.info.pop("changes", None)
+        if not changes:
+            return
+
+        for listener in self.listeners:
+            try:
+                listener(changes)
+            except Exception:
+                # A broken cache must never turn a committed write into an
+                # error response.
+                logger.exception("Change listener %r failed", listener)
+
+    def _after_rollback(self, session):
+        session.info.pop("changes", None)
@@ -0,0 +1,165 @@
+# ----------------------------------------------------------------------------#
+# On-the-fly response compression.
+#
+# A WSGI middleware that gzip/brotli-encodes text responses. Each body chunk
+# is flushed through the compressor as it arrives, so streamed templates
+# still reach the client incrementally.
+# ----------------------------------------------------------------------------#
+import zlib
+
+from assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+
+
+class _Gzip(object):
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli(object):
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware(object):
+    def __init__(
+        self, wsgi_app, level=6, brotli_quality=4, min_size=500, mimetypes=None
+    ):
+        self.wsgi_app = wsgi_app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes or DEFAULT_MIMETYPES)
+
+    def _choose(self, environ):
+        accepted = accepted_encodings(environ.get("HTTP_ACCEPT_ENCODING"))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _should_compress(self, status, headers):
+        if not status.startswith("200"):
+            return False
+
+        names = {name.lower(): value for name, value in headers}
+        if "content-encoding" in names:
+            return False
+        if names.get("content-type", "").split(";")[0].strip() not in self.mimetypes:
+            return False
+
+        length = names.get("content-length")
+        # Streamed bodies have no length and are always worth compressing.
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        coding = self._choose(environ)
+        if coding is None or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, start_response)
+
+        state = {}
+
+        def _start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                headers = [
+                    (name, value)
+                    for name, value in headers
+                    if name.lower() not in ("content-length", "vary")
+                ] + [
+                    ("Content-Encoding", coding),
+                    ("Vary", _vary(headers)),
+                ]
+                headers = [
+                    (name, _weaken(value) if name.lower() == "etag" else value)
+                    for name, value in headers
+                ]
+                state["compressor"] = (
+                    _Brotli(self.brotli_quality)
+                    if coding == "br"
+                    else _Gzip(self.level)
+                )
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, _start_response)
+        if "compressor" not in state:
+            return body
+        return _CompressedBody(body, state["compressor"])
+
+
+class _CompressedBody(object):
+    """Iterable that compresses `body` chunk by chunk and forwards close()."""
+
+    def __init__(self, body, compressor):
+        self.body = body
+        self.compressor = compressor
+
+    def __iter__(self):
+        for data in self.body:
+            if data:
+                yield self.compressor.chunk(data)
+        yield self.compressor.finish()
+
+    def close(self):
+        if hasattr(self.body, "close"):
+            self.body.close()
+
+
+def _vary(headers):
+    values = [value for name, value in headers if name.lower() == "vary"]
+    if not any("accept-encoding" in value.lower() for value in values):
+        values.append("Accept-Encoding")
+    return ", ".join(values)
+
+
+def _weaken(etag):
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class Compress(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_LEVEL", 6)
+        app.config.setdefault("COMPRESS_BR_LEVEL", 4)
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)
+
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            level=app.config["COMPRESS_LEVEL"],
+            brotli_quality=app.config["COMPRESS_BR_LEVEL"],
+            min_size=app.config["COMPRESS_MIN_SIZE"],
+            mimetypes=app.config["COMPRESS_MIMETYPES"],
+        )
@@ -12,10 +12,156 @@ SECRET_KEY = "fyyur"
 # Disable FSADeprecationWarning: SQLALCHEMY_TRACK_MODIFICATIONS
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-# Connect to the database
+# Connect to the database; DATABASE_URL may point at a SQLite file instead
+# (see database.py).
 database_name = "fyyur"
 database_path = "postgres://{}:{}@{}/{}".format(
     "postgres", "postgres", "localhost:5432", database_name
 )
 
-SQLALCHEMY_DATABASE_URI = database_path
+SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", database_path)
+
+# Response compression (see compression.py). Bodies smaller than
+# COMPRESS_MIN_SIZE bytes are sent as is; streamed pages are always compressed.
+COMPRESS_LEVEL = 6
+COMPRESS_BR_LEVEL = 4
+COMPRESS_MIN_SIZE = 500
+
+# Number of template chunks buffered before each write of a streamed page.
+TEMPLATE_STREAM_BUFFER = 16
+
+# Region assumed for phone numbers entered without a country code.
+PHONE_DEFAULT_REGION = "US"
+
+# Seconds between full rebuilds of the in-memory matchmaking index, done on a
+# background thread. Writes in this process are applied incrementally; the
+# rebuild picks up other workers'.
+MATCHMAKING_REFRESH_SECONDS = 300
+
+# Background jobs (see jobs.py): seconds between polls when idle, base retry
+# delay (doubled on each attempt) and how long a running job's lock may go
+# without a heartbeat before another worker takes it over. Workers refresh
+# their locks every half of that.
+JOBS_POLL_INTERVAL = 1.0
+JOBS_RETRY_DELAY = 10
+JOBS_LOCK_TIMEOUT = 600
+
+# Logging (see logs.py). Records are written as JSON lines by a background
+# thread. LOG_ROTATION is "size" (LOG_MAX_BYTES) or "time" (LOG_ROTATE_WHEN).
+# LOG_SAMPLING maps logger names to the fraction of records kept below ERROR
+# (access records log as "app.access");
+# LOG_RATE_LIMIT caps records per logger per second, with a separate budget
+# for ERROR and above.
+LOG_FILE = "error.log"
+LOG_ROTATION = "size"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_SAMPLING = {}
+LOG_RATE_LIMIT = 100
+
+# Admission control (see ratelimit.py). Views declare default limits with
+# @limiter.limit / @limiter.shed; these map endpoint names to overrides, e.g.
+# RATELIMIT_ROUTES = {"search_venues": "60/minute"} or {"search_venues": None}.
+# Use a redis:// URL to share rate-limit buckets between workers, and trust
+# X-Forwarded-For only behind a proxy that sets it.
+RATELIMIT_STORAGE_URL = "memory://"
+RATELIMIT_ROUTES = {}
+RATELIMIT_TRUST_FORWARDED = False
+# Shedding starts with requests in flight below gunicorn's --threads (32 in
+# the Procfile), or once the average DB pool wait, which halves every
+# LOADSHED_POOL_WAIT_HALF_LIFE seconds, passes LOADSHED_MAX_POOL_WAIT.
+LOADSHED_ROUTES = {}
+LOADSHED_MAX_IN_FLIGHT = 24
+LOADSHED_MAX_POOL_WAIT = 0.5
+LOADSHED_POOL_WAIT_HALF_LIFE = 2.0
+
+# Entity cache (see cache.py) for venue and artist lookups by id. Commits in
+# this process invalidate entries at once; ENTITY_CACHE_TTL bounds how long
+# writes from other workers can go unseen.
+ENTITY_CACHE_TTL = 60
+ENTITY_CACHE_MAX_ENTRIES = 10000
+ENTITY_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Home page widgets (see widgets.py): entries per list, and how often they are
+# rebuilt in the background to pick up writes made by other processes. Only
+# the top HOME_WIDGET_CANDIDATES venues and the next HOME_WIDGET_EXPIRY_LIMIT
+# of their shows are held in memory.
+HOME_WIDGET_SIZE = 5
+HOME_WIDGET_REFRESH_SECONDS = 300
+HOME_WIDGET_CANDIDATES = 50
+HOME_WIDGET_EXPIRY_LIMIT = 1000
+
+# Show partitions (see partitions.py): months created ahead by
+# `flask partitions create`, and past months kept live before
+# `flask partitions archive` moves them to Show_archive.
+SHOW_PARTITIONS_AHEAD = 12
+SHOW_ARCHIVE_AFTER_MONTHS = 24
+
+# iCalendar feeds (see ical.py): how long clients may reuse a feed before
+# revalidating, the assumed length of a show, and the rendered-feed cache.
+ICAL_MAX_AGE = 300
+ICAL_EVENT_HOURS = 2
+ICAL_CACHE_TTL = 3600
+ICAL_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Live updates (see sse.py): "auto" fans out through Postgres LISTEN/NOTIFY
+# when the database is Postgres and in-process otherwise ("local"). Idle
+# streams get a comment every SSE_HEARTBEAT seconds; a client more than
+# SSE_QUEUE_SIZE messages behind is disconnected. Each open stream holds one
+# of the worker's threads, so SSE_MAX_SUBSCRIBERS per worker stays well below
+# gunicorn's --threads, and streams close (the browser reconnects) after
+# SSE_MAX_STREAM_SECONDS.
+SSE_BACKEND = "auto"
+SSE_CHANNEL = "fyyur_changes"
+SSE_HEARTBEAT = 15
+SSE_QUEUE_SIZE = 100
+SSE_MAX_SUBSCRIBERS = 8
+SSE_MAX_STREAM_SECONDS = 300
+
+# Venue and artist search (see SearchCache in cache.py): results are cached
+# per normalized term until a write or SEARCH_CACHE_TTL, and pages may be
+# cached by browsers and proxies for SEARCH_MAX_AGE seconds.
+SEARCH_CACHE_TTL = 60
+SEARCH_CACHE_MAX_ENTRIES = 1000
+SEARCH_CACHE_MAX_BYTES = 8 * 1024 * 1024
+SEARCH_MAX_AGE = 60
+
+# Data backfills (see backfill.py): run right after `flask db upgrade`, or
+# later with `flask backfill run`; rows per batch, seconds between batches and
+# how long (ms) a batch waits for a row lock before backing off.
+BACKFILL_ON_MIGRATE = True
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_PAUSE = 0.1
+BACKFILL_LOCK_TIMEOUT = 2000
+
+# Request profiler (see profiler.py): requests sending this token in an
+# X-Profile header or ?_profile= are sampled and written to PROFILER_DIR as
+# collapsed stacks. Unset, the profiler is not installed.
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN")
+PROFILER_DIR = os.path.join(basedir, "profiles")
+PROFILER_INTERVAL = 0.001
+
+# Metrics (see metrics.py): each process writes its values to files in
+# METRICS_DIR, summed by GET /metrics. gunicorn.conf.py clears the directory
+# when the server starts and folds in the counters of workers that exit.
+METRICS_ENABLED = True
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(basedir, "metrics"))
+METRICS_CACHE_SYNC_SECONDS = 1.0
+
+# SQLite mode (see database.py): per-connection tuning, and the size of the
+# pool of query-only connections that serve GET and HEAD requests. On Postgres
+# SQLALCHEMY_READ_URI can send those to a replica.
+SQLALCHEMY_READ_URI = os.environ.get("DATABASE_READ_URL")
+# Seconds a client's reads stay on the primary after it wrote something.
+SQLALCHEMY_READ_AFTER_WRITE = 10
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+SQLITE_BUSY_TIMEOUT = 5000
+SQLITE_POOL_SIZE = 4
+SQLITE_READ_POOL_SIZE = 16
+
+# Recurring shows (see recurrence.py): the most shows one series may expand
+# to, and how close (in minutes) a new show may start to an existing show at
+# the same venue or by the same artist before it is reported as a conflict.
+SHOW_SERIES_MAX_SHOWS = 104
+SHOW_CONFLICT_MINUTES = 180
@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------#
+# Database setup that works on PostgreSQL and SQLite.
+#
+# Production runs on Postgres; small deployments can instead serve from a
+# single SQLite file (DATABASE_URL=sqlite:///fyyur.db). For those, every
+# connection is tuned for read-heavy serving (WAL journal, memory-mapped I/O,
+# a larger page cache), and GET/HEAD requests read through a separate pool of
+# query-only connections so they never contend for the write lock. The same
+# read pool can point at a Postgres replica with SQLALCHEMY_READ_URI.
+#
+# A replica lags, so reads stay on the primary when they must see the latest
+# data: in requests that have written, for SQLALCHEMY_READ_AFTER_WRITE
+# seconds after a client's write (tracked with a cookie, so the page after a
+# POST redirect shows it), and in views marked @db.primary, such as edit
+# forms whose row version is checked on submit.
+# ----------------------------------------------------------------------------#
+import sqlite3
+import threading
+from functools import wraps
+
+import click
+from flask import g, has_request_context, request
+from flask_migrate import stamp
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import JSON, String, create_engine, event, orm
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.types import TypeDecorator
+
+from ratelimit import TimedQueuePool
+
+READ_METHODS = ("GET", "HEAD")
+PRIMARY_COOKIE = "db_primary"
+
+
+class StringList(TypeDecorator):
+    """A list of strings: ARRAY on Postgres, JSON elsewhere."""
+
+    impl = JSON
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.ARRAY(String))
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else list(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else list(value)
+
+
+def _is_sqlite_file(uri):
+    return uri.startswith("sqlite:") and uri not in ("sqlite://", "sqlite:///:memory:")
+
+
+class RoutingSession(SignallingSession):
+    """Reads of GET and HEAD requests go to the read-only engine, if any."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                # Later reads in this request must see the write.
+                g.db_wrote = True
+            elif self.db.use_replica():
+                engine = self.db.read_engine(self.app)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper, clause)
+
+
+class Database(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        self._read_engine = None
+        self._read_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_READ_URI", None)
+        app.config.setdefault("SQLALCHEMY_READ_AFTER_WRITE", 10)
+        app.config.setdefault("SQLITE_JOURNAL_MODE", "WAL")
+        app.config.setdefault("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+        app.config.setdefault("SQLITE_CACHE_SIZE_KB", 64 * 1024)
+        app.config.setdefault("SQLITE_BUSY_TIMEOUT", 5000)
+        app.config.setdefault("SQLITE_POOL_SIZE", 4)
+        app.config.setdefault("SQLITE_READ_POOL_SIZE", 16)
+
+        uri = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+        if _is_sqlite_file(uri):
+            # A pool of connections shared between threads, instead of the
+            # default NullPool that would redo the PRAGMAs per checkout.
+            options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+            options.setdefault("poolclass", TimedQueuePool)
+            options.setdefault("pool_size", app.config["SQLITE_POOL_SIZE"])
+            options.setdefault("connect_args", {}).setdefault(
+                "check_same_thread", False
+            )
+        self._configure_sqlite(app.config)
+
+        super().init_app(app)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get("db_wrote") and self.read_engine(app) is not None:
+                response.set_cookie(
+                    PRIMARY_COOKIE,
+                    "1",
+                    max_age=app.config["SQLALCHEMY_READ_AFTER_WRITE"],
+                    httponly=True,
+                    samesite="Lax",
+                )
+            return response
+
+        @app.cli.command("create-db")
+        def create_db_command():
+            """Create all tables from the models and stamp the latest migration.
+
+            For databases the migrations can't build, such as SQLite.
+            """
+            self.create_all()
+            stamp()
+            click.echo(f"Created tables in {self.engine.url!r}")
+
+    def primary(self, fn):
+        """Decorate a view whose reads must not come from the replica."""
+
+        @wraps(fn)
+        def view(*args, **kwargs):
+            g.db_primary = True
+            return fn(*args, **kwargs)
+
+        return view
+
+    def use_replica(self):
+        """Whether this request's reads may go to the read-only engine."""
+        return (
+            request.method in READ_METHODS
+            and not g.get("db_wrote")
+            and not g.get("db_primary")
+            and PRIMARY_COOKIE not in request.cookies
+        )
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _configure_sqlite(self, config):
+        pragmas = [
+            f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+            f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+            f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}",
+            "PRAGMA temp_store = MEMORY",
+            "PRAGMA foreign_keys = ON",
+        ]
+
+        @event.listens_for(Engine, "connect")
+        def tune_sqlite(dbapi_connection, connection_record):
+            if isinstance(dbapi_connection, sqlite3.Connection):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+
+    def read_engine(self, app):
+        """Engine for read-only requests, or None to use the primary one."""
+        if self._read_engine is None:
+            with self._read_lock:
+                if self._read_engine is None:
+                    self._read_engine = self._create_read_engine(app) or False
+        return self._read_engine or None
+
+    def _create_read_engine(self, app):
+        config = app.config
+        # A TimedQueuePool, so waits for read connections count towards load
+        # shedding (see ratelimit.py) like those for the primary.
+        if config["SQLALCHEMY_READ_URI"]:
+            return create_engine(
+                config["SQLALCHEMY_READ_URI"], poolclass=TimedQueuePool
+            )
+        if not _is_sqlite_file(config.get("SQLALCHEMY_DATABASE_URI") or ""):
+            return None
+
+        # The same file as the primary engine (whose URL has the resolved
+        # path), on connections that refuse to write.
+        engine = create_engine(
+            self.get_engine(app).url,
+            poolclass=TimedQueuePool,
+            pool_size=config["SQLITE_READ_POOL_SIZE"],
+            connect_args={"check_same_thread": False},
+        )
+
+        @event.listens_for(engine, "connect")
+        def query_only(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA query_only = ON")
+
+        return engine
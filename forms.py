@@ -1,8 +1,10 @@
+import re
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import ValidationError, DataRequired, AnyOf, URL, Length
-import phonenumbers
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, DateField, BooleanField, HiddenField, IntegerField
+from wtforms.validators import ValidationError, DataRequired, InputRequired, AnyOf, URL, Length, Optional, NumberRange, Regexp
+from flask import current_app
+from normalize import phone_e164
 
 state_options = [
     ('AL', 'AL'),
@@ -80,14 +82,19 @@ genre_options = [
     ('Other', 'Other'),
 ]
 
-def validate_phone(self, phone):
-    try:
-        p = phonenumbers.parse(phone.data)
+repeat_options = [
+    ('', 'Does not repeat'),
+    ('weekly', 'Weekly'),
+    ('monthly', 'Monthly'),
+]
 
-        if not p or not phonenumbers.is_valid_number(p):
-            raise ValueError()
+def validate_phone(self, phone):
+    region = current_app.config.get('PHONE_DEFAULT_REGION', 'US')
 
-    except (phonenumbers.phonenumberutil.NumberParseException, ValueError):
+    try:
+        # Store the canonical E.164 form rather than what was typed.
+        phone.data = phone_e164(phone.data, region)
+    except ValueError:
         raise ValidationError('Invalid phone number')
 
 def validate_genres(self, genres):
@@ -97,6 +104,19 @@ def validate_genres(self, genres):
         if genre not in genre_selection:
             raise ValidationError(f'{genre} is not a valid genre. Please select one or more of the options above')
 
+def parse_dates(text):
+    """Dates from a comma- or space-separated list of YYYY-MM-DD."""
+    return [
+        datetime.strptime(value, '%Y-%m-%d').date()
+        for value in re.split(r'[\s,]+', text or '') if value
+    ]
+
+def validate_dates(self, dates):
+    try:
+        parse_dates(dates.data)
+    except ValueError:
+        raise ValidationError('Use dates like 2026-12-25, separated by commas.')
+
 
 class VenueForm(FlaskForm):
 
@@ -133,6 +153,11 @@ class VenueForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description', validators=[Length(max=120)]
     )
+    capacity = IntegerField(
+        'capacity', validators=[Optional(), NumberRange(min=1)]
+    )
+    # Row version the edit form was rendered from; see edit_venue_submission.
+    version = HiddenField('version')
 
 
 class ArtistForm(FlaskForm):
@@ -166,18 +191,69 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description', validators=[Length(max=500)]
     )
+    version = HiddenField('version')
 
 
 class ShowForm(FlaskForm):
-    artist_id = StringField(
-        'artist_id', validators=[DataRequired()]
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
     )
-    venue_id = StringField(
-        'venue_id', validators=[DataRequired()]
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
     )
     start_time = DateTimeField(
         'start_time', validators=[DataRequired()], default=datetime.today()
     )
+    # Defaults to the venue's capacity; empty for no ticket sales.
+    tickets = IntegerField(
+        'tickets', validators=[Optional(), NumberRange(min=1)]
+    )
+    # Recurrence rule, expanded by recurrence.py; empty for a single show.
+    repeat = SelectField(
+        'repeat', choices=repeat_options, default=''
+    )
+    interval = IntegerField(
+        'interval', validators=[Optional(), NumberRange(min=1, max=12)], default=1
+    )
+    count = IntegerField(
+        'count', validators=[Optional(), NumberRange(min=1)]
+    )
+    until = DateField(
+        'until', validators=[Optional()]
+    )
+    exclude = StringField(
+        'exclude', validators=[validate_dates]
+    )
+
+    def validate_repeat(self, repeat):
+        if repeat.data and self.count.data is None and self.until.data is None:
+            raise ValidationError('Choose a number of shows or an end date.')
+
+
+class SeriesForm(FlaskForm):
+    # Applies to the series' upcoming shows; empty fields are left as they are.
+    artist_id = IntegerField(
+        'artist_id', validators=[Optional()]
+    )
+    tickets = IntegerField(
+        'tickets', validators=[Optional(), NumberRange(min=1)]
+    )
+
+
+class BookingForm(FlaskForm):
+    quantity = IntegerField(
+        'quantity', validators=[InputRequired(), NumberRange(min=1, max=10)]
+    )
+    name = StringField(
+        'name', validators=[DataRequired(), Length(max=120)]
+    )
+    email = StringField(
+        'email', validators=[DataRequired(), Regexp(r'^[^@\s]+@[^@\s]+$'), Length(max=120)]
+    )
 
 class SearchForm(FlaskForm):
+    # Searches are plain GET requests; there is nothing to protect.
+    class Meta:
+        csrf = False
+
     search_term = StringField('search_term')
\ No newline at end of file
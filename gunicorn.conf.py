@@ -0,0 +1,24 @@
+# ----------------------------------------------------------------------------#
+# gunicorn settings (read automatically from the working directory).
+#
+# Workers write metrics to per-process files (see metrics.py); the master
+# clears them on startup and archives each worker's counters when it exits,
+# so /metrics stays accurate across worker restarts. Each worker builds its
+# in-memory indexes in the background as soon as it has loaded the app,
+# instead of on its first requests.
+# ----------------------------------------------------------------------------#
+import background
+import config
+import metrics
+
+
+def on_starting(server):
+    metrics.reset(config.METRICS_DIR)
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid, config.METRICS_DIR)
+
+
+def post_worker_init(worker):
+    background.start_all(worker.wsgi)
@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------#
+# iCalendar feeds of upcoming shows.
+#
+# Each feed has a version: a small aggregate over its upcoming shows (count,
+# newest id, first/last start, which venues and artists play them and when,
+# and their versions) computed by one indexed query. Its hash is the ETag, so
+# a client polling an unchanged feed gets a 304 without the feed being
+# rendered. Rendered feeds and the VEVENT text of each show are cached, so a
+# feed that gained one show only formats that show.
+# ----------------------------------------------------------------------------#
+import hashlib
+from datetime import datetime
+
+from flask import Response, request, url_for
+
+from cache import TTLCache
+
+
+def escape(value):
+    """Escape a TEXT value (RFC 5545, 3.3.11)."""
+    return (
+        str(value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Fold a content line to 75 octets, continuation lines start with a space."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+
+    parts = []
+    while data:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(data))
+        # Don't split a multi-byte character.
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    return "\r\n ".join(parts)
+
+
+def _timestamp(value):
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def vevent(show, hours=2):
+    """VEVENT block for a FeedShow. Start times are local ("floating")."""
+    location = ", ".join(
+        part for part in (show.address, show.city, show.state) if part
+    )
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:show-{show.id}@fyyur",
+        f"DTSTAMP:{datetime.utcnow():%Y%m%dT%H%M%SZ}",
+        f"DTSTART:{_timestamp(show.start_time)}",
+        f"DURATION:PT{hours}H",
+        f"SUMMARY:{escape(f'{show.artist_name} at {show.venue_name}')}",
+        f"LOCATION:{escape(location)}",
+        f"URL:{url_for('show_venue', venue_id=show.venue_id, _external=True)}",
+        "END:VEVENT",
+    ]
+    return "\r\n".join(fold(line) for line in lines)
+
+
+class Calendars(object):
+    def __init__(self, app=None):
+        self.feeds = TTLCache()
+        self.events = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ICAL_MAX_AGE", 300)
+        app.config.setdefault("ICAL_EVENT_HOURS", 2)
+        app.config.setdefault("ICAL_CACHE_TTL", 3600)
+        app.config.setdefault("ICAL_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+
+        self.config = app.config
+        ttl = app.config["ICAL_CACHE_TTL"]
+        max_bytes = app.config["ICAL_CACHE_MAX_BYTES"]
+        self.feeds = TTLCache(ttl, 1000, max_bytes // 2)
+        self.events = TTLCache(ttl, 100000, max_bytes // 2)
+
+    def _event(self, show):
+        key = (
+            show.id,
+            show.start_time,
+            show.venue_id,
+            show.venue_version,
+            show.artist_id,
+            show.artist_version,
+        )
+        return self.events.get_or_load(
+            key, lambda: vevent(show, self.config["ICAL_EVENT_HOURS"])
+        )
+
+    def render(self, name, shows):
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Fyyur//Shows//EN",
+            "CALSCALE:GREGORIAN",
+            fold(f"X-WR-CALNAME:{escape(name)}"),
+        ]
+        lines.extend(self._event(show) for show in shows)
+        lines.append("END:VCALENDAR")
+        return "\r\n".join(lines) + "\r\n"
+
+    def feed(self, key, name, version, shows):
+        """Respond with the feed `key`, rendering `shows()` only if needed.
+
+        `version` must change whenever the feed's content would.
+        """
+        etag = hashlib.sha1(repr((name, version)).encode("utf-8")).hexdigest()[:20]
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            cached = self.feeds.get(key)
+            if cached and cached[0] == etag:
+                body = cached[1]
+            else:
+                body = self.render(name, shows())
+                self.feeds.set(key, (etag, body))
+            response = Response(body, mimetype="text/calendar")
+
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.config["ICAL_MAX_AGE"]
+        return response
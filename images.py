@@ -0,0 +1,308 @@
+# ----------------------------------------------------------------------------#
+# Responsive images.
+#
+# Artist and venue images are remote URLs. Rather than hot-linking them at
+# full resolution, templates ask for resized WebP/JPEG variants through the
+# `image` route. Variants are produced on first request, kept in an on-disk
+# cache shared by all workers and bounded by total size (least recently used
+# files are evicted first), and served with a long cache lifetime. The front
+# page splash is resized ahead of time by `flask images build`.
+# ----------------------------------------------------------------------------#
+import hashlib
+import io
+import os
+import threading
+import urllib.request
+from contextlib import contextmanager
+
+import click
+from flask import current_app, redirect, send_file, url_for, abort
+from flask.cli import AppGroup, with_appcontext
+from itsdangerous import BadSignature, URLSafeSerializer
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+
+WIDTHS = (320, 640, 960)
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+SPLASH = "img/front-splash.jpg"
+LOCK_FILE = ".lock"
+# Eviction frees space down to this fraction of the limit, so a full cache
+# isn't scanned again on every write.
+EVICT_TO = 0.9
+
+
+class HTTPFetcher(object):
+    """Download source images over HTTP(S)."""
+
+    def __init__(self, timeout=5, max_bytes=20 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def __call__(self, url):
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"Unsupported image URL: {url}")
+
+        request = urllib.request.Request(url, headers={"User-Agent": "fyyur"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read(self.max_bytes + 1)
+
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Image too large: {url}")
+        return data
+
+
+class LocalFetcher(object):
+    """Serve source images from a directory, keyed by the URL's basename.
+
+    Stands in for HTTPFetcher in tests and offline development.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, url):
+        name = os.path.basename(url.split("?", 1)[0])
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return f.read()
+
+
+class DiskCache(object):
+    """A directory of files evicted in LRU order once over `max_bytes`.
+
+    Every worker process shares the directory, so the running total of its
+    size is kept in LOCK_FILE and updated by each write while holding an
+    exclusive lock on that file. Once the total is over the limit, the
+    directory is scanned, the least recently used files are removed and the
+    total is recounted. Recency is the file's mtime, which reads refresh, so
+    it is shared too and survives restarts.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, LOCK_FILE)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, data):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        with self._locked() as lock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+
+            lock.seek(0)
+            try:
+                size = int(lock.read()) + len(data) - replaced
+            except ValueError:
+                # A new cache: count what is already there.
+                size = sum(file_size for _, _, file_size in self._files())
+            if size > self.max_bytes:
+                size = self._evict(keep=key)
+
+            lock.seek(0)
+            lock.truncate()
+            lock.write(str(size))
+        return path
+
+    @contextmanager
+    def _locked(self):
+        """The open LOCK_FILE, locked against other threads and processes."""
+        with self._lock, open(self._lock_path, "a+") as f:
+            if fcntl is None:
+                yield f
+                return
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                f.flush()
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _files(self):
+        """[(mtime, name, size)] of the cached files."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name == LOCK_FILE or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        return files
+
+    def _evict(self, keep):
+        """Remove the oldest files down to EVICT_TO; returns the new size."""
+        files = sorted(self._files())
+        size = sum(file_size for _, _, file_size in files)
+        for _, name, file_size in files:
+            if size <= self.max_bytes * EVICT_TO:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                continue
+            size -= file_size
+        return size
+
+
+def resize(data, width, fmt, quality=80):
+    """Scale an encoded image down to `width` pixels and re-encode it."""
+    image = Image.open(io.BytesIO(data))
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.LANCZOS)
+
+    pil_format, _ = FORMATS[fmt]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    out = io.BytesIO()
+    image.save(out, pil_format, quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _variant_name(path, width, fmt):
+    stem, _ = os.path.splitext(path)
+    return f"{stem}-{width}.{fmt}"
+
+
+def build_static_variants(static_folder, path, widths=WIDTHS, quality=80):
+    """Write resized copies of a static image next to the original."""
+    with open(os.path.join(static_folder, path), "rb") as f:
+        data = f.read()
+
+    written = []
+    for fmt in FORMATS:
+        for width in widths:
+            name = _variant_name(path, width, fmt)
+            with open(os.path.join(static_folder, name), "wb") as f:
+                f.write(resize(data, width, fmt, quality))
+            written.append(name)
+    return written
+
+
+class Images(object):
+    def __init__(self, app=None, fetcher=None):
+        self.fetcher = fetcher
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "IMAGE_CACHE_DIR", os.path.join(app.root_path, "cache", "images")
+        )
+        app.config.setdefault("IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+        app.config.setdefault("IMAGE_WIDTHS", WIDTHS)
+        app.config.setdefault("IMAGE_QUALITY", 80)
+
+        if self.fetcher is None:
+            self.fetcher = HTTPFetcher()
+        self.cache = DiskCache(
+            app.config["IMAGE_CACHE_DIR"], app.config["IMAGE_CACHE_MAX_BYTES"]
+        )
+        self.serializer = URLSafeSerializer(app.config["SECRET_KEY"], salt="images")
+        self.widths = tuple(app.config["IMAGE_WIDTHS"])
+        self.quality = app.config["IMAGE_QUALITY"]
+        self.static_folder = app.static_folder
+        app.extensions["images"] = self
+
+        app.add_url_rule("/images/<token>/<int:width>.<fmt>", "image", self.serve)
+        app.context_processor(
+            lambda: {"image_srcset": self.srcset, "static_srcset": self.static_srcset}
+        )
+
+        cli = AppGroup("images", help="Manage resized image variants.")
+
+        @cli.command("build")
+        @with_appcontext
+        def build_command():
+            """Resize the front page splash for srcset."""
+            for name in build_static_variants(
+                current_app.static_folder, SPLASH, self.widths, self.quality
+            ):
+                click.echo(name)
+
+        app.cli.add_command(cli)
+
+    def srcset(self, src, fmt="jpg"):
+        """srcset attribute value for a remote image, or '' without Pillow."""
+        if not src or Image is None:
+            return ""
+
+        token = self.serializer.dumps(src)
+        return ", ".join(
+            f"{url_for('image', token=token, width=width, fmt=fmt)} {width}w"
+            for width in self.widths
+        )
+
+    def static_srcset(self, path, fmt="jpg"):
+        """srcset for variants written by `flask images build`, if present."""
+        candidates = []
+        for width in self.widths:
+            name = _variant_name(path, width, fmt)
+            if os.path.exists(os.path.join(self.static_folder, name)):
+                candidates.append(f"{url_for('static', filename=name)} {width}w")
+        return ", ".join(candidates)
+
+    def serve(self, token, width, fmt):
+        if fmt not in FORMATS or width not in self.widths:
+            abort(404)
+        try:
+            src = self.serializer.loads(token)
+        except BadSignature:
+            abort(404)
+
+        key = "{}-{}.{}".format(hashlib.sha256(src.encode()).hexdigest(), width, fmt)
+        path = self.cache.get(key)
+        if path is not None:
+            try:
+                return self._send(path, fmt)
+            except FileNotFoundError:
+                # Evicted by another worker in the meantime.
+                pass
+
+        if Image is None:
+            return redirect(src)
+        try:
+            data = resize(self.fetcher(src), width, fmt, self.quality)
+        except Exception:
+            current_app.logger.warning("Could not resize image %s", src)
+            return redirect(src)
+        return self._send(self.cache.put(key, data), fmt)
+
+    def _send(self, path, fmt):
+        response = send_file(path, mimetype=FORMATS[fmt][1], conditional=True)
+        response.headers["Cache-Control"] = "public, max-age=604800"
+        return response
@@ -0,0 +1,299 @@
+# ----------------------------------------------------------------------------#
+# Background jobs.
+#
+# Jobs are rows in the "Job" table, enqueued in the same transaction as the
+# request that creates them. `flask worker` polls for due jobs, claims them
+# (SELECT ... FOR UPDATE SKIP LOCKED on Postgres, a conditional UPDATE on
+# SQLite) and runs them on a thread or process pool, retrying failures with
+# exponential backoff. Running jobs' locks are refreshed while they run; a job
+# whose lock goes stale (its worker died) is taken over by another worker.
+# ----------------------------------------------------------------------------#
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import click
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Set in the parent before forking so pool processes can find the queue.
+_process_queue = None
+
+
+def _run_in_process(job_id):
+    _process_queue.run(job_id)
+
+
+class JobQueue(object):
+    def __init__(self, app=None, db=None, model=None):
+        self.tasks = {}
+        self.db = db
+        self.model = model
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+
+        app.config.setdefault("JOBS_POLL_INTERVAL", 1.0)
+        app.config.setdefault("JOBS_RETRY_DELAY", 10)
+        app.config.setdefault("JOBS_LOCK_TIMEOUT", 600)
+
+        @app.cli.command("worker")
+        @click.option("--concurrency", "-c", default=4, help="Jobs run at once.")
+        @click.option("--processes", is_flag=True, help="Use processes, not threads.")
+        @click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+        def worker_command(concurrency, processes, burst):
+            """Run queued background jobs."""
+            self.work(concurrency, processes, burst)
+
+    def task(self, name=None, max_attempts=3):
+        """Register a function as a job. It receives the payload as kwargs."""
+
+        def decorator(fn):
+            fn.max_attempts = max_attempts
+            self.tasks[name or fn.__name__] = fn
+            return fn
+
+        return decorator
+
+    def enqueue(self, name, payload=None, run_at=None, delay=None):
+        """Add a job to the current session; it is queued when that commits."""
+        if name not in self.tasks:
+            raise KeyError(f"Unknown job {name!r}")
+
+        if run_at is None:
+            run_at = datetime.utcnow() + timedelta(seconds=delay or 0)
+
+        job = self.model(
+            name=name,
+            payload=payload or {},
+            status=QUEUED,
+            attempts=0,
+            max_attempts=self.tasks[name].max_attempts,
+            run_at=run_at,
+        )
+        self.db.session.add(job)
+        return job
+
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def claim(self, limit, worker):
+        """Mark up to `limit` due jobs as running and return their ids."""
+        Job = self.model
+        session = self.db.session
+        now = datetime.utcnow()
+
+        due = (
+            session.query(Job.id)
+            .filter(Job.status == QUEUED, Job.run_at <= now)
+            .order_by(Job.run_at)
+            .limit(limit)
+        )
+
+        if session.get_bind().dialect.name == "postgresql":
+            ids = [id for id, in due.with_for_update(skip_locked=True)]
+            if ids:
+                session.query(Job).filter(Job.id.in_(ids)).update(
+                    {
+                        "status": RUNNING,
+                        "locked_at": now,
+                        "locked_by": worker,
+                        "attempts": Job.attempts + 1,
+                    },
+                    synchronize_session=False,
+                )
+        else:
+            # SQLite has no row locks: claim each candidate with an UPDATE
+            # that only succeeds while it is still queued.
+            ids = []
+            for id, in due.all():
+                claimed = (
+                    session.query(Job)
+                    .filter(Job.id == id, Job.status == QUEUED)
+                    .update(
+                        {
+                            "status": RUNNING,
+                            "locked_at": now,
+                            "locked_by": worker,
+                            "attempts": Job.attempts + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                if claimed:
+                    ids.append(id)
+
+        session.commit()
+        return ids
+
+    def requeue_stale(self):
+        """Put back jobs whose worker died while running them.
+
+        The lost run counts as an attempt (claim() counted it), so a job
+        that keeps killing its worker fails once it has used them all.
+        Returns (requeued, failed) counts.
+        """
+        Job = self.model
+        now = datetime.utcnow()
+        timeout = self.app.config["JOBS_LOCK_TIMEOUT"]
+        stale = self.db.session.query(Job).filter(
+            Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=timeout)
+        )
+        error = f"No heartbeat within {timeout}s; its worker died."
+
+        failed = stale.filter(Job.attempts >= Job.max_attempts).update(
+            {
+                "status": FAILED,
+                "locked_by": None,
+                "finished_at": now,
+                "last_error": error,
+            },
+            synchronize_session=False,
+        )
+        requeued = stale.update(
+            {"status": QUEUED, "locked_by": None, "run_at": now, "last_error": error},
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+
+        if failed or requeued:
+            self.app.logger.warning(
+                "Took over %s stale jobs: %s requeued, %s failed",
+                failed + requeued,
+                requeued,
+                failed,
+            )
+        return requeued, failed
+
+    def heartbeat(self, ids, worker):
+        """Refresh the locks of the jobs `worker` is still running."""
+        if not ids:
+            return
+        Job = self.model
+        self.db.session.query(Job).filter(
+            Job.id.in_(ids), Job.status == RUNNING, Job.locked_by == worker
+        ).update({"locked_at": datetime.utcnow()}, synchronize_session=False)
+        self.db.session.commit()
+
+    def run(self, job_id):
+        with self.app.app_context():
+            job = self.model.query.get(job_id)
+            if job is None or job.status != RUNNING:
+                return
+
+            try:
+                self.tasks[job.name](**(job.payload or {}))
+            except Exception:
+                self.db.session.rollback()
+                job = self.model.query.get(job_id)
+                job.last_error = traceback.format_exc()[-4000:]
+                if job.attempts < job.max_attempts:
+                    delay = self.app.config["JOBS_RETRY_DELAY"] * 2 ** (
+                        job.attempts - 1
+                    )
+                    job.status = QUEUED
+                    job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+                else:
+                    job.status = FAILED
+                    job.finished_at = datetime.utcnow()
+                self.app.logger.exception("Job %s (%s) failed", job_id, job.name)
+            else:
+                job.status = DONE
+                job.finished_at = datetime.utcnow()
+                job.last_error = None
+            finally:
+                job.locked_by = None
+                self.db.session.commit()
+
+    def work(self, concurrency=4, processes=False, burst=False):
+        global _process_queue
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        poll_interval = self.app.config["JOBS_POLL_INTERVAL"]
+        # Often enough that the locks of jobs still running never go stale.
+        maintain_interval = self.app.config["JOBS_LOCK_TIMEOUT"] / 2
+
+        if processes:
+            _process_queue = self
+            executor = ProcessPoolExecutor(
+                concurrency,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+            submit = lambda job_id: executor.submit(_run_in_process, job_id)
+        else:
+            executor = ThreadPoolExecutor(concurrency)
+            submit = lambda job_id: executor.submit(self.run, job_id)
+
+        # Future -> id of the job it runs.
+        running = {}
+        maintained = None
+        try:
+            while True:
+                running = {
+                    future: job_id
+                    for future, job_id in running.items()
+                    if not future.done()
+                }
+                if (
+                    maintained is None
+                    or time.monotonic() - maintained >= maintain_interval
+                ):
+                    with self.app.app_context():
+                        self.heartbeat(list(running.values()), worker)
+                        self.requeue_stale()
+                    maintained = time.monotonic()
+
+                free = concurrency - len(running)
+
+                ids = []
+                if free:
+                    with self.app.app_context():
+                        ids = self.claim(free, worker)
+                        if processes and ids:
+                            # Pool processes are forked on demand; they must
+                            # not inherit (and later close) our connections.
+                            self.db.engine.dispose()
+                running.update((submit(job_id), job_id) for job_id in ids)
+
+                if burst and not ids and not running:
+                    break
+                if not ids:
+                    if running:
+                        wait(
+                            list(running),
+                            timeout=poll_interval,
+                            return_when="FIRST_COMPLETED",
+                        )
+                    else:
+                        time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True)
+
+    def status(self, job_id):
+        job = self.model.query.get(job_id)
+        if job is None:
+            return None
+
+        return {
+            "id": job.id,
+            "name": job.name,
+            "status": job.status,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "run_at": job.run_at.isoformat() if job.run_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            "error": job.last_error.splitlines()[-1] if job.last_error else None,
+        }
@@ -0,0 +1,218 @@
+# ----------------------------------------------------------------------------#
+# Structured, non-blocking logging.
+#
+# Records are formatted as JSON lines carrying the request id, route, latency
+# and number of SQL statements of the request that emitted them. Handlers on
+# the request thread only put records on a bounded queue; a QueueListener
+# thread writes them to a rotating file. Per-logger sampling and rate limits
+# keep an error storm from flooding the queue, and a full queue drops records
+# instead of blocking.
+# ----------------------------------------------------------------------------#
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.pathname}:{record.lineno}",
+        }
+        data.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RESERVED and not key.startswith("_")
+        )
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request's id, route and timings to every record."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, "request_id", None)
+            record.route = request.endpoint
+            record.method = request.method
+            record.path = request.path
+            if "request_started" in g and not hasattr(record, "latency_ms"):
+                elapsed = time.perf_counter() - g.request_started
+                record.latency_ms = round(elapsed * 1000, 2)
+                record.db_statements = g.db_statements
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of each logger's records, at most `rate` per second.
+
+    `sampling` maps logger names to the fraction of records kept. Records
+    at ERROR and above are always sampled in and have a rate limit of their
+    own, so a busy logger's other records can't crowd them out. Dropped
+    records are summarized once the window passes.
+    """
+
+    def __init__(self, sampling=None, rate=100):
+        super().__init__()
+        self.sampling = sampling or {}
+        self.rate = rate
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _fraction(self, name):
+        while name:
+            if name in self.sampling:
+                return self.sampling[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR:
+            if random.random() >= self._fraction(record.name):
+                return False
+
+        if not self.rate:
+            return True
+
+        key = (record.name, record.levelno >= logging.ERROR)
+        now = int(time.monotonic())
+        with self._lock:
+            second, count, dropped = self._windows.get(key, (now, 0, 0))
+            if second != now:
+                if dropped:
+                    record.dropped_records = dropped
+                second, count, dropped = now, 0, 0
+
+            if count >= self.rate:
+                self._windows[key] = (second, count, dropped + 1)
+                return False
+
+            self._windows[key] = (second, count + 1, dropped)
+            return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking on a full queue."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Format the message here, but keep exc_info for the JSON formatter.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _file_handler(config):
+    if config["LOG_ROTATION"] == "time":
+        return TimedRotatingFileHandler(
+            config["LOG_FILE"],
+            when=config["LOG_ROTATE_WHEN"],
+            backupCount=config["LOG_BACKUP_COUNT"],
+        )
+    return RotatingFileHandler(
+        config["LOG_FILE"],
+        maxBytes=config["LOG_MAX_BYTES"],
+        backupCount=config["LOG_BACKUP_COUNT"],
+    )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and "db_statements" in g:
+        g.db_statements += 1
+
+
+def configure_logging(app):
+    app.config.setdefault("LOG_FILE", "error.log")
+    app.config.setdefault("LOG_LEVEL", "INFO")
+    app.config.setdefault("LOG_ROTATION", "size")
+    app.config.setdefault("LOG_MAX_BYTES", 10 * 1024 * 1024)
+    app.config.setdefault("LOG_ROTATE_WHEN", "midnight")
+    app.config.setdefault("LOG_BACKUP_COUNT", 5)
+    app.config.setdefault("LOG_QUEUE_SIZE", 10000)
+    app.config.setdefault("LOG_SAMPLING", {})
+    app.config.setdefault("LOG_RATE_LIMIT", 100)
+    app.config.setdefault("LOG_REQUESTS", not app.debug)
+
+    # A child of app.logger, so access records go through the same handlers
+    # but are sampled and rate limited separately from the app's own.
+    access_logger = app.logger.getChild("access")
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.db_statements = 0
+
+    @app.after_request
+    def finish_request_log(response):
+        if "request_started" not in g:
+            return response
+
+        g.latency_ms = round((time.perf_counter() - g.request_started) * 1000, 2)
+        response.headers["X-Request-ID"] = g.request_id
+
+        if app.config["LOG_REQUESTS"]:
+            access_logger.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                response.status_code,
+                extra={
+                    "status": response.status_code,
+                    "latency_ms": g.latency_ms,
+                    "db_statements": g.db_statements,
+                },
+            )
+        return response
+
+    if app.debug:
+        return
+
+    handler = _file_handler(app.config)
+    handler.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(queue.Queue(app.config["LOG_QUEUE_SIZE"]))
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(
+        SamplingFilter(app.config["LOG_SAMPLING"], app.config["LOG_RATE_LIMIT"])
+    )
+
+    listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(app.config["LOG_LEVEL"])
+    app.logger.addHandler(queue_handler)
+    app.extensions["log_listener"] = listener
@@ -0,0 +1,328 @@
+# ----------------------------------------------------------------------------#
+# Artist <-> venue matchmaking.
+#
+# Every artist and venue is held in memory as a row of NumPy arrays: a genre
+# bit-vector, interned city/state codes and its "seeking" flag. A
+# recommendation scores all candidates of the other kind in one vectorized
+# pass and keeps the top K with argpartition. Writes are picked up
+# incrementally from the ChangeFeed, including shows moved to another venue
+# or artist; a full rebuild every MATCHMAKING_REFRESH_SECONDS, on a
+# background thread (see background.py), catches writes made by other worker
+# processes.
+# ----------------------------------------------------------------------------#
+import threading
+from collections import defaultdict
+
+import numpy as np
+from werkzeug.exceptions import ServiceUnavailable
+
+from background import Rebuilder
+from forms import genre_options
+
+GENRES = [genre for genre, _ in genre_options]
+GENRE_BITS = {genre: np.uint32(1 << i) for i, genre in enumerate(GENRES)}
+assert len(GENRES) <= 32, "genre bit-vectors are 32 bits wide"
+
+# Bits set in each 16-bit value, for vectorized popcount.
+_POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+WEIGHTS = {"genre": 3.0, "city": 2.0, "state": 1.0, "history": 1.5}
+
+
+def genre_mask(genres):
+    mask = np.uint32(0)
+    for genre in genres or ():
+        mask |= GENRE_BITS.get(genre, np.uint32(0))
+    return mask
+
+
+def popcount(masks):
+    masks = np.asarray(masks, dtype=np.uint32)
+    return _POPCOUNT16[masks & 0xFFFF] + _POPCOUNT16[masks >> 16]
+
+
+class _Table(object):
+    """Columnar storage for one side (artists or venues)."""
+
+    def __init__(self, capacity=1024):
+        self.rows = {}
+        self.free = []
+        self.size = 0
+        self.names = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(old, dtype, fill):
+            new = np.full(capacity, fill, dtype=dtype)
+            if old is not None:
+                new[: len(old)] = old
+            return new
+
+        self.ids = grow(getattr(self, "ids", None), np.int64, -1)
+        self.masks = grow(getattr(self, "masks", None), np.uint32, 0)
+        self.cities = grow(getattr(self, "cities", None), np.int32, -1)
+        self.states = grow(getattr(self, "states", None), np.int32, -1)
+        self.seeking = grow(getattr(self, "seeking", None), np.bool_, False)
+        self.names.extend([None] * (capacity - len(self.names)))
+
+    def upsert(self, id, name, mask, city, state, seeking):
+        row = self.rows.get(id)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                if self.size == len(self.ids):
+                    self._allocate(len(self.ids) * 2)
+                row = self.size
+                self.size += 1
+            self.rows[id] = row
+
+        self.ids[row] = id
+        self.names[row] = name
+        self.masks[row] = mask
+        self.cities[row] = city
+        self.states[row] = state
+        self.seeking[row] = seeking
+
+    def remove(self, id):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        self.ids[row] = -1
+        self.names[row] = None
+        self.seeking[row] = False
+        self.free.append(row)
+
+
+class Matchmaker(object):
+    def __init__(self, db, Venue, Artist, Show, refresh_interval=300):
+        self.db = db
+        self.Venue = Venue
+        self.Artist = Artist
+        self.Show = Show
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._built = False
+        self._dirty = {"Venue": set(), "Artist": set()}
+        # Changes committed while a rebuild loads, replayed onto its result.
+        self._pending = None
+
+    def init_app(self, app, changes):
+        app.config.setdefault("MATCHMAKING_REFRESH_SECONDS", self.refresh_interval)
+        self.refresh_interval = app.config["MATCHMAKING_REFRESH_SECONDS"]
+        self.rebuilder = Rebuilder(
+            app, self.rebuild, self.refresh_interval, "matchmaking"
+        )
+        changes.on_commit(self._on_commit)
+
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def _code(self, codes, value):
+        return codes.setdefault(value, len(codes))
+
+    def _load(self, table, rows, seeking_attr, cities, states):
+        for row in rows:
+            state = (row.state or "").upper()
+            table.upsert(
+                row.id,
+                row.name,
+                genre_mask(row.genres),
+                self._code(cities, ((row.city or "").lower(), state)),
+                self._code(states, state),
+                bool(getattr(row, seeking_attr)),
+            )
+
+    def _query(self, model, seeking_attr, ids=None):
+        query = model.query.with_entities(
+            model.id,
+            model.name,
+            model.genres,
+            model.city,
+            model.state,
+            # NULL means "not seeking".
+            self.db.func.coalesce(getattr(model, seeking_attr), False).label(
+                seeking_attr
+            ),
+        )
+        if ids is not None:
+            query = query.filter(model.id.in_(ids))
+        return query.all()
+
+    def rebuild(self):
+        """Reload everything, then swap it in; runs on the rebuild thread."""
+        with self._lock:
+            self._pending = []
+        try:
+            cities, states = {}, {}
+            venues, artists = _Table(), _Table()
+            self._load(
+                venues,
+                self._query(self.Venue, "seeking_talent"),
+                "seeking_talent",
+                cities,
+                states,
+            )
+            self._load(
+                artists,
+                self._query(self.Artist, "seeking_venue"),
+                "seeking_venue",
+                cities,
+                states,
+            )
+
+            Show = self.Show
+            history = {"Venue": defaultdict(dict), "Artist": defaultdict(dict)}
+            for venue_id, artist_id, count in (
+                Show.query.with_entities(
+                    Show.venue_id, Show.artist_id, self.db.func.count(Show.id)
+                )
+                .group_by(Show.venue_id, Show.artist_id)
+                .all()
+            ):
+                history["Venue"][venue_id][artist_id] = count
+                history["Artist"][artist_id][venue_id] = count
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._cities, self._states = cities, states
+            self.venues, self.artists = venues, artists
+            self.history = history
+            self._dirty = {"Venue": set(), "Artist": set()}
+            self._built = True
+            self._apply(pending)
+
+    def _refresh(self):
+        for kind, table, model, seeking_attr in (
+            ("Venue", self.venues, self.Venue, "seeking_talent"),
+            ("Artist", self.artists, self.Artist, "seeking_venue"),
+        ):
+            ids = self._dirty[kind]
+            if not ids:
+                continue
+            self._dirty[kind] = set()
+
+            rows = self._query(model, seeking_attr, ids)
+            for missing in ids - {row.id for row in rows}:
+                table.remove(missing)
+            self._load(table, rows, seeking_attr, self._cities, self._states)
+
+    def _on_commit(self, changes):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            if self._built:
+                self._apply(changes)
+
+    def _apply(self, changes):
+        for change in changes:
+            if change.model in self._dirty:
+                self._dirty[change.model].add(change.id)
+            elif change.model == "Show":
+                self._apply_show(change)
+
+    def _count(self, venue_id, artist_id, delta):
+        for kind, a, b in (
+            ("Venue", venue_id, artist_id),
+            ("Artist", artist_id, venue_id),
+        ):
+            counts = self.history[kind][a]
+            counts[b] = counts.get(b, 0) + delta
+            if counts[b] <= 0:
+                del counts[b]
+
+    def _apply_show(self, change):
+        values = change.values
+        if change.op == "update":
+            if change.previous is None:
+                # Can't tell whether the show moved.
+                self.rebuilder.request()
+                return
+            if not {"venue_id", "artist_id"} & set(change.previous):
+                return
+            # Move the show's history from its old venue and artist.
+            old = dict(values, **change.previous)
+            pairs = ((old, -1), (values, 1))
+        else:
+            pairs = ((values, 1 if change.op == "insert" else -1),)
+
+        for row, delta in pairs:
+            try:
+                venue_id = int(row["venue_id"])
+                artist_id = int(row["artist_id"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._count(venue_id, artist_id, delta)
+
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def _recommend(self, source, targets, kind, id, limit):
+        row = source.rows.get(id)
+        if row is None:
+            return None
+
+        n = targets.size
+        mask = source.masks[row]
+        wanted = max(int(popcount(mask)), 1)
+
+        genre = popcount(targets.masks[:n] & mask) / wanted
+        same_state = targets.states[:n] == source.states[row]
+        same_city = targets.cities[:n] == source.cities[row]
+
+        history = np.zeros(n, dtype=np.float64)
+        for other_id, count in self.history[kind].get(id, {}).items():
+            other = targets.rows.get(other_id)
+            if other is not None:
+                history[other] = np.log1p(count)
+
+        scores = (
+            WEIGHTS["genre"] * genre
+            + WEIGHTS["city"] * same_city
+            + WEIGHTS["state"] * same_state
+            + WEIGHTS["history"] * history
+        )
+        scores[~targets.seeking[:n]] = -np.inf
+
+        limit = min(limit, int(targets.seeking[:n].sum()))
+        if limit <= 0:
+            return []
+
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            {
+                "id": int(targets.ids[i]),
+                "name": targets.names[i],
+                "score": round(float(scores[i]), 3),
+            }
+            for i in top
+        ]
+
+    def _wait(self):
+        if not self.rebuilder.wait():
+            raise ServiceUnavailable(retry_after=5)
+
+    def artists_for_venue(self, venue_id, limit=10):
+        """Top artists seeking a venue for `venue_id`, or None if unknown."""
+        self._wait()
+        with self._lock:
+            self._refresh()
+            return self._recommend(
+                self.venues, self.artists, "Venue", venue_id, limit
+            )
+
+    def venues_for_artist(self, artist_id, limit=10):
+        """Top venues seeking talent for `artist_id`, or None if unknown."""
+        self._wait()
+        with self._lock:
+            self._refresh()
+            return self._recommend(
+                self.artists, self.venues, "Artist", artist_id, limit
+            )
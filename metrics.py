@@ -0,0 +1,355 @@
+# ----------------------------------------------------------------------------#
+# Prometheus metrics shared across worker processes.
+#
+# Every process writes its own values to memory-mapped files in METRICS_DIR
+# (counter_<pid>.db and gauge_<pid>.db): a write is a struct.pack_into on the
+# mapping, with no locks shared between processes. GET /metrics reads all the
+# files and sums them per series, so any worker can answer a scrape for the
+# whole server. When gunicorn reaps a worker (see gunicorn.conf.py) its
+# counters are folded into counter_archive.db, keeping totals monotonic, and
+# its gauges are dropped.
+# ----------------------------------------------------------------------------#
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct("I4x")
+_LENGTH = struct.Struct("I")
+_VALUE = struct.Struct("d")
+
+
+def _entries(data):
+    """Yield (key, value, value offset) from a values file's bytes."""
+    used = _HEADER.unpack_from(data, 0)[0]
+    pos = _HEADER.size
+    while pos < used:
+        length = _LENGTH.unpack_from(data, pos)[0]
+        key = data[pos + 4 : pos + 4 + length].decode("utf-8")
+        pos += 4 + length + (-(4 + length) % 8)
+        yield key, _VALUE.unpack_from(data, pos)[0], pos
+        pos += 8
+
+
+class MmapValues(object):
+    """Float values by key in a file that only this process writes.
+
+    A new entry's bytes are written before the header's used length is moved
+    past them, so readers in other processes never see a partial entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        if _HEADER.unpack_from(self._map, 0)[0] == 0:
+            _HEADER.pack_into(self._map, 0, _HEADER.size)
+        self._offsets = {key: pos for key, _, pos in _entries(self._map)}
+
+    def _offset(self, key):
+        pos = self._offsets.get(key)
+        if pos is not None:
+            return pos
+
+        encoded = key.encode("utf-8")
+        padded = 4 + len(encoded) + (-(4 + len(encoded)) % 8)
+        used = _HEADER.unpack_from(self._map, 0)[0]
+        while used + padded + 8 > len(self._map):
+            size = len(self._map) * 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        _LENGTH.pack_into(self._map, used, len(encoded))
+        self._map[used + 4 : used + 4 + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, used + padded, 0.0)
+        _HEADER.pack_into(self._map, 0, used + padded + 8)
+        self._offsets[key] = pos = used + padded
+        return pos
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            pos = self._offset(key)
+            value = _VALUE.unpack_from(self._map, pos)[0]
+            _VALUE.pack_into(self._map, pos, value + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            _VALUE.pack_into(self._map, self._offset(key), value)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def read_values(path):
+    """{key: value} of a values file, read without mapping it."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return {}
+    return {key: value for key, value, _ in _entries(data)}
+
+
+@contextmanager
+def _directory_lock(directory, exclusive):
+    with open(os.path.join(directory, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def mark_process_dead(pid, directory):
+    """Fold a dead process's counters into the archive; drop its gauges."""
+    with _directory_lock(directory, exclusive=True):
+        path = os.path.join(directory, f"counter_{pid}.db")
+        if os.path.exists(path):
+            archive = MmapValues(os.path.join(directory, "counter_archive.db"))
+            try:
+                for key, value in read_values(path).items():
+                    archive.inc(key, value)
+            finally:
+                archive.close()
+            os.remove(path)
+
+        path = os.path.join(directory, f"gauge_{pid}.db")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def reset(directory):
+    """Remove all values files, e.g. when the server (re)starts."""
+    os.makedirs(directory, exist_ok=True)
+    with _directory_lock(directory, exclusive=True):
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class Metrics(object):
+    def __init__(self, app=None):
+        self.families = {}
+        self.cache_sources = []
+        self._pid = None
+        self._files = {}
+        self._synced_at = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.config.setdefault("METRICS_DIR", os.path.join(app.root_path, "metrics"))
+        app.config.setdefault("METRICS_CACHE_SYNC_SECONDS", 1.0)
+
+        self.directory = app.config["METRICS_DIR"]
+        self.sync_interval = app.config["METRICS_CACHE_SYNC_SECONDS"]
+        if not app.config["METRICS_ENABLED"]:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.counter(
+            "fyyur_http_requests_total",
+            "Requests handled, by endpoint, method and status.",
+        )
+        self.histogram(
+            "fyyur_http_request_duration_seconds",
+            "Time until the response was returned, by endpoint.",
+        )
+        self.counter(
+            "fyyur_db_seconds_total", "Time spent in SQL statements, by endpoint."
+        )
+        self.counter("fyyur_db_statements_total", "SQL statements, by endpoint.")
+        self.counter("fyyur_cache_hits_total", "Cache hits, by cache.")
+        self.counter("fyyur_cache_misses_total", "Cache misses, by cache.")
+        self.counter("fyyur_cache_evictions_total", "Cache evictions, by cache.")
+        self.gauge("fyyur_cache_entries", "Entries held, by cache.")
+        self.gauge("fyyur_cache_bytes", "Approximate bytes held, by cache.")
+
+        @app.before_request
+        def start_metrics():
+            g.metrics_started = time.perf_counter()
+            g.db_seconds = 0.0
+            g.db_count = 0
+
+        @app.after_request
+        def record_metrics(response):
+            if "metrics_started" in g:
+                self.record_request(response)
+            return response
+
+        @app.route("/metrics")
+        def metrics():
+            return Response(
+                self.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+            )
+
+    # Definitions
+    # ------------------------------------------------------------------
+
+    def counter(self, name, help):
+        self.families[name] = ("counter", help, None)
+
+    def gauge(self, name, help):
+        self.families[name] = ("gauge", help, None)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self.families[name] = ("histogram", help, tuple(buckets))
+
+    def track_caches(self, source):
+        """Export stats of the TTLCaches that `source()` yields as (name, cache)."""
+        self.cache_sources.append(source)
+
+    # Recording
+    # ------------------------------------------------------------------
+
+    def _values(self, kind):
+        # Files are per process; a forked worker opens its own.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._files = {}
+        values = self._files.get(kind)
+        if values is None:
+            path = os.path.join(self.directory, f"{kind}_{self._pid}.db")
+            values = self._files[kind] = MmapValues(path)
+        return values
+
+    def inc(self, name, amount=1.0, **labels):
+        self._values("counter").inc(_key(name, labels), amount)
+
+    def set(self, name, value, **labels):
+        kind = "gauge" if self.families[name][0] == "gauge" else "counter"
+        self._values(kind).set(_key(name, labels), value)
+
+    def observe(self, name, value, **labels):
+        buckets = self.families[name][2]
+        index = bisect_left(buckets, value)
+        le = str(buckets[index]) if index < len(buckets) else "+Inf"
+        values = self._values("counter")
+        values.inc(_key(f"{name}_bucket", dict(labels, le=le)))
+        values.inc(_key(f"{name}_sum", labels), value)
+        values.inc(_key(f"{name}_count", labels))
+
+    def record_request(self, response):
+        endpoint = request.endpoint or "unmatched"
+        self.inc(
+            "fyyur_http_requests_total",
+            endpoint=endpoint,
+            method=request.method,
+            status=str(response.status_code),
+        )
+        self.observe(
+            "fyyur_http_request_duration_seconds",
+            time.perf_counter() - g.metrics_started,
+            endpoint=endpoint,
+        )
+        if g.db_count:
+            self.inc("fyyur_db_seconds_total", g.db_seconds, endpoint=endpoint)
+            self.inc("fyyur_db_statements_total", g.db_count, endpoint=endpoint)
+
+        now = time.monotonic()
+        if now - self._synced_at >= self.sync_interval:
+            self._synced_at = now
+            self.sync_caches()
+
+    def sync_caches(self):
+        # Each process's cache counters only grow, so its file holds the
+        # running totals, summed across processes on scrape.
+        for source in self.cache_sources:
+            for name, cache in source():
+                stats = cache.stats()
+                self.set("fyyur_cache_hits_total", stats["hits"], cache=name)
+                self.set("fyyur_cache_misses_total", stats["misses"], cache=name)
+                self.set("fyyur_cache_evictions_total", stats["evictions"], cache=name)
+                self.set("fyyur_cache_entries", stats["entries"], cache=name)
+                self.set("fyyur_cache_bytes", stats["bytes"], cache=name)
+
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def collect(self):
+        """{(name, labels): value} summed over every process's files."""
+        totals = {}
+        with _directory_lock(self.directory, exclusive=False):
+            for path in glob.glob(os.path.join(self.directory, "*.db")):
+                for key, value in read_values(path).items():
+                    name, labels = json.loads(key)
+                    series = (name, tuple(tuple(label) for label in labels))
+                    totals[series] = totals.get(series, 0.0) + value
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        if self.cache_sources:
+            self.sync_caches()
+        totals = self.collect()
+
+        lines = []
+        for name, (kind, help, buckets) in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                lines.extend(self._render_histogram(name, buckets, totals))
+            else:
+                for (series, labels), value in sorted(totals.items()):
+                    if series == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(self, name, buckets, totals):
+        label_sets = sorted(
+            labels for series, labels in totals if series == f"{name}_count"
+        )
+        for labels in label_sets:
+            cumulative = 0.0
+            for bound in [str(bucket) for bucket in buckets] + ["+Inf"]:
+                with_le = labels + (("le", bound),)
+                cumulative += totals.get((f"{name}_bucket", tuple(sorted(with_le))), 0)
+                yield f"{name}_bucket{_format_labels(with_le)} {cumulative}"
+            for suffix in ("_sum", "_count"):
+                value = totals[(name + suffix, labels)]
+                yield f"{name}{suffix}{_format_labels(labels)} {value}"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("statement_started", None)
+    if started is not None and has_request_context() and "db_seconds" in g:
+        g.db_seconds += time.perf_counter() - started
+        g.db_count += 1
@@ -22,6 +22,7 @@ logger = logging.getLogger('alembic.env')
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from flask import current_app
+import backfill
 config.set_main_option(
     'sqlalchemy.url',
     str(current_app.extensions['migrate'].db.engine.url).replace('%', '%%'))
@@ -53,6 +54,13 @@ def run_migrations_offline():
     with context.begin_transaction():
         context.run_migrations()
 
+        # Backfills can't run against a script: remind whoever applies it.
+        if backfill.scheduled:
+            output = context.get_context().impl.static_output
+            output('-- Scheduled backfills: %s' % ', '.join(backfill.scheduled))
+            output('-- Once this script is applied, run: flask backfill run')
+            del backfill.scheduled[:]
+
 
 def run_migrations_online():
     """Run migrations in 'online' mode.
@@ -89,6 +97,18 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+        # Data backfills run after the DDL has committed, in batches of their
+        # own, so they never hold the migration's locks.
+        backfills = current_app.extensions['backfill']
+        if backfill.scheduled and current_app.config['BACKFILL_ON_MIGRATE']:
+            backfill.run_pending(
+                connection,
+                backfill.scheduled,
+                echo=logger.info,
+                **backfills.options()
+            )
+        del backfill.scheduled[:]
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,134 @@
+"""normalized phone numbers and listing keys
+
+Revision ID: 94d200cf34ba
+Revises: 396e8c3a8c9a
+Create Date: 2026-10-19 09:10:12.118305
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import phonenumbers
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '94d200cf34ba'
+down_revision = '396e8c3a8c9a'
+branch_labels = None
+depends_on = None
+
+
+# Normalization as of this revision, copied from normalize.py so later changes
+# there can't change what this migration writes.
+_non_word = re.compile(r'[^a-z0-9]+')
+
+_address_abbreviations = {
+    'street': 'st',
+    'avenue': 'ave',
+    'road': 'rd',
+    'boulevard': 'blvd',
+    'drive': 'dr',
+    'lane': 'ln',
+    'place': 'pl',
+    'court': 'ct',
+    'square': 'sq',
+    'highway': 'hwy',
+    'parkway': 'pkwy',
+    'north': 'n',
+    'south': 's',
+    'east': 'e',
+    'west': 'w',
+    'suite': 'ste',
+}
+
+
+def phone_e164(raw, region='US'):
+    try:
+        number = phonenumbers.parse(raw, region)
+    except phonenumbers.NumberParseException as e:
+        raise ValueError(str(e))
+
+    if not phonenumbers.is_valid_number(number):
+        raise ValueError(f'Invalid phone number: {raw}')
+
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def _words(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = value.encode('ascii', 'ignore').decode('ascii').lower()
+    value = value.replace('&', ' and ')
+    return _non_word.sub(' ', value).split()
+
+
+def name_key(name):
+    words = _words(name)
+    if words and words[0] == 'the':
+        words = words[1:]
+    return ' '.join(words)
+
+
+def address_key(address):
+    return ' '.join(_address_abbreviations.get(w, w) for w in _words(address))
+
+
+venue = sa.table('Venue',
+                 sa.column('id', sa.Integer),
+                 sa.column('name', sa.String),
+                 sa.column('address', sa.String),
+                 sa.column('phone', sa.String),
+                 sa.column('name_key', sa.String),
+                 sa.column('address_key', sa.String))
+
+artist = sa.table('Artist',
+                  sa.column('id', sa.Integer),
+                  sa.column('name', sa.String),
+                  sa.column('phone', sa.String),
+                  sa.column('name_key', sa.String))
+
+
+def _phone(raw):
+    try:
+        return phone_e164(raw)
+    except ValueError:
+        # Leave numbers we can't make sense of as they were typed.
+        return raw
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('name_key', sa.String(length=120), nullable=True))
+    op.add_column('Venue', sa.Column('address_key', sa.String(length=120), nullable=True))
+    op.add_column('Artist', sa.Column('name_key', sa.String(length=120), nullable=True))
+
+    connection = op.get_bind()
+
+    for row in connection.execute(sa.select([venue.c.id, venue.c.name, venue.c.address, venue.c.phone])):
+        connection.execute(venue.update().where(venue.c.id == row.id).values(
+            name_key=name_key(row.name),
+            address_key=address_key(row.address),
+            phone=_phone(row.phone),
+        ))
+
+    for row in connection.execute(sa.select([artist.c.id, artist.c.name, artist.c.phone])):
+        connection.execute(artist.update().where(artist.c.id == row.id).values(
+            name_key=name_key(row.name),
+            phone=_phone(row.phone),
+        ))
+
+    op.create_index('ix_Venue_name_key_address_key', 'Venue', ['name_key', 'address_key'], unique=False)
+    op.create_index('ix_Venue_phone', 'Venue', ['phone'], unique=False)
+    op.create_index('ix_Artist_name_key_city_state', 'Artist', ['name_key', 'city', 'state'], unique=False)
+    op.create_index('ix_Artist_phone', 'Artist', ['phone'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_phone', table_name='Artist')
+    op.drop_index('ix_Artist_name_key_city_state', table_name='Artist')
+    op.drop_index('ix_Venue_phone', table_name='Venue')
+    op.drop_index('ix_Venue_name_key_address_key', table_name='Venue')
+
+    op.drop_column('Artist', 'name_key')
+    op.drop_column('Venue', 'address_key')
+    op.drop_column('Venue', 'name_key')
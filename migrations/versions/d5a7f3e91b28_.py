@@ -0,0 +1,134 @@
+"""partition Show by month
+
+Revision ID: d5a7f3e91b28
+Revises: c41e9a7b2f60
+Create Date: 2026-10-19 13:05:22.671904
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a7f3e91b28'
+down_revision = 'c41e9a7b2f60'
+branch_labels = None
+depends_on = None
+
+
+# The partition DDL as of this revision, kept here so later changes to
+# partitions.py can't change what this migration does.
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def create_partition(month):
+    # The default partition is still empty, so no rows need moving.
+    lower = datetime(month.year, month.month, 1)
+    upper = add_months(lower, 1)
+    op.execute(
+        f'CREATE TABLE IF NOT EXISTS "Show_y{lower.year}m{lower.month:02d}" '
+        f'PARTITION OF "Show" FOR VALUES FROM (\'{lower}\') TO (\'{upper}\')'
+    )
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # Keep the id sequence alive while the old table is replaced.
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.rename_table('Show', 'Show_unpartitioned')
+    op.execute('ALTER TABLE "Show_unpartitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_unpartitioned_pkey"')
+
+    # The partition key has to be part of the primary key.
+    op.execute('''
+        CREATE TABLE "Show" (
+            id INTEGER NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            venue_id INTEGER NOT NULL,
+            artist_id INTEGER NOT NULL,
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time),
+            CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id) REFERENCES "Venue" (id),
+            CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id) REFERENCES "Artist" (id)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    months = {
+        month for month, in conn.execute(
+            "SELECT DISTINCT date_trunc('month', start_time) FROM \"Show_unpartitioned\" "
+            "WHERE start_time IS NOT NULL"
+        )
+    }
+    this_month = datetime.now()
+    months |= {add_months(this_month, offset) for offset in range(13)}
+    for month in sorted(months):
+        create_partition(month)
+
+    # Shows without a start time have no partition to go to. They are kept
+    # aside in "Show_undated" for someone to date or delete by hand, and put
+    # back by the downgrade.
+    op.create_table('Show_undated',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        'INSERT INTO "Show_undated" (id, venue_id, artist_id, start_time) '
+        'SELECT id, venue_id, artist_id, start_time FROM "Show_unpartitioned" '
+        'WHERE start_time IS NULL'
+    )
+    op.execute(
+        'INSERT INTO "Show" (id, venue_id, artist_id, start_time) '
+        'SELECT id, venue_id, artist_id, start_time FROM "Show_unpartitioned" '
+        'WHERE start_time IS NOT NULL'
+    )
+    op.drop_table('Show_unpartitioned')
+
+    op.create_table('Show_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Show_archive_venue_id_start_time', 'Show_archive', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_archive_artist_id_start_time', 'Show_archive', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.rename_table('Show', 'Show_partitioned')
+    op.execute('ALTER TABLE "Show_partitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_partitioned_pkey"')
+    op.create_table('Show',
+    sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], name='Show_artist_id_fkey'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], name='Show_venue_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='Show_pkey')
+    )
+    op.execute(
+        'INSERT INTO "Show" (id, venue_id, artist_id, start_time) '
+        'SELECT id, venue_id, artist_id, start_time FROM "Show_partitioned" '
+        'UNION ALL SELECT id, venue_id, artist_id, start_time FROM "Show_archive" '
+        'UNION ALL SELECT id, venue_id, artist_id, start_time FROM "Show_undated"'
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.drop_table('Show_undated')
+    op.drop_table('Show_archive')
+    # Drops every partition along with it.
+    op.execute('DROP TABLE "Show_partitioned"')
@@ -0,0 +1,86 @@
+# ----------------------------------------------------------------------------#
+# Canonical forms used for storage and duplicate detection.
+# ----------------------------------------------------------------------------#
+import re
+import unicodedata
+
+DEFAULT_REGION = "US"
+
+_non_word = re.compile(r"[^a-z0-9]+")
+
+_address_abbreviations = {
+    "street": "st",
+    "avenue": "ave",
+    "road": "rd",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "lane": "ln",
+    "place": "pl",
+    "court": "ct",
+    "square": "sq",
+    "highway": "hwy",
+    "parkway": "pkwy",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "suite": "ste",
+}
+
+
+def phone_e164(raw, region=DEFAULT_REGION):
+    """Parse a phone number and return it in E.164 form.
+
+    Raises ValueError if the number can't be parsed or isn't valid.
+    """
+    # phonenumbers loads a large metadata module, so it is only imported the
+    # first time a number is actually parsed.
+    import phonenumbers
+
+    try:
+        number = phonenumbers.parse(raw, region)
+    except phonenumbers.NumberParseException as e:
+        raise ValueError(str(e))
+
+    if not phonenumbers.is_valid_number(number):
+        raise ValueError(f"Invalid phone number: {raw}")
+
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def _words(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    value = value.encode("ascii", "ignore").decode("ascii").lower()
+    value = value.replace("&", " and ")
+    return _non_word.sub(" ", value).split()
+
+
+def name_key(name):
+    """'The Musical Hop!' -> 'musical hop'"""
+    words = _words(name)
+    if words and words[0] == "the":
+        words = words[1:]
+    return " ".join(words)
+
+
+def address_key(address):
+    """'1015 Folsom Street' -> '1015 folsom st'"""
+    return " ".join(_address_abbreviations.get(w, w) for w in _words(address))
+
+
+def search_term(term):
+    """'  Musical   HOP ' -> 'musical hop'
+
+    Gives equivalent searches one URL and cache entry. Case and surrounding
+    whitespace don't change what ILIKE matches, but the rest does: NFKC
+    folds compatibility characters (full-width letters, ligatures such as
+    'ﬁ') to their plain forms, and inner runs of whitespace become one
+    space, so 'musical   hop' finds 'Musical Hop'.
+    """
+    return " ".join(unicodedata.normalize("NFKC", term or "").lower().split())
+
+
+def like_pattern(term):
+    """ILIKE pattern matching `term` anywhere, with wildcards escaped."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
@@ -0,0 +1,279 @@
+# ----------------------------------------------------------------------------#
+# Monthly partitions of the Show table (PostgreSQL).
+#
+# "Show" is range-partitioned on start_time, one partition per month plus a
+# default partition for anything outside them. `flask partitions create`
+# adds partitions ahead of time (moving matching rows out of the default
+# partition), and `flask partitions archive` detaches months that are long
+# past and moves their rows into the plain "Show_archive" table, so the live
+# table and its indexes only hold recent and upcoming shows.
+# ----------------------------------------------------------------------------#
+import json
+import re
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+TABLE = "Show"
+DEFAULT = f"{TABLE}_default"
+ARCHIVE = f"{TABLE}_archive"
+COLUMNS = (
+    "id, venue_id, artist_id, start_time, tickets_total, tickets_remaining, series_id"
+)
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def list_partitions(conn):
+    """[(name, from, to)] of the month partitions, oldest first."""
+    rows = conn.execute(
+        text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        table=TABLE,
+    )
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND.search(bound)
+        if match:
+            lower, upper = (datetime.fromisoformat(value) for value in match.groups())
+            partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(conn, month):
+    """Create the partition for `month` unless it exists. Returns its name."""
+    month = month_start(month)
+    name = partition_name(month)
+    if any(existing == name for existing, _, _ in list_partitions(conn)):
+        return None
+
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    moved = conn.execute(
+        text(
+            f'SELECT count(*) FROM "{DEFAULT}" '
+            "WHERE start_time >= :lower AND start_time < :upper"
+        ),
+        **bounds,
+    ).scalar()
+
+    if not moved:
+        conn.execute(
+            text(
+                f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+            )
+        )
+        return name
+
+    # Postgres refuses a new partition while the default partition holds rows
+    # that belong in it: build it standalone, move the rows, then attach.
+    conn.execute(
+        text(
+            f'CREATE TABLE "{name}" '
+            f'(LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+    )
+    conn.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{DEFAULT}" '
+            "WHERE start_time >= :lower AND start_time < :upper "
+            f"RETURNING {COLUMNS}) "
+            f'INSERT INTO "{name}" ({COLUMNS}) SELECT {COLUMNS} FROM moved'
+        ),
+        **bounds,
+    )
+    conn.execute(
+        text(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+        )
+    )
+    return name
+
+
+def create_ahead(conn, months, now=None):
+    """Make sure partitions exist from this month to `months` ahead."""
+    this_month = month_start(now or datetime.now())
+    created = []
+    for offset in range(months + 1):
+        name = create_partition(conn, add_months(this_month, offset))
+        if name:
+            created.append(name)
+    return created
+
+
+def archive(conn, before, detach_only=False):
+    """Move shows starting before the month `before` out of the live table.
+
+    Whole month partitions are detached; unless `detach_only`, their rows are
+    copied into the archive table and the partitions dropped. Older rows
+    that landed in the default partition are moved as well.
+    """
+    before = month_start(before)
+    archived = []
+
+    for name, _, upper in list_partitions(conn):
+        if upper > before:
+            continue
+        conn.execute(text(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"'))
+        if not detach_only:
+            conn.execute(
+                text(
+                    f'INSERT INTO "{ARCHIVE}" ({COLUMNS}) '
+                    f'SELECT {COLUMNS} FROM "{name}"'
+                )
+            )
+            conn.execute(text(f'DROP TABLE "{name}"'))
+        archived.append(name)
+
+    if not detach_only:
+        conn.execute(
+            text(
+                f'WITH moved AS (DELETE FROM "{DEFAULT}" WHERE start_time < :before '
+                f"RETURNING {COLUMNS}) "
+                f'INSERT INTO "{ARCHIVE}" ({COLUMNS}) SELECT {COLUMNS} FROM moved'
+            ),
+            before=before,
+        )
+
+    return archived
+
+
+def _relations(plan):
+    """Names of all relations scanned in an EXPLAIN (FORMAT JSON) plan."""
+    names = set()
+    if "Relation Name" in plan:
+        names.add(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        names |= _relations(child)
+    return names
+
+
+def scanned_partitions(conn, sql, **params):
+    """Partitions of Show that the plan for `sql` would scan.
+
+    `sql` is a string with :named parameters, or a SQLAlchemy statement.
+    """
+    if isinstance(sql, str):
+        sql = text(sql)
+    compiled = sql.compile(dialect=conn.dialect)
+    params = dict(compiled.params, **params)
+    result = conn.execute(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+    return _relations(plan[0]["Plan"]) - {TABLE, ARCHIVE}
+
+
+# Upcoming-show lookups as the views issue them; each must skip every
+# partition that ends before now.
+PRUNING_CHECKS = {
+    "venue upcoming shows": (
+        f'SELECT {COLUMNS} FROM "{TABLE}" '
+        "WHERE venue_id = :id AND start_time > :now ORDER BY start_time"
+    ),
+    "artist upcoming shows": (
+        f'SELECT {COLUMNS} FROM "{TABLE}" '
+        "WHERE artist_id = :id AND start_time > :now ORDER BY start_time"
+    ),
+    "upcoming show counts": (
+        f'SELECT venue_id, count(id) FROM "{TABLE}" '
+        "WHERE start_time > :now GROUP BY venue_id"
+    ),
+}
+
+
+def check_pruning(conn, now=None):
+    """Return {check: (ok, scanned partitions)} for PRUNING_CHECKS."""
+    now = now or datetime.now()
+    past = {name for name, _, upper in list_partitions(conn) if upper <= now}
+
+    results = {}
+    for label, sql in PRUNING_CHECKS.items():
+        scanned = scanned_partitions(conn, sql, id=1, now=now)
+        results[label] = (not scanned & past, sorted(scanned))
+    return results
+
+
+class Partitions(object):
+    def __init__(self, app=None, db=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault("SHOW_PARTITIONS_AHEAD", 12)
+        app.config.setdefault("SHOW_ARCHIVE_AFTER_MONTHS", 24)
+        self.db = db
+
+        group = AppGroup("partitions", help="Maintain the monthly Show partitions.")
+
+        def engine():
+            if self.db.engine.dialect.name != "postgresql":
+                raise click.ClickException("Show partitions need PostgreSQL.")
+            return self.db.engine
+
+        @group.command("list")
+        def list_command():
+            """List month partitions and their bounds."""
+            with engine().connect() as conn:
+                for name, lower, upper in list_partitions(conn):
+                    click.echo(f"{name}\t{lower:%Y-%m-%d}\t{upper:%Y-%m-%d}")
+
+        @group.command("create")
+        @click.option("--ahead", type=int, help="Months to create ahead.")
+        def create_command(ahead):
+            """Create partitions for the coming months."""
+            if ahead is None:
+                ahead = app.config["SHOW_PARTITIONS_AHEAD"]
+            with engine().begin() as conn:
+                for name in create_ahead(conn, ahead):
+                    click.echo(f"Created {name}")
+
+        @group.command("archive")
+        @click.option("--months", type=int, help="Keep this many past months.")
+        @click.option(
+            "--detach-only",
+            is_flag=True,
+            help="Leave detached partitions as tables instead of archiving.",
+        )
+        def archive_command(months, detach_only):
+            """Detach or archive partitions of long-past months."""
+            if months is None:
+                months = app.config["SHOW_ARCHIVE_AFTER_MONTHS"]
+            before = add_months(month_start(datetime.now()), -months)
+            with engine().begin() as conn:
+                for name in archive(conn, before, detach_only):
+                    click.echo(f"{'Detached' if detach_only else 'Archived'} {name}")
+
+        @group.command("check")
+        def check_command():
+            """EXPLAIN upcoming-show queries and verify past months are pruned."""
+            with engine().connect() as conn:
+                results = check_pruning(conn)
+            for label, (ok, scanned) in results.items():
+                status = "ok" if ok else "NOT PRUNED"
+                click.echo(f"{status:<11}{label}: {', '.join(scanned) or '-'}")
+            if not all(ok for ok, _ in results.values()):
+                raise SystemExit(1)
+
+        app.cli.add_command(group)
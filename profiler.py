@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------------#
+# On-demand request profiling.
+#
+# A request carrying `X-Profile: <PROFILER_TOKEN>` (or `?_profile=<token>`) is
+# run under a sampling profiler: a background thread reads the request
+# thread's Python stack every PROFILER_INTERVAL seconds until the response
+# body has been sent, so view code, SQL and (streamed) template rendering are
+# all covered. Samples are written to PROFILER_DIR in collapsed-stack format,
+# ready for flamegraph.pl or speedscope, and the file name is returned in the
+# X-Profile-File header. Without a token configured the middleware isn't
+# installed at all.
+# ----------------------------------------------------------------------------#
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Sampler(object):
+    """Collects collapsed stacks of one thread until stopped."""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class ProfilerMiddleware(object):
+    def __init__(self, wsgi_app, token, directory, interval=0.001):
+        self.wsgi_app = wsgi_app
+        self.token = token
+        self.directory = directory
+        self.interval = interval
+
+    def _requested(self, environ):
+        supplied = environ.get("HTTP_X_PROFILE")
+        if supplied is None and "_profile=" in environ.get("QUERY_STRING", ""):
+            supplied = parse_qs(environ["QUERY_STRING"]).get("_profile", [""])[0]
+        return supplied is not None and hmac.compare_digest(
+            supplied.encode("utf-8"), self.token.encode("utf-8")
+        )
+
+    def __call__(self, environ, start_response):
+        if not self._requested(environ):
+            return self.wsgi_app(environ, start_response)
+
+        path = environ.get("PATH_INFO", "/").strip("/").replace("/", "-") or "index"
+        filename = "{}-{}-{}.collapsed".format(
+            time.strftime("%Y%m%d-%H%M%S"), path[:60], uuid.uuid4().hex[:8]
+        )
+
+        def _start_response(status, headers, exc_info=None):
+            headers = headers + [("X-Profile-File", filename)]
+            return start_response(status, headers, exc_info)
+
+        sampler = Sampler(threading.get_ident(), self.interval).start()
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            self._finish(sampler, filename)
+            raise
+        return _ProfiledBody(body, lambda: self._finish(sampler, filename))
+
+    def _finish(self, sampler, filename):
+        sampler.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "w") as f:
+            f.write(sampler.collapsed())
+
+
+class _ProfiledBody(object):
+    """Iterable that passes `body` through and calls `finish` on close()."""
+
+    def __init__(self, body, finish):
+        self.body = body
+        self.finish = finish
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.finish()
+
+
+class Profiler(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PROFILER_TOKEN", None)
+        app.config.setdefault("PROFILER_DIR", os.path.join(app.root_path, "profiles"))
+        app.config.setdefault("PROFILER_INTERVAL", 0.001)
+
+        if not app.config["PROFILER_TOKEN"]:
+            return
+        app.wsgi_app = ProfilerMiddleware(
+            app.wsgi_app,
+            app.config["PROFILER_TOKEN"],
+            app.config["PROFILER_DIR"],
+            app.config["PROFILER_INTERVAL"],
+        )
@@ -0,0 +1,273 @@
+# ----------------------------------------------------------------------------#
+# Admission control.
+#
+# Two independent guards, both configured per endpoint:
+#
+# * Rate limiting: a token bucket per (endpoint, client). Buckets live in
+#   process memory by default, or in a shared Redis-compatible store so all
+#   workers see the same counts. Over-limit requests get 429 + Retry-After.
+# * Load shedding: when this worker already has too many requests in flight,
+#   or connections have recently waited too long for the DB pool, guarded
+#   endpoints fail fast with 503 + Retry-After instead of queueing up.
+# ----------------------------------------------------------------------------#
+import math
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy.pool import QueuePool
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(value):
+    """'30/minute' -> (tokens per second, burst)"""
+    count, _, period = value.partition("/")
+    count = int(count)
+    return count / _PERIODS[period.strip().rstrip("s")], count
+
+
+class MemoryBackend(object):
+    """Token buckets in this process's memory."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        """Return (allowed, seconds until `cost` tokens are available)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (cost - tokens) / rate
+
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # Any bucket idle for an hour has refilled; forget it.
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class StoreBackend(object):
+    """Token buckets shared by all workers through a Redis-compatible store.
+
+    `client` only needs redis-py's `eval(script, numkeys, *keys_and_args)`,
+    so tests can hand in a local fake.
+    """
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        now = time.time() if now is None else now
+        allowed, retry_after = self.client.eval(
+            _TAKE_SCRIPT, 1, self.prefix + key, rate, burst, cost, now
+        )
+        return bool(int(allowed)), float(retry_after)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that keeps a moving average of checkout wait time.
+
+    The average also decays with the time since the last checkout, halving
+    every `half_life` seconds: once requests are shed and checkouts stop, it
+    still falls back below the threshold.
+    """
+
+    half_life = 2.0
+    _average = 0.0
+    _updated = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _age(cls, now):
+        """Weight the last sample has lost by `now`."""
+        return 1 - 0.5 ** ((now - cls._updated) / cls.half_life)
+
+    @classmethod
+    def wait_average(cls, now=None):
+        """Seconds checkouts have recently waited for a connection."""
+        now = time.monotonic() if now is None else now
+        return cls._average * (1 - cls._age(now))
+
+    @classmethod
+    def record_wait(cls, waited, now=None):
+        now = time.monotonic() if now is None else now
+        with cls._lock:
+            # A sample after a quiet spell counts for more than one in a burst.
+            weight = max(0.2, cls._age(now))
+            cls._average += weight * (waited - cls._average)
+            cls._updated = now
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            TimedQueuePool.record_wait(time.perf_counter() - start)
+
+
+def _backend_from_url(url):
+    if url.startswith("memory://"):
+        return MemoryBackend()
+
+    import redis
+
+    return StoreBackend(redis.Redis.from_url(url))
+
+
+class Limiter(object):
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_STORAGE_URL", "memory://")
+        app.config.setdefault("RATELIMIT_ROUTES", {})
+        app.config.setdefault("RATELIMIT_TRUST_FORWARDED", False)
+        app.config.setdefault("LOADSHED_ENABLED", True)
+        # Below the Procfile's 32 threads, so there are threads left to shed.
+        app.config.setdefault("LOADSHED_MAX_IN_FLIGHT", 24)
+        app.config.setdefault("LOADSHED_MAX_POOL_WAIT", 0.5)
+        app.config.setdefault("LOADSHED_POOL_WAIT_HALF_LIFE", 2.0)
+        app.config.setdefault("LOADSHED_RETRY_AFTER", 5)
+        app.config.setdefault("LOADSHED_ROUTES", {})
+
+        TimedQueuePool.half_life = app.config["LOADSHED_POOL_WAIT_HALF_LIFE"]
+        if self.backend is None:
+            self.backend = _backend_from_url(app.config["RATELIMIT_STORAGE_URL"])
+
+        uri = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+        if uri.startswith("postgres"):
+            app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {}).setdefault(
+                "poolclass", TimedQueuePool
+            )
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def limit(self, rate):
+        """Default rate limit for a view, e.g. @limiter.limit("30/minute").
+
+        RATELIMIT_ROUTES[endpoint] overrides it; None disables it.
+        """
+
+        def decorator(fn):
+            fn.rate_limit = rate
+            return fn
+
+        return decorator
+
+    def shed(self, max_in_flight=None, max_pool_wait=None):
+        """Shed this view's requests under load. See LOADSHED_ROUTES."""
+
+        def decorator(fn):
+            fn.load_shed = {
+                "max_in_flight": max_in_flight,
+                "max_pool_wait": max_pool_wait,
+            }
+            return fn
+
+        return decorator
+
+    def client_id(self):
+        if current_app.config["RATELIMIT_TRUST_FORWARDED"] and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or "unknown"
+
+    def _route_setting(self, config_key, attribute):
+        routes = current_app.config[config_key]
+        if request.endpoint in routes:
+            return routes[request.endpoint]
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, attribute, None)
+
+    def _before_request(self):
+        with self._lock:
+            self.in_flight += 1
+        request.environ["fyyur.in_flight"] = True
+
+        config = current_app.config
+        if config["LOADSHED_ENABLED"]:
+            self._check_load()
+        if config["RATELIMIT_ENABLED"]:
+            self._check_rate()
+
+    def _check_load(self):
+        shed = self._route_setting("LOADSHED_ROUTES", "load_shed")
+        if not shed:
+            return
+        if shed is True:
+            shed = {}
+
+        config = current_app.config
+        max_in_flight = shed.get("max_in_flight") or config["LOADSHED_MAX_IN_FLIGHT"]
+        max_pool_wait = shed.get("max_pool_wait") or config["LOADSHED_MAX_POOL_WAIT"]
+
+        if (
+            self.in_flight > max_in_flight
+            or TimedQueuePool.wait_average() > max_pool_wait
+        ):
+            raise ServiceUnavailable(retry_after=config["LOADSHED_RETRY_AFTER"])
+
+    def _check_rate(self):
+        rate = self._route_setting("RATELIMIT_ROUTES", "rate_limit")
+        if not rate:
+            return
+
+        per_second, burst = parse_rate(rate)
+        allowed, retry_after = self.backend.take(
+            f"{request.endpoint}:{self.client_id()}", per_second, burst
+        )
+        if not allowed:
+            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+
+    def _teardown_request(self, exc=None):
+        if request.environ.pop("fyyur.in_flight", False):
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------#
+# Recurring shows.
+#
+# A show submission may carry a recurrence rule: weekly or monthly, every
+# `interval` weeks/months, ending after `count` occurrences or on an `until`
+# date, minus excluded dates (which, as in iCalendar, still count). The rule
+# is expanded here with dateutil's rrule, every occurrence is checked against
+# existing shows with a single query, and the whole series is written with one
+# multi-row INSERT in the caller's transaction. Its shows share a series_id, so
+# the upcoming ones can be edited or cancelled together with one UPDATE or
+# DELETE.
+#
+# These statements bypass the unit of work; like tickets.py they take the
+# Show table and return the affected rows, which the caller records in the
+# ChangeFeed.
+# ----------------------------------------------------------------------------#
+import uuid
+from bisect import bisect_left
+from datetime import datetime, time
+
+from dateutil.rrule import MONTHLY, WEEKLY, rrule
+from sqlalchemy import and_, exists, func, not_, or_, select
+
+FREQUENCIES = {"weekly": WEEKLY, "monthly": MONTHLY}
+
+
+def new_series_id():
+    return uuid.uuid4().hex
+
+
+def expand(
+    start, frequency, interval=1, count=None, until=None, exclude=(), limit=None
+):
+    """Start times of a series, in order.
+
+    `until` is a date, inclusive; `exclude` is a collection of dates to skip.
+    A monthly series starting on the 29th, 30th or 31st falls on the last
+    day of shorter months instead of skipping them.
+    Raises ValueError if the rule yields more than `limit` shows or none.
+    """
+    if until is not None:
+        until = datetime.combine(until, time.max)
+    options = {}
+    if frequency == "monthly" and start.day > 28:
+        # The last of the days from the 28th to the start's day that the
+        # month has.
+        options = {"bymonthday": tuple(range(28, start.day + 1)), "bysetpos": -1}
+    rule = rrule(
+        FREQUENCIES[frequency],
+        dtstart=start,
+        interval=interval,
+        count=count,
+        until=until,
+        **options,
+    )
+
+    exclude = set(exclude)
+    times = []
+    for occurrence in rule:
+        if occurrence.date() in exclude:
+            continue
+        times.append(occurrence)
+        if limit is not None and len(times) > limit:
+            raise ValueError(f"A series can have at most {limit} shows.")
+    if not times:
+        raise ValueError("The recurrence rule doesn't produce any shows.")
+    return times
+
+
+def conflicts(session, shows, venue_id, artist_id, times, window, series_id=None):
+    """Existing shows clashing with any of `times`, in one query.
+
+    A show clashes if it is at the same venue or by the same artist and starts
+    less than `window` (a timedelta) from one of the times. A `venue_id` of
+    None checks the artist only, and the shows of `series_id` (the ones being
+    changed) never clash. Returns rows of (id, venue_id, artist_id,
+    start_time), earliest first.
+    """
+    if not times:
+        return []
+    times = sorted(times)
+    same = [shows.c.artist_id == artist_id]
+    if venue_id is not None:
+        same.append(shows.c.venue_id == venue_id)
+    query = (
+        select([shows.c.id, shows.c.venue_id, shows.c.artist_id, shows.c.start_time])
+        .where(or_(*same))
+        .where(shows.c.start_time > times[0] - window)
+        .where(shows.c.start_time < times[-1] + window)
+        .order_by(shows.c.start_time)
+    )
+    if series_id is not None:
+        query = query.where(
+            or_(shows.c.series_id.is_(None), shows.c.series_id != series_id)
+        )
+    rows = session.execute(query).fetchall()
+
+    clashing = []
+    for row in rows:
+        # The nearest new show is either side of the existing one.
+        i = bisect_left(times, row.start_time)
+        nearest = times[max(i - 1, 0) : i + 1]
+        if any(abs(row.start_time - t) < window for t in nearest):
+            clashing.append(row)
+    return clashing
+
+
+def insert_series(session, shows, values, times):
+    """Insert one show per start time, sharing `values`, in one statement.
+
+    `values` must include the series_id. Returns {start time: id}.
+    """
+    insert = shows.insert().values([dict(values, start_time=t) for t in times])
+
+    if session.get_bind().dialect.name == "postgresql":
+        rows = session.execute(insert.returning(shows.c.id, shows.c.start_time))
+    else:
+        # Without RETURNING, read the ids back by series.
+        session.execute(insert)
+        rows = session.execute(
+            select([shows.c.id, shows.c.start_time]).where(
+                shows.c.series_id == values["series_id"]
+            )
+        )
+    return {start_time: id for id, start_time in rows}
+
+
+def _upcoming(shows, series_id, now):
+    return and_(shows.c.series_id == series_id, shows.c.start_time > now)
+
+
+def _returned(shows):
+    return [shows.c[name] for name in ("id", "venue_id", "artist_id", "start_time")]
+
+
+def update_series(session, shows, series_id, now, artist_id=None, tickets=None):
+    """Change the artist and/or ticket count of a series' upcoming shows.
+
+    A new ticket count keeps the tickets already sold: shows that sold more
+    than `tickets` are left alone. Returns the updated rows of (id,
+    venue_id, artist_id, start_time), and {id: {column: previous value}}
+    of the changed columns.
+    """
+    criteria = _upcoming(shows, series_id, now)
+    postgresql = session.get_bind().dialect.name == "postgresql"
+    values = {}
+    if tickets is not None:
+        sold = shows.c.tickets_total - shows.c.tickets_remaining
+        criteria = and_(
+            criteria, or_(shows.c.tickets_total.is_(None), sold <= tickets)
+        )
+        values["tickets_total"] = tickets
+        values["tickets_remaining"] = tickets - func.coalesce(sold, 0)
+
+    if artist_id is not None:
+        values["artist_id"] = artist_id
+
+    # The values being replaced, for the ChangeFeed. Locked on Postgres so
+    # they can't change before the UPDATE.
+    old = select([shows.c.id] + [shows.c[name] for name in values]).where(criteria)
+    if postgresql:
+        old = old.with_for_update()
+    previous = {
+        row.id: {name: row[name] for name in values}
+        for row in session.execute(old)
+    }
+
+    update = shows.update().where(criteria).values(values)
+    if postgresql:
+        rows = session.execute(update.returning(*_returned(shows))).fetchall()
+    else:
+        # Without RETURNING, read the rows back; the criteria still hold.
+        session.execute(update)
+        rows = session.execute(select(_returned(shows)).where(criteria)).fetchall()
+    return rows, previous
+
+
+def cancel_series(session, shows, bookings, series_id, now):
+    """Delete a series' upcoming shows that have no bookings.
+
+    Returns (deleted rows of (id, venue_id, artist_id, start_time), number of
+    booked shows kept).
+    """
+    booked = exists().where(bookings.c.show_id == shows.c.id)
+    criteria = _upcoming(shows, series_id, now)
+    delete = shows.delete().where(and_(criteria, not_(booked)))
+
+    if session.get_bind().dialect.name == "postgresql":
+        deleted = session.execute(delete.returning(*_returned(shows))).fetchall()
+    else:
+        # Without RETURNING, read the rows first in the same transaction.
+        deleted = session.execute(
+            select(_returned(shows)).where(and_(criteria, not_(booked)))
+        ).fetchall()
+        session.execute(delete)
+
+    kept = session.execute(
+        select([func.count()]).select_from(shows).where(and_(criteria, booked))
+    ).scalar()
+    return deleted, kept
@@ -0,0 +1,265 @@
+# ----------------------------------------------------------------------------#
+# Live updates over Server-Sent Events.
+#
+# Committed changes to shows, venues and artists are published as small JSON
+# messages tagged with topics ("all", "venue:<id>", "artist:<id>"). Every
+# worker process has one Broadcaster that fans messages out to its
+# subscribers' queues. With Postgres, messages travel through NOTIFY and each
+# worker runs a single LISTEN thread on its own connection, so subscribers
+# never hold database connections; LocalBackend delivers in-process instead
+# (single process, SQLite, tests).
+# ----------------------------------------------------------------------------#
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from flask import Response, current_app, request
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from werkzeug.exceptions import ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription(object):
+    def __init__(self, topics, size):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(size)
+        self.dropped = False
+
+    def get(self, timeout):
+        """Next message, or None after `timeout` seconds without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster(object):
+    """Fan messages out to this process's subscribers."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics, limit=None):
+        """A new Subscription, or None if `limit` subscribers already exist."""
+        subscription = Subscription(topics, self.queue_size)
+        with self._lock:
+            if limit is not None and len(self.subscribers) >= limit:
+                return None
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, message):
+        topics = set(message["topics"])
+        with self._lock:
+            subscribers = list(self.subscribers)
+
+        for subscription in subscribers:
+            if subscription.topics & topics:
+                try:
+                    subscription.queue.put_nowait(message)
+                except queue.Full:
+                    # A client that can't keep up is disconnected rather than
+                    # buffered without bound; it reconnects and reloads.
+                    subscription.dropped = True
+                    self.unsubscribe(subscription)
+
+
+class LocalBackend(object):
+    """Deliver messages to this process only."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self):
+        pass
+
+    def publish(self, messages):
+        for message in messages:
+            self.broadcaster.publish(message)
+
+
+class PostgresBackend(object):
+    """Deliver messages to every worker through LISTEN/NOTIFY."""
+
+    def __init__(self, broadcaster, url, channel="fyyur_changes"):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        # Separate from the app's pool: the listener holds its connection for
+        # good, and NOTIFY must commit on its own. Publishing runs after every
+        # commit, so it reuses a small pool of its own.
+        self.engine = create_engine(url, poolclass=NullPool)
+        self.publish_engine = create_engine(url, pool_size=1, max_overflow=4)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Started lazily, and again in a forked child: threads don't survive
+        # fork.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(
+                target=self._listen, name="sse-listener", daemon=True
+            )
+            thread.start()
+
+    def publish(self, messages):
+        with self.publish_engine.begin() as conn:
+            for message in messages:
+                conn.execute(
+                    "SELECT pg_notify(%s, %s)", (self.channel, json.dumps(message))
+                )
+
+    def _listen(self):
+        delay = 1
+        while True:
+            try:
+                raw = self.engine.raw_connection()
+                try:
+                    connection = raw.connection
+                    connection.autocommit = True
+                    connection.cursor().execute(f'LISTEN "{self.channel}"')
+                    delay = 1
+                    while True:
+                        if select.select([connection], [], [], 30) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            notify = connection.notifies.pop(0)
+                            self.broadcaster.publish(json.loads(notify.payload))
+                finally:
+                    raw.close()
+            except Exception:
+                logger.exception("SSE listener failed; reconnecting in %ss", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+
+def messages_for(changes):
+    """Messages to publish for a committed batch of ChangeFeed changes."""
+    messages = []
+    for change in changes:
+        values = change.values
+        if change.model == "Show":
+            start_time = values.get("start_time")
+            topics = ["all"]
+            if values.get("venue_id") is not None:
+                topics.append(f"venue:{values['venue_id']}")
+            if values.get("artist_id") is not None:
+                topics.append(f"artist:{values['artist_id']}")
+            messages.append(
+                {
+                    "event": "show",
+                    "op": change.op,
+                    "id": change.id,
+                    "venue_id": values.get("venue_id"),
+                    "artist_id": values.get("artist_id"),
+                    "start_time": start_time.isoformat()
+                    if hasattr(start_time, "isoformat")
+                    else start_time,
+                    "topics": topics,
+                }
+            )
+        elif change.model in ("Venue", "Artist"):
+            kind = change.model.lower()
+            messages.append(
+                {
+                    "event": kind,
+                    "op": change.op,
+                    "id": change.id,
+                    "name": values.get("name"),
+                    "topics": ["all", f"{kind}:{change.id}"],
+                }
+            )
+    return messages
+
+
+class LiveUpdates(object):
+    def __init__(self, app=None, changes=None, backend=None):
+        self.broadcaster = Broadcaster()
+        self.backend = backend
+        if app is not None:
+            self.init_app(app, changes)
+
+    def init_app(self, app, changes):
+        app.config.setdefault("SSE_BACKEND", "auto")
+        app.config.setdefault("SSE_CHANNEL", "fyyur_changes")
+        app.config.setdefault("SSE_HEARTBEAT", 15)
+        app.config.setdefault("SSE_QUEUE_SIZE", 100)
+        # Every open stream holds a worker thread: keep well below --threads.
+        app.config.setdefault("SSE_MAX_SUBSCRIBERS", 8)
+        app.config.setdefault("SSE_MAX_STREAM_SECONDS", 300)
+
+        self.broadcaster.queue_size = app.config["SSE_QUEUE_SIZE"]
+        if self.backend is None:
+            uri = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+            backend = app.config["SSE_BACKEND"]
+            if backend == "postgres" or (
+                backend == "auto" and uri.startswith("postgres")
+            ):
+                self.backend = PostgresBackend(
+                    self.broadcaster, uri, app.config["SSE_CHANNEL"]
+                )
+            else:
+                self.backend = LocalBackend(self.broadcaster)
+
+        changes.on_commit(self._on_commit)
+
+    def _on_commit(self, changes):
+        messages = messages_for(changes)
+        if messages:
+            self.backend.publish(messages)
+
+    def stream(self, topics):
+        """text/event-stream response for messages on any of `topics`."""
+        config = current_app.config
+        subscription = self.broadcaster.subscribe(
+            topics, limit=config["SSE_MAX_SUBSCRIBERS"]
+        )
+        if subscription is None:
+            raise ServiceUnavailable(retry_after=30)
+
+        self.backend.start()
+        heartbeat = config["SSE_HEARTBEAT"]
+        # Streams end after a while and the client reconnects, so threads are
+        # handed back and other clients get their turn.
+        ends_at = time.monotonic() + config["SSE_MAX_STREAM_SECONDS"]
+
+        def events():
+            try:
+                yield "retry: 5000\n\n"
+                while not subscription.dropped and time.monotonic() < ends_at:
+                    message = subscription.get(heartbeat)
+                    if message is None:
+                        # Keeps proxies from closing an idle connection.
+                        yield ": keepalive\n\n"
+                        continue
+                    data = {k: v for k, v in message.items() if k != "topics"}
+                    yield f"event: {message['event']}\ndata: {json.dumps(data)}\n\n"
+            finally:
+                self.broadcaster.unsubscribe(subscription)
+
+        response = Response(events(), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+
+def requested_topics():
+    """Topics from ?venue=<id>&artist=<id>; everything if neither is given."""
+    topics = [f"venue:{id}" for id in request.args.getlist("venue", type=int)]
+    topics += [f"artist:{id}" for id in request.args.getlist("artist", type=int)]
+    return topics or ["all"]
@@ -2,3 +2,24 @@ window.parseISOString = function parseISOString(s) {
     var b = s.split(/\D+/);
     return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Live updates: an element with data-live-events="<stream url>" holds a
+// [data-live-watch] button and a hidden [data-live-notice]. Streams are only
+// opened on request, since each one holds a server thread while it is open.
+document.addEventListener('DOMContentLoaded', function () {
+    var container = document.querySelector('[data-live-events]');
+    if (!container || !window.EventSource) {
+        return;
+    }
+
+    var button = container.querySelector('[data-live-watch]');
+    var notice = container.querySelector('[data-live-notice]');
+    button.addEventListener('click', function () {
+        button.hidden = true;
+        var source = new EventSource(container.dataset.liveEvents);
+        source.addEventListener('show', function () {
+            notice.hidden = false;
+            source.close();
+        });
+    });
+});
@@ -0,0 +1,27 @@
+# ----------------------------------------------------------------------------#
+# Streamed template rendering.
+# ----------------------------------------------------------------------------#
+from flask import Response, current_app, get_flashed_messages, stream_with_context
+from flask_wtf.csrf import generate_csrf
+
+
+def stream_template(template_name, **context):
+    """Render a template as a stream of chunks instead of one string.
+
+    The layout's <head> reaches the client while the rest of the page is
+    still being rendered. Anything that writes to the session (flashed
+    messages, the CSRF token) is touched up front because the session
+    cookie is sent before the body.
+    """
+    app = current_app._get_current_object()
+
+    get_flashed_messages()
+    # Also for pages without a form object, like the shows page's booking
+    # forms: the token is only known once the page calls csrf_token().
+    generate_csrf()
+
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(app.config.get("TEMPLATE_STREAM_BUFFER", 16))
+
+    return Response(stream_with_context(stream), mimetype="text/html")
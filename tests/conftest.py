@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration on import: run it against a scratch SQLite
+# file, never whatever DATABASE_URL points at. A file rather than an in-memory
+# database, so the background rebuild threads get connections of their own.
+_database = os.path.join(tempfile.mkdtemp(prefix="fyyur-db-"), "fyyur.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_database}"
+os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="fyyur-metrics-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app, db
+
+    app.config.update(
+        TESTING=True, WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False
+    )
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,91 @@
+"""Keyset-batched backfills on an in-memory SQLite database."""
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+
+import backfill
+
+# Every backfill below bumps `done`, so a row processed twice shows up.
+items = Table(
+    "Item",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("done", Integer, nullable=False, default=0),
+)
+
+
+class Op(object):
+    """Just enough of alembic's `op` for schedule()."""
+
+    def __init__(self, conn):
+        self.execute = conn.execute
+
+
+@pytest.fixture
+def conn(app, monkeypatch):
+    from app import Backfill
+
+    monkeypatch.setattr(backfill, "scheduled", [])
+    engine = create_engine("sqlite://")
+    Backfill.__table__.create(engine)
+    items.create(engine)
+    with engine.connect() as conn:
+        # Gaps in the keys, and rows the backfill must skip.
+        conn.execute(
+            items.insert(),
+            [
+                {"id": id, "name": "skip" if id % 7 == 0 else "item"}
+                for id in range(1, 60, 2)
+            ],
+        )
+        backfill.schedule(
+            Op(conn), "bump", "Item", set="done = done + 1", where="name = 'item'"
+        )
+        yield conn
+    engine.dispose()
+
+
+def done(conn):
+    """Times each row was backfilled, by id."""
+    return dict(conn.execute(select([items.c.id, items.c.done])).fetchall())
+
+
+def test_runs_in_keyset_batches(conn):
+    progress = []
+    [spec] = backfill.load(conn)
+    total = backfill.run(conn, spec, batch_size=10, pause=0, echo=progress.append)
+
+    assert total == 26
+    assert progress == [
+        "bump: 10 rows, up to id 23",
+        "bump: 20 rows, up to id 45",
+        "bump: 26 rows, up to id 59",
+    ]
+    assert done(conn) == {id: 0 if id % 7 == 0 else 1 for id in range(1, 60, 2)}
+    [spec] = backfill.load(conn)
+    assert (spec.status, spec.rows_done, spec.last_key) == ("done", 26, 59)
+
+
+def test_resumes_from_checkpoint(conn):
+    [spec] = backfill.load(conn)
+    # Interrupted after two batches: only their checkpoints were saved.
+    last_key, _ = backfill.run_batch(conn, spec, None, 10)
+    backfill.run_batch(conn, spec, last_key, 10)
+
+    [spec] = backfill.load(conn)
+    assert (spec.status, spec.rows_done, spec.last_key) == ("running", 20, 45)
+    assert backfill.run(conn, spec, batch_size=10, pause=0) == 6
+
+    # No row was done twice.
+    assert set(done(conn).values()) == {0, 1}
+    [spec] = backfill.load(conn)
+    assert (spec.status, spec.rows_done) == ("done", 26)
+
+
+def test_dry_run_writes_nothing(conn):
+    [spec] = backfill.load(conn)
+    assert backfill.run(conn, spec, batch_size=10, pause=0, dry_run=True) == 26
+
+    assert set(done(conn).values()) == {0}
+    [after] = backfill.load(conn)
+    assert (after.status, after.rows_done, after.last_key) == ("pending", 0, None)
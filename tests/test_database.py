@@ -0,0 +1,70 @@
+"""Read routing between the primary and a read-only engine."""
+import pytest
+from flask import g
+from sqlalchemy import create_engine
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    from app import db
+
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(db, "_read_engine", engine)
+    return engine
+
+
+def bind(app, *args, **kwargs):
+    from app import db
+
+    with app.test_request_context(*args, **kwargs):
+        return db.session.get_bind()
+
+
+def test_reads_of_get_requests_use_replica(app, replica):
+    assert bind(app, "/venues") is replica
+    assert bind(app, "/venues/create", method="POST") is not replica
+
+
+def test_recent_writer_reads_primary(app, replica):
+    headers = {"Cookie": "db_primary=1"}
+    assert bind(app, "/venues", headers=headers) is not replica
+
+
+def test_write_sets_primary_cookie(app, client, replica):
+    response = client.get("/artists/create")
+    assert "db_primary" not in response.headers.get("Set-Cookie", "")
+
+    response = client.post(
+        "/artists/create",
+        data={
+            "name": "Cookie Monster",
+            "city": "Sesame",
+            "state": "NY",
+            "phone": "212-736-5001",
+            "genres": ["Pop"],
+            "website": "https://example.com",
+            "image_link": "https://example.com/image.jpg",
+            "facebook_link": "https://facebook.com/example",
+        },
+    )
+    assert response.status_code == 302
+    assert "db_primary=1" in response.headers["Set-Cookie"]
+
+
+def test_flush_moves_request_to_primary(app, replica):
+    from app import Artist, db
+
+    with app.test_request_context("/"):
+        db.session.add(Artist(name="Grover", genres=["Pop"]))
+        db.session.flush()
+        assert g.db_wrote
+        assert db.session.get_bind() is not replica
+        db.session.rollback()
+
+
+def test_edit_forms_read_primary(app, replica):
+    from app import db
+
+    with app.test_request_context("/venues/1/edit"):
+        db.primary(lambda: None)()
+        assert db.session.get_bind() is not replica
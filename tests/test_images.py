@@ -0,0 +1,83 @@
+import io
+import os
+import re
+
+import pytest
+
+from images import DiskCache, LocalFetcher
+
+PIL = pytest.importorskip("PIL.Image")
+
+SOURCE = "https://images.example.com/photos/stage.jpg?w=2000"
+
+
+def cached_files(directory):
+    return sorted(name for name in os.listdir(directory) if name != ".lock")
+
+
+def test_disk_cache_is_bounded_across_processes(tmp_path):
+    # Two caches on one directory, as in two worker processes.
+    first = DiskCache(str(tmp_path), max_bytes=250)
+    second = DiskCache(str(tmp_path), max_bytes=250)
+    for i in range(10):
+        cache = first if i % 2 else second
+        path = cache.put(f"file-{i}", b"x" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    assert cached_files(tmp_path) == ["file-8", "file-9"]
+    # The shared running total matches what is left on disk.
+    assert (tmp_path / ".lock").read_text() == "200"
+
+
+def test_disk_cache_only_scans_when_over_budget(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.put("a", b"x" * 100)
+
+    def scan():
+        raise AssertionError("scanned the cache directory")
+
+    monkeypatch.setattr(cache, "_files", scan)
+    cache.put("b", b"x" * 100)
+    # Replacing a file counts only the difference.
+    cache.put("a", b"x" * 300)
+    assert (tmp_path / ".lock").read_text() == "400"
+
+
+def test_disk_cache_reads_refresh_recency(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    for i, key in enumerate("ab"):
+        os.utime(cache.put(key, b"x" * 100), (1000 + i, 1000 + i))
+
+    assert cache.get("a") is not None
+    cache.put("c", b"x" * 100)
+    assert cached_files(tmp_path) == ["a", "c"]
+    assert cache.get("b") is None
+
+
+@pytest.fixture
+def images(app, tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    PIL.new("RGB", (1200, 800), "red").save(source / "stage.jpg")
+
+    images = app.extensions["images"]
+    monkeypatch.setattr(images, "fetcher", LocalFetcher(str(source)))
+    monkeypatch.setattr(images, "cache", DiskCache(str(tmp_path / "cache"), 10 ** 6))
+    return images
+
+
+def test_image_variants_are_resized_and_cached(app, client, images, monkeypatch):
+    with app.test_request_context():
+        srcset = images.srcset(SOURCE)
+    url = re.match(r"(\S+) 320w", srcset).group(1)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert PIL.open(io.BytesIO(response.data)).size == (320, 213)
+
+    def unreachable(url):
+        raise AssertionError("fetched a cached image")
+
+    monkeypatch.setattr(images, "fetcher", unreachable)
+    assert client.get(url).data == response.data
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+
+def test_requeue_stale_counts_the_lost_attempt(app):
+    from app import Job, db, jobs
+
+    with app.app_context():
+        retried = jobs.enqueue("delete_venue_job", {"venue_id": 0})
+        exhausted = jobs.enqueue("delete_venue_job", {"venue_id": 0})
+        db.session.commit()
+        ids = (retried.id, exhausted.id)
+
+        claimed = jobs.claim(10, "test-worker")
+        assert set(ids) <= set(claimed)
+        # Both workers died long ago; one job had no attempts left.
+        Job.query.filter(Job.id.in_(claimed)).update(
+            {"locked_at": datetime.utcnow() - timedelta(days=1)},
+            synchronize_session=False,
+        )
+        Job.query.filter(Job.id == exhausted.id).update(
+            {"attempts": Job.max_attempts}, synchronize_session=False
+        )
+        db.session.commit()
+
+        jobs.requeue_stale()
+
+        retried, exhausted = (Job.query.get(id) for id in ids)
+        assert (retried.status, retried.attempts) == ("queued", 1)
+        assert exhausted.status == "failed"
+        assert exhausted.finished_at is not None
+        assert "worker died" in exhausted.last_error
+
+
+def test_heartbeat_keeps_running_jobs_locked(app):
+    from app import Job, db, jobs
+
+    with app.app_context():
+        job = jobs.enqueue("delete_venue_job", {"venue_id": 0})
+        db.session.commit()
+        job_id = job.id
+
+        assert job_id in jobs.claim(10, "test-worker")
+        Job.query.filter(Job.id == job_id).update(
+            {"locked_at": datetime.utcnow() - timedelta(days=1)},
+            synchronize_session=False,
+        )
+        db.session.commit()
+
+        # Another worker's heartbeat doesn't cover it; its own does.
+        jobs.heartbeat([job_id], "other-worker")
+        assert Job.query.get(job_id).locked_at < datetime.utcnow() - timedelta(hours=1)
+        jobs.heartbeat([job_id], "test-worker")
+        jobs.requeue_stale()
+
+        job = Job.query.get(job_id)
+        assert (job.status, job.locked_by) == ("running", "test-worker")
@@ -0,0 +1,70 @@
+"""Partition pruning of the views' show queries, on PostgreSQL.
+
+EXPLAINs the queries the views build against a migrated database given by
+TEST_DATABASE_URL; skipped without one. Partitions for last month to next
+month are created in a transaction that is rolled back.
+"""
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+
+import partitions
+
+URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not URL, reason="TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture(scope="module")
+def conn():
+    engine = create_engine(URL)
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        this_month = partitions.month_start(datetime.now())
+        partitions.create_partition(conn, partitions.add_months(this_month, -1))
+        partitions.create_ahead(conn, 1)
+        yield conn
+        transaction.rollback()
+    engine.dispose()
+
+
+@pytest.fixture
+def months(conn):
+    """Names of the partitions that end before now and start after it."""
+    now = datetime.now()
+    listed = partitions.list_partitions(conn)
+    past = {name for name, _, upper in listed if upper <= now}
+    future = {name for name, lower, _ in listed if lower > now}
+    assert past and future
+    return now, past, future
+
+
+@pytest.mark.parametrize("key", ["venue_id", "artist_id"])
+def test_profile_shows_are_pruned(app, conn, months, key):
+    from app import Artist, Venue, profile_queries
+
+    now, past_months, future_months = months
+    other = Artist if key == "venue_id" else Venue
+    with app.app_context():
+        past, upcoming = profile_queries(key, 1, other, now)
+        scanned_past = partitions.scanned_partitions(conn, past.statement)
+        scanned_upcoming = partitions.scanned_partitions(conn, upcoming.statement)
+
+    assert not scanned_upcoming & past_months
+    assert not scanned_past & future_months
+
+
+@pytest.mark.parametrize("model", ["Venue", "Artist"])
+def test_listing_counts_are_pruned(app, conn, months, model):
+    import app as views
+
+    _, past_months, _ = months
+    with app.app_context():
+        show_fk = getattr(views.Show, f"{model.lower()}_id")
+        query = views.listing_query(getattr(views, model), show_fk)
+        scanned = partitions.scanned_partitions(conn, query.statement)
+
+    assert scanned
+    assert not scanned & past_months
@@ -0,0 +1,27 @@
+import pytest
+
+from ratelimit import TimedQueuePool
+
+
+def test_pool_wait_average_decays_without_checkouts(monkeypatch):
+    monkeypatch.setattr(TimedQueuePool, "_average", 0.0)
+    monkeypatch.setattr(TimedQueuePool, "_updated", 0.0)
+    monkeypatch.setattr(TimedQueuePool, "half_life", 2.0)
+
+    for now in range(100, 110):
+        TimedQueuePool.record_wait(3.0, now=now)
+    assert TimedQueuePool.wait_average(now=109) == pytest.approx(3.0)
+
+    # No checkout since: the average halves every two seconds.
+    assert TimedQueuePool.wait_average(now=111) == pytest.approx(1.5)
+    assert TimedQueuePool.wait_average(now=129) < 0.01
+
+
+def test_pool_wait_average_follows_new_waits(monkeypatch):
+    monkeypatch.setattr(TimedQueuePool, "_average", 3.0)
+    monkeypatch.setattr(TimedQueuePool, "_updated", 100.0)
+    monkeypatch.setattr(TimedQueuePool, "half_life", 2.0)
+
+    # A checkout long after the last one replaces the stale average.
+    TimedQueuePool.record_wait(0.0, now=200)
+    assert TimedQueuePool.wait_average(now=200) < 0.01
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from recurrence import expand
+
+
+def test_monthly_series_clamps_to_the_end_of_shorter_months():
+    times = expand(datetime(2027, 1, 31, 20), "monthly", count=4)
+    assert [t.date().isoformat() for t in times] == [
+        "2027-01-31",
+        "2027-02-28",
+        "2027-03-31",
+        "2027-04-30",
+    ]
+    assert {t.hour for t in times} == {20}
+
+
+def test_monthly_series_keeps_its_day_after_february():
+    # 2028 is a leap year.
+    times = expand(datetime(2027, 12, 30, 20), "monthly", count=4)
+    assert [t.day for t in times] == [30, 30, 29, 30]
@@ -0,0 +1,311 @@
+"""Every route against a scratch SQLite database."""
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+LINKS = {
+    "website": "https://example.com",
+    "image_link": "https://example.com/image.jpg",
+    "facebook_link": "https://facebook.com/example",
+}
+
+
+@pytest.fixture(scope="module")
+def listed(app):
+    """Ids of a venue, an artist, a show series and a job created through the forms."""
+    from app import Artist, Job, Show, Venue, db, jobs
+
+    client = app.test_client()
+    client.post(
+        "/venues/create",
+        data=dict(
+            LINKS,
+            name="The Dueling Pianos Bar",
+            city="New York",
+            state="NY",
+            address="335 Delancey Street",
+            phone="212-736-5000",
+            genres=["Classical", "Jazz"],
+            capacity="100",
+        ),
+    )
+    client.post(
+        "/artists/create",
+        data=dict(
+            LINKS,
+            name="Guns N Petals",
+            city="San Francisco",
+            state="CA",
+            phone="415-285-5000",
+            genres=["Rock n Roll"],
+        ),
+    )
+    with app.app_context():
+        venue = Venue.query.filter_by(name="The Dueling Pianos Bar").one()
+        artist = Artist.query.filter_by(name="Guns N Petals").one()
+        ids = {"venue_id": venue.id, "artist_id": artist.id}
+
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    for data in (
+        {"start_time": start - timedelta(days=30)},
+        {"start_time": start, "repeat": "weekly", "count": "4"},
+    ):
+        data["start_time"] = data["start_time"].strftime("%Y-%m-%d %H:%M:%S")
+        response = client.post("/shows/create", data=dict(ids, **data))
+        assert response.status_code == 302
+
+    with app.app_context():
+        show = Show.query.filter(Show.series_id.isnot(None)).first()
+        ids.update(show_id=show.id, series_id=show.series_id)
+        past = Show.query.filter(Show.series_id.is_(None)).first()
+        ids["past_show_id"] = past.id
+        jobs.enqueue("delete_venue_job", {"venue_id": 0})
+        db.session.commit()
+        ids["job_id"] = Job.query.order_by(Job.id.desc()).first().id
+    return ids
+
+
+def get_urls(app, ids):
+    """A URL for every GET route, with ids of listed rows filled in."""
+    values = dict(ids, state="NY", city="New York")
+    skip = {"static", "asset", "image", "show_events"}
+    for rule in app.url_map.iter_rules():
+        if "GET" in rule.methods and rule.endpoint not in skip:
+            yield re.sub(r"<(?:\w+:)?(\w+)>", lambda m: str(values[m[1]]), rule.rule)
+
+
+def test_get_routes(app, client, listed):
+    urls = list(get_urls(app, listed))
+    assert len(urls) > 20
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200, url
+
+
+def test_pages_show_listed_rows(client, listed):
+    assert b"Guns N Petals" in client.get("/shows").data
+    assert b"Jazz" in client.get(f"/venues/{listed['venue_id']}").data
+    response = client.get("/venues/search?search_term=pianos")
+    assert b"The Dueling Pianos Bar" in response.data
+
+
+def test_home_widgets(app, client, listed):
+    from app import widgets
+
+    with app.app_context():
+        widgets.rebuild()
+    assert widgets.trending_venues()[0] == (listed["venue_id"], "The Dueling Pianos Bar", 4)
+
+    # A new show is counted from the ChangeFeed, without another load.
+    start = datetime.now().replace(microsecond=0) + timedelta(days=60)
+    data = {
+        "venue_id": listed["venue_id"],
+        "artist_id": listed["artist_id"],
+        "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    assert client.post("/shows/create", data=data).status_code == 302
+    assert widgets.trending_venues()[0].num_upcoming_shows == 5
+    assert b"The Dueling Pianos Bar" in client.get("/").data
+
+
+def test_create_show_with_bad_ids(client, listed):
+    start = (datetime.now() + timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S")
+    ids = {"venue_id": listed["venue_id"], "artist_id": listed["artist_id"]}
+    for key in ids:
+        data = dict(ids, start_time=start, **{key: "x"})
+        response = client.post("/shows/create", data=data)
+        # The form is shown again with the error, not a server error.
+        assert response.status_code == 200
+        assert b"Not a valid integer value" in response.data
+
+
+def test_search_redirects_post_to_get(client):
+    response = client.post("/artists/search", data={"search_term": "Guns"})
+    assert response.status_code == 303
+
+
+def test_edit_venue(client, listed):
+    url = f"/venues/{listed['venue_id']}/edit"
+    form = client.get(url).get_data(as_text=True)
+    version = re.search(r'name="version" type="hidden" value="(\d+)"', form)[1]
+    data = dict(
+        LINKS,
+        name="The Dueling Pianos",
+        city="New York",
+        state="NY",
+        address="335 Delancey Street",
+        phone="212-736-5000",
+        genres=["Jazz"],
+        version=version,
+    )
+    assert client.post(url, data=data).status_code == 302
+    # The same version again is a conflicting edit.
+    assert client.post(url, data=data).status_code == 409
+
+
+def test_booking(client, listed):
+    url = f"/shows/{listed['show_id']}/bookings"
+    booking = {"quantity": 2, "name": "Ann", "email": "ann@example.com"}
+    response = client.post(url, json=booking)
+    assert response.status_code == 201
+    assert response.get_json()["tickets_remaining"] == 98
+
+
+def test_booking_form_from_streamed_page(app, monkeypatch, listed):
+    monkeypatch.setitem(app.config, "WTF_CSRF_ENABLED", True)
+    client = app.test_client()
+
+    page = client.get("/shows").get_data(as_text=True)
+    form = re.search(
+        r'action="(/shows/{}/bookings[^"]*)">\s*'
+        r'<input type="hidden" name="csrf_token" value="([^"]+)"'.format(
+            listed["show_id"]
+        ),
+        page,
+    )
+    booking = {"quantity": 1, "name": "Ann", "email": "ann@example.com"}
+    response = client.post(form[1], data=dict(booking, csrf_token=form[2]))
+    assert response.status_code == 303
+    assert b"Booked 1 ticket!" in client.get("/shows").data
+
+
+def test_booking_start_time(app, client, listed):
+    from app import Show
+
+    with app.app_context():
+        start = Show.query.get(listed["show_id"]).start_time
+    url = f"/shows/{listed['show_id']}/bookings"
+    booking = {"quantity": 1, "name": "Ann", "email": "ann@example.com"}
+
+    response = client.post(f"{url}?start={start.isoformat()}", json=booking)
+    assert response.status_code == 201
+    # A start time that isn't the show's finds no show.
+    other = start + timedelta(days=1)
+    response = client.post(f"{url}?start={other.isoformat()}", json=booking)
+    assert response.status_code == 404
+
+
+def test_booking_started_show(client, listed):
+    url = f"/shows/{listed['past_show_id']}/bookings"
+    booking = {"quantity": 1, "name": "Ann", "email": "ann@example.com"}
+    response = client.post(url, json=booking)
+    assert response.status_code == 409
+    assert response.get_json()["error"] == "started"
+
+
+def test_booking_show_without_tickets(app, client, listed):
+    from app import Show, db
+
+    with app.app_context():
+        show = Show(
+            venue_id=listed["venue_id"],
+            artist_id=listed["artist_id"],
+            start_time=datetime.now() + timedelta(days=120),
+        )
+        db.session.add(show)
+        db.session.commit()
+        url = f"/shows/{show.id}/bookings"
+    booking = {"quantity": 1, "name": "Ann", "email": "ann@example.com"}
+    response = client.post(url, json=booking)
+    assert response.status_code == 409
+    assert response.get_json() == {
+        "error": "not_on_sale",
+        "message": "Tickets for this show are not sold here.",
+        "tickets_remaining": None,
+    }
+
+
+def test_calendar_etag_follows_moved_shows(app, client, listed):
+    from app import Show, db
+
+    url = f"/venues/{listed['venue_id']}/shows.ics"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    with app.app_context():
+        first, second = (
+            Show.query.filter(
+                Show.venue_id == listed["venue_id"], Show.start_time > datetime.now()
+            )
+            .order_by(Show.start_time)
+            .limit(2)
+        )
+        # Swapped: same count, ids and first/last start.
+        first.start_time, second.start_time = second.start_time, first.start_time
+        db.session.commit()
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_series_edit_and_cancel(app, client, listed):
+    from app import Show
+
+    url = f"/shows/series/{listed['series_id']}"
+    assert client.post(f"{url}/edit", data={"tickets": "50"}).status_code == 303
+    assert client.post(f"{url}/cancel").status_code == 303
+    with app.app_context():
+        # The booked show is kept.
+        left = Show.query.filter_by(series_id=listed["series_id"]).all()
+    assert [show.id for show in left] == [listed["show_id"]]
+    assert left[0].tickets_total == 50
+
+
+def test_series_artist_change_checks_conflicts(app, client, listed):
+    from app import Artist, Show, db
+
+    with app.app_context():
+        series_show = Show.query.get(listed["show_id"])
+        busy = Artist(name="Busy Band", city="New York", state="NY")
+        db.session.add(busy)
+        db.session.flush()
+        db.session.add(
+            Show(
+                venue_id=listed["venue_id"],
+                artist_id=busy.id,
+                start_time=series_show.start_time + timedelta(minutes=30),
+            )
+        )
+        db.session.commit()
+        busy_id = busy.id
+
+    def series_artist():
+        with app.app_context():
+            return Show.query.get(listed["show_id"]).artist_id
+
+    url = f"/shows/series/{listed['series_id']}/edit"
+    response = client.post(url, data={"artist_id": busy_id})
+    assert response.status_code == 200
+    assert b"Change anyway" in response.data
+    assert series_artist() == listed["artist_id"]
+
+    data = {"artist_id": busy_id, "allow_conflicts": "y"}
+    assert client.post(url, data=data).status_code == 303
+    assert series_artist() == busy_id
+
+    # Back to the listed artist, whose other shows are at other times.
+    assert client.post(url, data={"artist_id": listed["artist_id"]}).status_code == 303
+    assert series_artist() == listed["artist_id"]
+
+
+def test_series_artist_change_moves_history(app, client, listed):
+    from app import Artist, db, matchmaker
+
+    with app.app_context():
+        other = Artist(name="Matt Quevedo", city="New York", state="NY")
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    assert matchmaker.rebuilder.wait()
+
+    venue_id, artist_id = listed["venue_id"], listed["artist_id"]
+    before = matchmaker.history["Venue"][venue_id].get(artist_id, 0)
+    url = f"/shows/series/{listed['series_id']}/edit"
+    assert client.post(url, data={"artist_id": other_id}).status_code == 303
+
+    moved = matchmaker.history["Venue"][venue_id].get(other_id, 0)
+    assert moved > 0
+    assert matchmaker.history["Venue"][venue_id].get(artist_id, 0) == before - moved
+    assert matchmaker.history["Artist"][other_id] == {venue_id: moved}
@@ -0,0 +1,68 @@
+# ----------------------------------------------------------------------------#
+# Ticket inventory.
+#
+# A show's remaining tickets are taken with one conditional UPDATE
+# (`SET remaining = remaining - n WHERE remaining >= n`), so the database
+# decides atomically whether a booking fits: concurrent bookings never
+# oversell, and none of them reads the count first and writes it back. The
+# row lock lasts only until the booking's short transaction commits.
+#
+# Shows that have started can't be booked. Given the show's start time, the
+# statements also filter on the partition key, so on Postgres they touch a
+# single monthly partition instead of probing the id index of each.
+# ----------------------------------------------------------------------------#
+from sqlalchemy import and_, select
+
+SOLD_OUT = "sold_out"
+NOT_ON_SALE = "not_on_sale"
+NOT_FOUND = "not_found"
+STARTED = "started"
+
+
+def _show(shows, show_id, start_time):
+    if start_time is None:
+        return shows.c.id == show_id
+    return and_(shows.c.id == show_id, shows.c.start_time == start_time)
+
+
+def reserve(session, shows, show_id, quantity, now, start_time=None):
+    """Take `quantity` tickets of a show in the current transaction.
+
+    `shows` is the Show table; `start_time`, if known, is the show's start
+    time. Returns the tickets left afterwards, or None if there weren't
+    enough or the show started before `now` (see `unavailable` for why).
+    """
+    remaining = shows.c.tickets_remaining
+    show = _show(shows, show_id, start_time)
+    update = (
+        shows.update()
+        .where(show)
+        .where(shows.c.start_time > now)
+        .where(remaining >= quantity)
+        .values(tickets_remaining=remaining - quantity)
+    )
+
+    if session.get_bind().dialect.name == "postgresql":
+        row = session.execute(update.returning(remaining)).first()
+        return None if row is None else row[0]
+
+    # Without RETURNING, read the count back in the same transaction.
+    if session.execute(update).rowcount != 1:
+        return None
+    return session.execute(select([remaining]).where(show)).scalar()
+
+
+def unavailable(session, shows, show_id, now, start_time=None):
+    """Why a reservation failed: (reason, tickets remaining)."""
+    row = session.execute(
+        select([shows.c.tickets_remaining, shows.c.start_time]).where(
+            _show(shows, show_id, start_time)
+        )
+    ).first()
+    if row is None:
+        return NOT_FOUND, None
+    if row.start_time <= now:
+        return STARTED, None
+    if row.tickets_remaining is None:
+        return NOT_ON_SALE, None
+    return SOLD_OUT, row.tickets_remaining
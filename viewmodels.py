@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------#
+# View models.
+#
+# Pages are rendered from small immutable tuples filled straight from
+# column-only queries, rather than from ORM instances or per-row dicts. They
+# cost one tuple per row, keep no reference to the session, and work the
+# same in templates (attribute access) and JSON (`_asdict()`).
+# ----------------------------------------------------------------------------#
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class Listing(NamedTuple):
+    """A venue or artist in a listing or search result."""
+
+    id: int
+    name: str
+    num_upcoming_shows: int
+
+
+class ShowSummary(NamedTuple):
+    venue_id: int
+    venue_name: str
+    artist_id: int
+    artist_name: str
+    artist_image_link: Optional[str]
+    start_time: datetime
+    id: int
+    tickets_remaining: Optional[int]
+    series_id: Optional[str]
+
+
+class ArtistShow(NamedTuple):
+    """A show on a venue's page."""
+
+    artist_id: int
+    artist_name: str
+    artist_image_link: Optional[str]
+    start_time: datetime
+
+
+class VenueShow(NamedTuple):
+    """A show on an artist's page."""
+
+    venue_id: int
+    venue_name: str
+    venue_image_link: Optional[str]
+    start_time: datetime
+
+
+class FeedShow(NamedTuple):
+    """An upcoming show in an iCalendar feed."""
+
+    id: int
+    start_time: datetime
+    venue_id: int
+    venue_name: str
+    address: Optional[str]
+    city: str
+    state: str
+    venue_version: int
+    artist_id: int
+    artist_name: str
+    artist_version: int
+
+
+class _Profile(object):
+    # Mixin for the profile tuples below; their fields end in the two show
+    # lists. (typing.NamedTuple can't take mixins, hence the *Fields bases.)
+    __slots__ = ()
+
+    @property
+    def past_shows_count(self):
+        return len(self.past_shows)
+
+    @property
+    def upcoming_shows_count(self):
+        return len(self.upcoming_shows)
+
+    @classmethod
+    def build(cls, values, past_shows, upcoming_shows):
+        """Build from a column-value mapping and the two show tuples."""
+        return cls(
+            *(values.get(field) for field in cls._fields[:-2]),
+            past_shows=past_shows,
+            upcoming_shows=upcoming_shows,
+        )
+
+
+class _VenueFields(NamedTuple):
+    id: int
+    name: str
+    city: str
+    state: str
+    address: Optional[str]
+    phone: Optional[str]
+    website: Optional[str]
+    facebook_link: Optional[str]
+    image_link: Optional[str]
+    seeking_talent: Optional[bool]
+    seeking_description: Optional[str]
+    genres: List[str]
+    past_shows: Tuple[ArtistShow, ...]
+    upcoming_shows: Tuple[ArtistShow, ...]
+
+
+class VenueProfile(_Profile, _VenueFields):
+    __slots__ = ()
+
+
+class _ArtistFields(NamedTuple):
+    id: int
+    name: str
+    city: str
+    state: str
+    phone: Optional[str]
+    website: Optional[str]
+    facebook_link: Optional[str]
+    image_link: Optional[str]
+    seeking_venue: Optional[bool]
+    seeking_description: Optional[str]
+    genres: List[str]
+    past_shows: Tuple[VenueShow, ...]
+    upcoming_shows: Tuple[VenueShow, ...]
+
+
+class ArtistProfile(_Profile, _ArtistFields):
+    __slots__ = ()
+
+
+def split_shows(shows, now=None):
+    """Split show rows into (past, upcoming) tuples by start_time."""
+    now = now or datetime.now()
+    past, upcoming = [], []
+    for show in shows:
+        (past if show.start_time < now else upcoming).append(show)
+    return tuple(past), tuple(upcoming)
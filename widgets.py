@@ -0,0 +1,263 @@
+# ----------------------------------------------------------------------------#
+# Home page widgets.
+#
+# "Recently listed" venues and artists are capped deques, newest first;
+# "trending" venues are those with the most upcoming shows. Everything is
+# loaded from indexed queries, then kept current from the ChangeFeed, so
+# rendering the home page runs no SQL.
+#
+# Memory stays bounded however many venues and shows there are. Only the
+# top HOME_WIDGET_CANDIDATES venues by upcoming shows are counted (with their
+# names), and their shows are retired as they pass from a heap of the next
+# HOME_WIDGET_EXPIRY_LIMIT start times. Any other venue had at most as many
+# upcoming shows as the last candidate (the floor), so new shows elsewhere
+# only matter once the floor plus their number could reach the top list.
+#
+# Loads run in the background (see background.py): at startup, every
+# HOME_WIDGET_REFRESH_SECONDS to pick up writes made by other processes, and
+# soon after changes the feed can't apply incrementally (deleted or moved
+# shows), when the candidates may be wrong, or once the heap runs out.
+# ----------------------------------------------------------------------------#
+import heapq
+import threading
+from collections import Counter, deque
+from datetime import datetime
+
+from background import Rebuilder
+from viewmodels import Listing
+
+
+class HomeWidgets(object):
+    def __init__(
+        self,
+        db,
+        Venue,
+        Artist,
+        Show,
+        size=5,
+        refresh_interval=300,
+        candidates=50,
+        expiry_limit=1000,
+    ):
+        self.db = db
+        self.Venue = Venue
+        self.Artist = Artist
+        self.Show = Show
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.candidates = candidates
+        self.expiry_limit = expiry_limit
+
+        self._lock = threading.Lock()
+        # Changes committed while a load runs, replayed onto its result.
+        self._pending = None
+        self._built = False
+
+    def init_app(self, app, changes):
+        app.config.setdefault("HOME_WIDGET_SIZE", self.size)
+        app.config.setdefault("HOME_WIDGET_REFRESH_SECONDS", self.refresh_interval)
+        app.config.setdefault("HOME_WIDGET_CANDIDATES", self.candidates)
+        app.config.setdefault("HOME_WIDGET_EXPIRY_LIMIT", self.expiry_limit)
+        self.size = app.config["HOME_WIDGET_SIZE"]
+        self.refresh_interval = app.config["HOME_WIDGET_REFRESH_SECONDS"]
+        self.candidates = max(app.config["HOME_WIDGET_CANDIDATES"], self.size)
+        self.expiry_limit = app.config["HOME_WIDGET_EXPIRY_LIMIT"]
+        self.rebuilder = Rebuilder(
+            app, self.rebuild, self.refresh_interval, "home-widgets"
+        )
+        changes.on_commit(self._on_commit)
+
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _recent(self, model):
+        rows = (
+            model.query.with_entities(model.id, model.name)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(self.size)
+            .all()
+        )
+        return deque(((row.id, row.name) for row in rows), maxlen=self.size)
+
+    def _load(self):
+        Venue, Show = self.Venue, self.Show
+        now = datetime.now()
+        recent = {"Venue": self._recent(Venue), "Artist": self._recent(self.Artist)}
+
+        count = self.db.func.count(Show.id)
+        rows = (
+            Show.query.join(Venue, Venue.id == Show.venue_id)
+            .with_entities(Show.venue_id, Venue.name, count)
+            .filter(Show.start_time > now)
+            .group_by(Show.venue_id, Venue.name)
+            .order_by(count.desc(), Show.venue_id)
+            .limit(self.candidates + 1)
+            .all()
+        )
+        # The first venue left out bounds the count of all the others.
+        floor = rows.pop()[2] if len(rows) > self.candidates else 0
+        upcoming = {venue_id: n for venue_id, _, n in rows}
+        venue_names = {venue_id: name for venue_id, name, _ in rows}
+
+        expiry = []
+        if upcoming:
+            expiry = (
+                Show.query.with_entities(Show.start_time, Show.venue_id)
+                .filter(Show.start_time > now, Show.venue_id.in_(upcoming))
+                .order_by(Show.start_time)
+                .limit(self.expiry_limit)
+                .all()
+            )
+        # Past the last loaded start time, the counts need another load.
+        horizon = expiry[-1][0] if len(expiry) == self.expiry_limit else None
+        expiry = [tuple(row) for row in expiry]
+        heapq.heapify(expiry)
+
+        return recent, upcoming, venue_names, floor, Counter(), expiry, horizon
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            state = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            (
+                self.recent,
+                self.upcoming,
+                self.venue_names,
+                self.floor,
+                self.outside,
+                self.expiry,
+                self.horizon,
+            ) = state
+            self._trending = None
+            self._built = True
+            for change in pending:
+                if not self._apply(change):
+                    self.rebuilder.request()
+
+    def _expire(self):
+        now = datetime.now()
+        while self.expiry and self.expiry[0][0] <= now:
+            _, venue_id = heapq.heappop(self.expiry)
+            self._count(venue_id, -1)
+        if self.horizon is not None and self.horizon <= now:
+            self.rebuilder.request()
+
+    def _count(self, venue_id, delta):
+        count = self.upcoming.get(venue_id, 0) + delta
+        if count > 0:
+            self.upcoming[venue_id] = count
+        else:
+            self.upcoming.pop(venue_id, None)
+        self._trending = None
+
+    # Updates
+    # ------------------------------------------------------------------
+
+    def _on_commit(self, changes):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            if not self._built:
+                return
+            for change in changes:
+                if not self._apply(change):
+                    self.rebuilder.request()
+
+    def _apply(self, change):
+        """Apply one change; return False if it needs a rebuild."""
+        if change.model in self.recent:
+            recent = self.recent[change.model]
+
+            if change.op == "delete":
+                # The gaps this leaves in the lists take a query to fill.
+                complete = True
+                for entry in list(recent):
+                    if entry[0] == change.id:
+                        recent.remove(entry)
+                        complete = False
+                if change.model == "Venue":
+                    self.outside.pop(change.id, None)
+                    if change.id in self.upcoming:
+                        del self.upcoming[change.id]
+                        self._trending = None
+                        complete = False
+                return complete
+
+            if "name" not in change.values:
+                return False
+            name = change.values["name"]
+
+            if change.op == "insert":
+                recent.appendleft((change.id, name))
+            else:
+                for i, (id, _) in enumerate(recent):
+                    if id == change.id:
+                        recent[i] = (id, name)
+
+            if change.model == "Venue" and change.id in self.venue_names:
+                self.venue_names[change.id] = name
+                self._trending = None
+            return True
+
+        if change.model == "Show":
+            if change.op != "insert":
+                return False
+            start_time = change.values.get("start_time")
+            try:
+                venue_id = int(change.values["venue_id"])
+            except (KeyError, TypeError, ValueError):
+                return False
+            if not isinstance(start_time, datetime):
+                return False
+            if start_time <= datetime.now():
+                return True
+
+            if venue_id not in self.upcoming:
+                # Its name isn't loaded, and if other venues have more shows
+                # than it, its count isn't known either.
+                self.outside[venue_id] += 1
+                self._trending = None
+                return True
+            if self.horizon is None or start_time < self.horizon:
+                heapq.heappush(self.expiry, (start_time, venue_id))
+            self._count(venue_id, 1)
+            return True
+
+        return True
+
+    # Reading
+    # ------------------------------------------------------------------
+
+    def recently_listed(self, kind):
+        """Newest venues or artists as [(id, name)], newest first."""
+        if not self.rebuilder.wait():
+            return []
+        with self._lock:
+            return list(self.recent[kind])
+
+    def trending_venues(self):
+        """Venues with the most upcoming shows, as Listings."""
+        if not self.rebuilder.wait():
+            return []
+        with self._lock:
+            self._expire()
+            if self._trending is None:
+                top = heapq.nlargest(
+                    self.size, self.upcoming.items(), key=lambda item: item[1]
+                )
+                last = top[-1][1] if len(top) == self.size else 0
+                if self.outside and self.floor + max(self.outside.values()) >= last:
+                    # A venue outside the candidates may belong in the list.
+                    self.rebuilder.request()
+                self._trending = [
+                    Listing(id, self.venue_names.get(id), count) for id, count in top
+                ]
+            return self._trending